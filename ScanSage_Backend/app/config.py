@@ -4,6 +4,192 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GENAI_API_KEY = os.getenv("GENAI_API_KEY")
-BRAIN_MODEL_PATH = "models/brain_model.h5"
-LUNG_MODEL_PATH = "models/lung_tumor.h5"
-BREAST_MODEL_PATH = "models/breast_tumor.h5"
+# Organ classifiers (Keras .h5)
+BRAIN_MODEL_PATH = os.getenv("BRAIN_MODEL_PATH", "models/brain_model.h5")
+LUNG_MODEL_PATH = os.getenv("LUNG_MODEL_PATH", "models/lung_tumor.h5")
+BREAST_MODEL_PATH = os.getenv("BREAST_MODEL_PATH", "models/breast_tumor.h5")
+# JSON manifest of classifier versions per organ (file, input size, labels,
+# preprocessing, precision) and how requests are routed to them: primary,
+# canary share, shadow or ensemble. Empty serves one version per organ from
+# the paths above
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST", "")
+# Share of classifier requests mirrored to shadow versions, and most mirrored
+# requests pending per process before further ones are skipped (0 disables shadows)
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "8"))
+
+# Model registry
+# Comma separated organs to load at startup, e.g. "Brain,Lung,Breast"
+MODEL_WARMUP = [organ.strip() for organ in os.getenv("MODEL_WARMUP", "").split(",") if organ.strip()]
+# Load TensorFlow, the MODEL_WARMUP organs and the LLM SDK in a background task
+# after the server starts listening; /health/ready reports 503 until it is done.
+# "false" finishes the warm-up before the server accepts requests
+BACKGROUND_WARMUP = os.getenv("BACKGROUND_WARMUP", "true").lower() == "true"
+# Evict least recently used models when resident weights exceed this size (0 disables the cap)
+MODEL_MEMORY_LIMIT_MB = int(os.getenv("MODEL_MEMORY_LIMIT_MB", "0"))
+# Evict models unused for this many seconds (0 keeps them resident)
+MODEL_IDLE_TIMEOUT = int(os.getenv("MODEL_IDLE_TIMEOUT", "0"))
+
+# Micro-batching of classifier requests
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "true").lower() == "true"
+# Largest number of images grouped into one forward pass
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+# How long the first request in a batch waits for others to join
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+# Inference engine: "graph" (traced tf.function), "keras" (model.predict) or
+# "saved_model" (exports under SAVED_MODEL_DIR, falling back to the .h5 files)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "graph")
+SAVED_MODEL_DIR = os.getenv("SAVED_MODEL_DIR", "models/saved")
+
+# Reduced-precision classifiers per organ, e.g. "Brain=int8,Lung=float16"
+# (float16, dynamic_int8 or int8; unlisted organs use float32). Variants are
+# TFLite files built by tools.quantize_models under QUANTIZED_MODEL_DIR, and
+# each is served only if its evaluation report passes the gate below
+MODEL_PRECISION = dict(
+    (part.strip() for part in entry.split("=", 1))
+    for entry in os.getenv("MODEL_PRECISION", "").split(",") if "=" in entry
+)
+QUANTIZED_MODEL_DIR = os.getenv("QUANTIZED_MODEL_DIR", "models/quantized")
+# Gate: lowest top-1 agreement with the float model, and fewest evaluation images
+QUANTIZATION_MIN_AGREEMENT = float(os.getenv("QUANTIZATION_MIN_AGREEMENT", "0.99"))
+QUANTIZATION_MIN_IMAGES = int(os.getenv("QUANTIZATION_MIN_IMAGES", "100"))
+# Threads per TFLite interpreter (0 keeps TFLite's default)
+TFLITE_THREADS = int(os.getenv("TFLITE_THREADS", "0"))
+
+# Resampler used to resize classifier inputs: "area", "linear", "cubic" or "nearest"
+PREPROCESS_INTERPOLATION = os.getenv("PREPROCESS_INTERPOLATION", "area")
+
+# ROI extraction: images whose longer side is at least ROI_PYRAMID_MIN_SIDE are
+# searched on a downscaled level (longer side <= ROI_PYRAMID_SIZE) and refined
+# only around candidates; ROI_TILE_SIZE rows are thresholded at a time
+ROI_PYRAMID_MIN_SIDE = int(os.getenv("ROI_PYRAMID_MIN_SIDE", "1024"))
+ROI_PYRAMID_SIZE = int(os.getenv("ROI_PYRAMID_SIZE", "512"))
+ROI_TILE_SIZE = int(os.getenv("ROI_TILE_SIZE", "1024"))
+
+# Heatmap / ROI images in responses: "png", "webp" or "jpeg"
+OUTPUT_IMAGE_FORMAT = os.getenv("OUTPUT_IMAGE_FORMAT", "png")
+# JPEG / WebP quality (1-100; WebP at 100 is lossless)
+OUTPUT_IMAGE_QUALITY = int(os.getenv("OUTPUT_IMAGE_QUALITY", "90"))
+# Longest side of returned images in pixels (0 keeps the full resolution)
+OUTPUT_MAX_DIMENSION = int(os.getenv("OUTPUT_MAX_DIMENSION", "0"))
+# zlib level 0-9 for PNG output; empty sends the PNG produced by the ROI stage unchanged
+OUTPUT_PNG_COMPRESSION = int(os.getenv("OUTPUT_PNG_COMPRESSION")) if os.getenv("OUTPUT_PNG_COMPRESSION") else None
+# How images are sent: "base64" in the JSON, "multipart" binary parts, or "url" references to /api/artifacts
+OUTPUT_TRANSPORT = os.getenv("OUTPUT_TRANSPORT", "base64")
+
+# LLM client: "gemini" or "fake" (deterministic offline backend for tests and benchmarks)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-pro")
+# Most Gemini calls in flight at once per worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Simulated latency of the fake backend
+LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "0"))
+# Scan analysis format: "text" (markdown fields, parsed) or "json" (structured
+# output matching a schema, validated directly)
+LLM_OUTPUT_FORMAT = os.getenv("LLM_OUTPUT_FORMAT", "text")
+# Image sent to the LLM: downscaled to LLM_IMAGE_MAX_DIMENSION (0 keeps the
+# resolution) and re-encoded as "jpeg", "webp" or "png"; "original" sends the upload as is
+LLM_IMAGE_FORMAT = os.getenv("LLM_IMAGE_FORMAT", "jpeg")
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", "85"))
+LLM_IMAGE_MAX_DIMENSION = int(os.getenv("LLM_IMAGE_MAX_DIMENSION", "1024"))
+# Seconds to keep the static prompt in a Gemini context cache; 0 disables.
+# Falls back to a plain system instruction when the model or prompt size does not qualify
+LLM_CONTEXT_CACHE_TTL = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "0"))
+
+# Result cache
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "100"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+# SQLite file shared by all workers; empty keeps the cache in memory only
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", ".cache/scansage_cache.sqlite3")
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("CACHE_DISK_MAX_ENTRIES", "10000"))
+# Seconds between background sweeps of expired entries (0 disables the sweeper)
+CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL", "60"))
+
+# Upload ingestion limits, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Whole request body, enforced while it streams in (0 disables the check)
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(200 * 1024 * 1024)))
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "16"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Uploads larger than this are spooled to a temporary file and memory-mapped
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# Directory for spooled uploads; empty uses the system temporary directory
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "")
+
+# Multi-slice studies (/api/study/scan): most files per study, and slices
+# handled per ROI / classifier batch
+STUDY_MAX_FILES = int(os.getenv("STUDY_MAX_FILES", "1000"))
+STUDY_SLICE_BATCH = int(os.getenv("STUDY_SLICE_BATCH", "16"))
+# Largest a gzipped NIfTI volume may expand to; the request limit only
+# bounds its compressed size
+STUDY_MAX_DECOMPRESSED_BYTES = int(os.getenv("STUDY_MAX_DECOMPRESSED_BYTES", str(1024 * 1024 * 1024)))
+
+# Images analyzed at once per /api/batch/scan request
+BATCH_SCAN_CONCURRENCY = int(os.getenv("BATCH_SCAN_CONCURRENCY", "4"))
+
+# Job queue (/api/jobs): "memory" keeps jobs in the process; "sqlite" stores
+# them and their uploads in JOB_DB_PATH so queued work survives a restart and
+# is shared by every worker on the host
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", ".jobs/scansage_jobs.sqlite3")
+# Jobs run at once per process, and most jobs waiting before submissions get 503
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# Seconds finished jobs and their results are kept
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "86400"))
+# A running job whose worker stops renewing its lease for this long is
+# picked up again, at most JOB_MAX_ATTEMPTS times
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Timeout of the webhook call made when a job finishes
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+# Comma-separated webhook hosts; when set, webhooks go only to these hosts.
+# Otherwise any host resolving solely to public addresses is accepted
+JOB_WEBHOOK_ALLOWED_HOSTS = [
+    host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+
+# Classifier speculation in /api/chat: "all" classifies every organ while the
+# LLM call is in flight and keeps the one the LLM names; "detector" classifies
+# only the organ picked by the local pre-classifier (all three when it is unsure);
+# "off" waits for the LLM
+SPECULATIVE_CLASSIFIER = os.getenv("SPECULATIVE_CLASSIFIER", "detector")
+
+# Local pre-classifier run before the LLM, ROI and classifier stages
+ORGAN_DETECTOR_ENABLED = os.getenv("ORGAN_DETECTOR_ENABLED", "true").lower() == "true"
+# Reject images scored as non-medical (422) without calling Gemini. Off, the
+# decisions are only logged and pick the speculative classifier, until the
+# thresholds have been tuned from those logs
+ORGAN_DETECTOR_REJECT = os.getenv("ORGAN_DETECTOR_REJECT", "false").lower() == "true"
+# Images scoring below this are non-medical
+ORGAN_DETECTOR_MEDICAL_THRESHOLD = float(os.getenv("ORGAN_DETECTOR_MEDICAL_THRESHOLD", "0.5"))
+# Lowest organ score for the pre-classifier to commit to an organ
+ORGAN_DETECTOR_ORGAN_THRESHOLD = float(os.getenv("ORGAN_DETECTOR_ORGAN_THRESHOLD", "0.55"))
+
+# Execution backend for OpenCV and TensorFlow work: "thread" or "process"
+EXECUTION_BACKEND = os.getenv("EXECUTION_BACKEND", "thread")
+# Thread or process pool size; defaults to one per core
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "0")) or os.cpu_count() or 4
+# TensorFlow intra/inter-op thread pools per process (0 keeps TensorFlow's default)
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", "0"))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "0"))
+
+# Admission control. Concurrent work per stage (0 removes the limit); callers
+# beyond it wait in a bounded per-lane queue, interactive before batch
+ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+# The CNN default leaves room for a full micro-batch of classifier requests
+ADMISSION_CNN_CONCURRENCY = int(os.getenv("ADMISSION_CNN_CONCURRENCY", str(max(EXECUTOR_WORKERS, BATCH_MAX_SIZE))))
+ADMISSION_OPENCV_CONCURRENCY = int(os.getenv("ADMISSION_OPENCV_CONCURRENCY", str(EXECUTOR_WORKERS)))
+# Waiters allowed per stage in each lane before new work gets 503
+ADMISSION_INTERACTIVE_QUEUE = int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "64"))
+ADMISSION_BATCH_QUEUE = int(os.getenv("ADMISSION_BATCH_QUEUE", "32"))
+# Longest wait for a stage before the request gets 503
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "30"))
+# Requests in progress per lane before new ones get 429 (0 removes the limit)
+ADMISSION_INTERACTIVE_REQUESTS = int(os.getenv("ADMISSION_INTERACTIVE_REQUESTS", "64"))
+ADMISSION_BATCH_REQUESTS = int(os.getenv("ADMISSION_BATCH_REQUESTS", "8"))
+
+# Add a Server-Timing header with per-stage durations to every response;
+# otherwise only requests sending "X-Server-Timing: 1" get one
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
@@ -1,14 +1,87 @@
+# First, so the import time reported by /health/ready covers the whole app
+from app.utils.startup import startup
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
-from app.routers import analysis, prediction, chat, image_processing
+from fastapi.concurrency import run_in_threadpool
+from app.config import MODEL_WARMUP, MAX_REQUEST_BYTES, BACKGROUND_WARMUP
+from app.routers import analysis, prediction, chat, image_processing, models, cache, batch, artifacts, uploads, study, jobs, admission, metrics, health
+from app.services.admission import AdmissionMiddleware
+from app.services.execution import execution_backend
+from app.services.job_queue import job_runner
+from app.services.llm_client import llm_client
+from app.utils.ingestion import RequestSizeLimitMiddleware
+from app.utils.metrics import ServerTimingMiddleware
 
-app = FastAPI(title="Medical Scan Analysis API")
+logger = logging.getLogger(__name__)
+
+
+async def warm_up():
+    """
+    Import TensorFlow, size its thread pools, load the configured classifiers
+    and set up the LLM SDK; other organs load on first use. Marks the worker
+    ready when done.
+    """
+    startup.warming_up()
+    try:
+        await run_in_threadpool(execution_backend.warm_up, MODEL_WARMUP)
+        with startup.step("llm_client"):
+            await run_in_threadpool(llm_client.warm_up)
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        startup.failed(e)
+        return
+    startup.ready()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = None
+    if BACKGROUND_WARMUP:
+        # Serve right away; requests needing a model before it is loaded load it themselves
+        job_runner.start()
+        warm_up_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+        job_runner.start()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await warm_up_task
+    # Running jobs go back to the queue (lost with the memory backend)
+    await job_runner.stop()
+    execution_backend.shutdown()
+
+
+app = FastAPI(title="Medical Scan Analysis API", lifespan=lifespan)
+# Stop oversized bodies while they stream in, before multipart parsing spools them
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_REQUEST_BYTES)
+# Refuse requests over the per-lane limit before their body is read
+app.add_middleware(AdmissionMiddleware)
+# Outermost: time every request, including refused ones
+app.add_middleware(ServerTimingMiddleware)
 
 # Include API endpoints
 app.include_router(analysis.router, prefix="/api")
 app.include_router(prediction.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
+app.include_router(batch.router, prefix="/api")
+app.include_router(study.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(models.router, prefix="/api")
+app.include_router(cache.router, prefix="/api")
+app.include_router(artifacts.router, prefix="/api")
+app.include_router(uploads.router, prefix="/api")
+app.include_router(admission.router, prefix="/api")
 app.include_router(image_processing.router, prefix="")
+app.include_router(metrics.router, prefix="")
+app.include_router(health.router, prefix="")
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Medical Scan Analysis API"}
\ No newline at end of file
+    return {"message": "Welcome to Medical Scan Analysis API"}
+
+
+startup.imported()
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from app.services.admission import admission
+
+router = APIRouter()
+
+
+@router.get("/admission")
+async def admission_stats():
+    """
+    Report requests in progress and refused per lane, and for each stage its
+    limit, queue depth per lane, rejections and wait times.
+    """
+    return admission.stats()
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from app.config import CACHE_TTL_SECONDS
+from app.utils.cache import artifact_cache
+
+router = APIRouter()
+
+
+@router.get("/artifacts/{digest}")
+async def get_artifact(digest: str):
+    """
+    Serve a heatmap or ROI image returned by reference (transport=url).
+    Artifacts are content addressed and expire with the result cache. They
+    are derived from patient scans, so only the requesting client may keep
+    a copy; shared proxies and CDNs must not store them.
+    """
+    artifact = artifact_cache.fetch(digest)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Artifact not found or expired")
+
+    media_type, data = artifact
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={"Cache-Control": f"private, max-age={CACHE_TTL_SECONDS}"},
+    )
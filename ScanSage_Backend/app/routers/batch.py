@@ -0,0 +1,103 @@
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.config import BATCH_SCAN_CONCURRENCY
+from app.services.admission import Overloaded
+from app.services.output_service import ImageRenderer, output_options
+from app.services.scan_pipeline import analyze_scan
+from app.utils.ingestion import ingest_uploads
+from app.utils.scan_context import ScanContext
+import asyncio
+import json
+import time
+
+router = APIRouter()
+
+_DONE = object()
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _format_event(payload: dict, stream_format: str, event: str) -> str:
+    data = json.dumps(payload)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def stream_scan_results(contexts: List[ScanContext], message: Optional[str],
+                              stream_format: str, concurrency: int, renderer: ImageRenderer):
+    """
+    Yield each image's result the moment it is ready.
+    At most `concurrency` images are processed at once, and finished results
+    wait in a queue of the same size; when the client reads slowly the queue
+    fills and the workers stop picking up new images (backpressure).
+    """
+    start = time.perf_counter()
+    pending = iter(enumerate(contexts))
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+
+    async def worker():
+        for index, context in pending:
+            try:
+                result = await analyze_scan(context, message, renderer)
+            except Overloaded as e:
+                # The stream has started, so a shed image is reported in its own result
+                result = {"filename": context.filename, "error": e.detail, "retry_after": e.retry_after}
+            result["index"] = index
+            result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+            await results.put(result)
+        await results.put(_DONE)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(contexts)))]
+    try:
+        remaining = len(workers)
+        while remaining:
+            result = await results.get()
+            if result is _DONE:
+                remaining -= 1
+                continue
+            yield _format_event(result, stream_format, "result")
+
+        yield _format_event({
+            "done": True,
+            "total": len(contexts),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+            "image_bytes": renderer.image_bytes,
+            "image_encode_ms": round(renderer.encode_ms, 3),
+        }, stream_format, "done")
+    finally:
+        # Client went away or the stream finished: stop any work still running
+        for task in workers:
+            task.cancel()
+
+
+@router.post("/batch/scan")
+async def batch_scan(
+        images: List[UploadFile] = File(...),
+        message: Optional[str] = Form(None),
+        stream_format: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$"),
+        output=Depends(output_options),
+):
+    """
+    Analyze a batch of scans and stream one result per image as NDJSON lines
+    or Server-Sent Events, in completion order. Each result carries the
+    image's index in the upload and the same fields as /api/chat.
+    Images are base64 or, with transport=url, references to /api/artifacts;
+    multipart is sent as url because parts cannot follow a stream of events.
+    """
+    options, transport = output
+    renderer = ImageRenderer(options, "url" if transport == "multipart" else transport)
+
+    # Uploads are read before streaming starts because FastAPI closes them
+    # once the endpoint returns; the per-image work happens while streaming.
+    contexts = await ingest_uploads(images)
+
+    return StreamingResponse(
+        stream_scan_results(contexts, message, stream_format, BATCH_SCAN_CONCURRENCY, renderer),
+        media_type=MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
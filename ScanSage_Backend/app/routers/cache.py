@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from app.utils.cache import roi_cache, prediction_cache, llm_cache, artifact_cache, study_cache
+
+router = APIRouter()
+
+
+@router.get("/cache")
+async def cache_stats():
+    """
+    Report entries, hits and misses for each pipeline stage cache, the study
+    cache and the store of images returned by reference.
+    """
+    return {cache.namespace: cache.stats() for cache in (roi_cache, prediction_cache, llm_cache, artifact_cache, study_cache)}
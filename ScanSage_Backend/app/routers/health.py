@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.config import MODEL_WARMUP
+from app.services.model_registry import model_registry
+from app.utils.startup import process_age, startup
+
+router = APIRouter()
+
+
+@router.get("/health/live")
+async def live():
+    """
+    Liveness: the worker is up and its event loop answers. Does not wait
+    for the warm-up, so a slow model load never gets the worker restarted.
+    """
+    return {"status": "alive", "process_age_seconds": process_age()}
+
+
+@router.get("/health/ready")
+async def ready():
+    """
+    Readiness: 200 once the warm-up has loaded TensorFlow, the MODEL_WARMUP
+    classifiers and the LLM SDK; 503 while it runs or after it failed.
+    Reports the import time, each warm-up step, which heavy modules and
+    classifiers are loaded.
+    """
+    models = model_registry.stats()["models"]
+    return JSONResponse(
+        content={
+            "ready": startup.is_ready,
+            **startup.stats(),
+            "warmup_models": MODEL_WARMUP,
+            "models_loaded": {key: stats["loaded"] for key, stats in models.items()},
+        },
+        status_code=200 if startup.is_ready else 503,
+    )
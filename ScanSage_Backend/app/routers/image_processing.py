@@ -1,32 +1,45 @@
-from fastapi import APIRouter, File, UploadFile
+from fastapi import APIRouter, Depends, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from app.utils.RegionOfIntrest import process_mri_image
+from app.services.admission import Overloaded, admission
+from app.services.output_service import ImageRenderer, output_options
+from app.services.scan_pipeline import run_roi
+from app.utils.ingestion import ingest_upload
 
 router = APIRouter()
 
 @router.post("/process-image")
-async def process_image(file: UploadFile = File(...)):
+async def process_image(file: UploadFile = File(...), output=Depends(output_options)):
     """
-    Process uploaded MRI image and return ROI and heatmap as base64 encoded strings.
+    Process uploaded MRI image and return ROI and heatmap, plus the bounding
+    box and area of every detected region, largest first.
+    Images are base64 encoded PNG unless the image_format, quality,
+    max_dimension, png_compression or transport parameters say otherwise.
     No files are stored on the server.
     """
-    # Read file contents into memory
-    contents = await file.read()
+    # Stream the upload in, hashing it and checking it is an image on the way
+    context = await ingest_upload(file)
+    renderer = ImageRenderer(*output)
 
     try:
-        # Process the image directly from memory
-        roi_base64, heatmap_base64 = process_mri_image(contents)
+        # Process the image directly from memory, or reuse a cached result
+        roi_result, _ = await run_roi(context)
+        async with admission.slot("opencv"):
+            images, encoding = await run_in_threadpool(
+                renderer.render_all, {"heatmap": roi_result.heatmap, "roi": roi_result.roi}
+            )
 
-        response = {"heatmap": heatmap_base64, "regionofintrest": roi_base64}
+        response = {**images, "regions": roi_result.regions, "encoding": encoding}
 
-        if roi_base64 is None:
+        if images["roi"] is None:
             response["message"] = "No tumor detected"
-            return JSONResponse(content=response, status_code=404)
+            return renderer.response(response, status_code=404)
 
-        response["roi"] = roi_base64
-        return JSONResponse(content=response)
+        return renderer.response(response)
+    except Overloaded:
+        raise
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
             status_code=500
-        )
\ No newline at end of file
+        )
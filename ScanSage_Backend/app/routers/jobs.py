@@ -0,0 +1,122 @@
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.job_queue import QueueFull, job_runner, resolve_webhook
+from app.services.output_service import output_options
+from app.utils.ingestion import ingest_upload, ingest_uploads
+
+router = APIRouter()
+
+
+async def _webhook(webhook_url: Optional[str]) -> Optional[str]:
+    if webhook_url:
+        try:
+            await run_in_threadpool(resolve_webhook, webhook_url)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    return webhook_url or None
+
+
+async def _accepted(kind: str, contexts, params: dict) -> JSONResponse:
+    try:
+        job = await job_runner.submit(kind, contexts, params)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, try again later")
+    summary = job.summary()
+    return JSONResponse(content=summary, status_code=202, headers={"Location": summary["status_url"]})
+
+
+@router.post("/jobs/chat")
+async def submit_chat(
+        message: str = Form(...),
+        images: Optional[List[UploadFile]] = File(None),
+        webhook_url: Optional[str] = Form(None),
+        output=Depends(output_options)
+):
+    options, transport = output
+    params = {
+        "message": message,
+        "options": list(options),
+        # Results are stored as JSON, so binary parts are stored and referenced by URL instead
+        "transport": "url" if transport == "multipart" else transport,
+        "webhook_url": await _webhook(webhook_url),
+    }
+    contexts = await ingest_uploads(images)
+    return await _accepted("chat", contexts, params)
+
+
+@router.post("/jobs/analyze")
+async def submit_analyze(file: UploadFile = File(...), webhook_url: Optional[str] = Form(None)):
+    params = {"webhook_url": await _webhook(webhook_url)}
+    context = await ingest_upload(file)
+    return await _accepted("analyze", [context], params)
+
+
+@router.post("/jobs/predict/{organ_type}")
+async def submit_predict(organ_type: str, file: UploadFile = File(...), webhook_url: Optional[str] = Form(None)):
+    params = {"organ_type": organ_type, "webhook_url": await _webhook(webhook_url)}
+    context = await ingest_upload(file)
+    return await _accepted("predict", [context], params)
+
+
+@router.get("/jobs")
+async def job_stats():
+    return await job_runner.stats()
+
+
+async def _job(job_id: str):
+    job = await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await _job(job_id)
+    summary = job.summary()
+    if job.status == "queued":
+        summary["queue_position"] = await job_runner.position(job_id)
+    return summary
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = await _job(job_id)
+    if job.status == "done":
+        return job.result
+    if job.status == "failed":
+        return JSONResponse(content={"error": job.error}, status_code=500)
+    # Not finished yet: poll again
+    return JSONResponse(content=job.summary(), status_code=202, headers={"Retry-After": "1"})
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events: a "status" event on every change, then "result" or "error" once finished"""
+    job = await _job(job_id)
+
+    async def events():
+        current = job
+        last = None
+        while True:
+            if current is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Unknown or expired job'})}\n\n"
+                return
+            if current.status != last:
+                last = current.status
+                yield f"event: status\ndata: {json.dumps(current.summary())}\n\n"
+            if current.status == "done":
+                yield f"event: result\ndata: {json.dumps(current.result)}\n\n"
+                return
+            if current.status == "failed":
+                yield f"event: error\ndata: {json.dumps({'error': current.error})}\n\n"
+                return
+            await job_runner.wait_for_change()
+            current = await job_runner.get(job_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
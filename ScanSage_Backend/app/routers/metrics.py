@@ -0,0 +1,138 @@
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from app.services.admission import admission
+from app.services.classification_service import classifier_batcher, shadow_runner
+from app.services.job_queue import job_runner
+from app.services.llm_client import llm_client
+from app.services.model_registry import model_registry
+from app.services.model_router import model_router
+from app.utils.cache import roi_cache, prediction_cache, llm_cache, artifact_cache, study_cache
+from app.utils.ingestion import ingestion_stats
+from app.utils.metrics import family, http_request_seconds, stage_seconds
+from app.utils.startup import startup
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _cache_lines() -> list:
+    caches = [cache.stats() for cache in (roi_cache, prediction_cache, llm_cache, artifact_cache, study_cache)]
+    return [
+        *family("scansage_cache_lookups_total", "counter", "Cache lookups by result", [
+            ({"cache": stats["namespace"], "result": result}, value)
+            for stats in caches
+            for result, value in (("memory_hit", stats["hits"]["memory"]), ("disk_hit", stats["hits"]["disk"]),
+                                  ("miss", stats["misses"]))
+        ]),
+        *family("scansage_cache_hit_ratio", "gauge", "Share of cache lookups that were hits",
+                [({"cache": stats["namespace"]}, stats["hit_ratio"]) for stats in caches]),
+        *family("scansage_cache_entries", "gauge", "Entries held in memory",
+                [({"cache": stats["namespace"]}, stats["memory_entries"]) for stats in caches]),
+    ]
+
+
+def _queue_lines(jobs: dict) -> list:
+    snapshot = admission.stats()
+    stages, requests = snapshot["stages"], snapshot["requests"]
+    batching = classifier_batcher.stats()
+    return [
+        *family("scansage_stage_active", "gauge", "Work running per admission stage",
+                [({"stage": name}, stats["active"]) for name, stats in stages.items()]),
+        *family("scansage_stage_queue_depth", "gauge", "Work waiting per admission stage and lane", [
+            ({"stage": name, "lane": lane}, depth)
+            for name, stats in stages.items() for lane, depth in stats["queued"].items()
+        ]),
+        *family("scansage_stage_rejected_total", "counter", "Work refused per admission stage and lane", [
+            ({"stage": name, "lane": lane}, count)
+            for name, stats in stages.items() for lane, count in stats["rejected"].items()
+        ]),
+        *family("scansage_requests_in_progress", "gauge", "Requests in progress per lane",
+                [({"lane": lane}, stats["in_progress"]) for lane, stats in requests.items()]),
+        *family("scansage_requests_refused_total", "counter", "Requests refused with 429 per lane",
+                [({"lane": lane}, stats["refused"]) for lane, stats in requests.items()]),
+        *family("scansage_classifier_queue_depth", "gauge", "Classifier requests waiting for a batch",
+                [({"model": model}, stats["queued"]) for model, stats in batching.items()]),
+        *family("scansage_classifier_batch_size_average", "gauge", "Average classifier batch size",
+                [({"model": model}, stats["average_batch_size"]) for model, stats in batching.items()]),
+        *family("scansage_jobs", "gauge", "Jobs by status", [({"status": status}, count) for status, count in jobs.items()]),
+    ]
+
+
+def _model_lines() -> list:
+    models = model_registry.stats()["models"]
+    labels = {key: {"organ": stats["organ"], "version": stats["version"]} for key, stats in models.items()}
+    routes = model_router.stats()
+    shadows = shadow_runner.stats()
+    return [
+        *family("scansage_model_loads_total", "counter", "Classifier loads, including reloads after eviction",
+                [(labels[key], stats["load_count"]) for key, stats in models.items()]),
+        *family("scansage_model_evictions_total", "counter", "Classifier evictions",
+                [(labels[key], stats["evictions"]) for key, stats in models.items()]),
+        *family("scansage_model_resident_bytes", "gauge", "Weights held in memory per classifier",
+                [(labels[key], stats["resident_bytes"]) for key, stats in models.items()]),
+        *family("scansage_model_requests_total", "counter", "Classifier requests answered per version", [
+            ({"organ": organ, "version": version}, count)
+            for organ, route in routes.items() for version, count in route["requests"].items()
+        ]),
+        *family("scansage_shadow_images_total", "counter", "Images mirrored to each shadow version",
+                [(labels[key], stats["images"]) for key, stats in shadows["versions"].items()]),
+        *family("scansage_shadow_agreement", "gauge", "Top-1 agreement of each shadow version with the response",
+                [(labels[key], stats["agreement"]) for key, stats in shadows["versions"].items()]),
+        *family("scansage_shadow_skipped_total", "counter", "Requests not mirrored because too many were pending",
+                [({}, shadows["skipped"])]),
+    ]
+
+
+def _startup_lines() -> list:
+    status = startup.stats()
+    return [
+        *family("scansage_ready", "gauge", "1 once the warm-up has finished", [({}, int(startup.is_ready))]),
+        *family("scansage_startup_seconds", "gauge", "App import and warm-up step durations", [
+            ({"step": "import"}, status["import_seconds"]),
+            *(({"step": step}, seconds) for step, seconds in status["warmup_steps_seconds"].items()),
+            ({"step": "ready"}, status["seconds_to_ready"]),
+        ]),
+    ]
+
+
+def _llm_lines() -> list:
+    stats = llm_client.stats()
+    upload = ingestion_stats.stats()
+    return [
+        *family("scansage_llm_calls_total", "counter", "LLM backend calls", [({}, stats["calls"])]),
+        *family("scansage_llm_coalesced_total", "counter", "Requests served by an identical call in flight",
+                [({}, stats["coalesced"])]),
+        *family("scansage_llm_in_flight", "gauge", "LLM calls in flight", [({}, stats["in_flight"])]),
+        *family("scansage_llm_bytes_sent_total", "counter", "Prompt and image bytes sent to the LLM",
+                [({}, stats["bytes_sent"])]),
+        *family("scansage_llm_tokens_total", "counter", "LLM tokens by kind", [
+            ({"kind": kind}, stats[f"{kind}_tokens"]) for kind in ("prompt", "output", "cached")
+        ]),
+        *family("scansage_uploads_total", "counter", "Uploads accepted", [({}, upload["accepted"])]),
+        *family("scansage_uploads_rejected_total", "counter", "Uploads rejected by reason",
+                [({"reason": reason}, count) for reason, count in upload["rejected"].items()]),
+        *family("scansage_process_resident_bytes", "gauge", "Resident memory of this process",
+                [({}, upload["rss_bytes"])]),
+    ]
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text exposition of this process: stage and request latency
+    histograms, cache hit ratios, queue depths, model loads, start-up times
+    and LLM usage.
+    """
+    jobs = await run_in_threadpool(job_runner.store.counts)
+    lines = [
+        *stage_seconds.expose(),
+        *http_request_seconds.expose(),
+        *_cache_lines(),
+        *_queue_lines(jobs),
+        *_model_lines(),
+        *_startup_lines(),
+        *_llm_lines(),
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=CONTENT_TYPE)
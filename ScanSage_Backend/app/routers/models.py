@@ -0,0 +1,60 @@
+from fastapi import APIRouter
+from app.services.classification_service import classifier_batcher, shadow_runner
+from app.services.llm_client import llm_client
+from app.services.scan_pipeline import speculation_stats
+from app.utils.organ_detector import organ_detector
+from app.services.model_registry import model_registry
+from app.services.model_router import model_router
+
+router = APIRouter()
+
+
+@router.get("/models")
+async def model_stats():
+    """
+    Report load time, hit count and resident size for each classifier version.
+    """
+    return model_registry.stats()
+
+
+@router.get("/models/routing")
+async def routing_stats():
+    """
+    Report each organ's primary, canary, shadow and ensemble versions, the
+    requests each version answered, and how often each shadow agreed with
+    the response.
+    """
+    return {"organs": model_router.stats(), "shadow": shadow_runner.stats()}
+
+
+@router.get("/models/batching")
+async def batching_stats():
+    """
+    Report batch counts and average batch size for each classifier version's queue.
+    """
+    return classifier_batcher.stats()
+
+
+@router.get("/models/llm")
+async def llm_stats():
+    """
+    Report LLM backend calls, coalesced requests and in-flight count.
+    """
+    return llm_client.stats()
+
+
+@router.get("/models/speculation")
+async def speculation_report():
+    """
+    Report how often speculative classification matched the LLM's organ
+    and how much critical-path time it saved.
+    """
+    return speculation_stats.stats()
+
+
+@router.get("/models/organ-detector")
+async def organ_detector_stats():
+    """
+    Report pre-classifier decision counts, thresholds and average latency.
+    """
+    return organ_detector.stats()
@@ -1,20 +1,24 @@
 from fastapi import APIRouter, UploadFile, File
 from fastapi.responses import JSONResponse
-from app.services.classification_service import predict_tumor_from_memory
+from app.services.admission import Overloaded
+from app.services.scan_pipeline import run_prediction
+from app.utils.ingestion import ingest_upload
 
 router = APIRouter()
 
 
 @router.post("/predict/{organ_type}")
 async def predict_tumor_endpoint(organ_type: str, file: UploadFile = File(...)):
-    try:
-        # Read file into memory
-        contents = await file.read()
+    # Stream the upload in, hashing it and checking it is an image on the way
+    context = await ingest_upload(file)
 
+    try:
         # Process image and make prediction directly from memory
-        result = predict_tumor_from_memory(contents, organ_type)
+        result, _ = await run_prediction(context, organ_type)
 
         return result
+    except Overloaded:
+        raise
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
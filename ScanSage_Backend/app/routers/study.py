@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, File, UploadFile, Form
+from fastapi.responses import JSONResponse
+from typing import List, Optional
+from app.config import MAX_REQUEST_BYTES, STUDY_MAX_FILES
+from app.services.admission import Overloaded
+from app.services.output_service import ImageRenderer, output_options
+from app.services.study_service import run_study
+from app.utils.ingestion import UploadBudget, ingest_uploads
+from app.utils.volume import sniff_volume_type
+
+router = APIRouter()
+
+
+@router.post("/study/scan")
+async def study_scan(
+        files: List[UploadFile] = File(...),
+        organ_type: Optional[str] = Form(None),
+        window_center: Optional[float] = Form(None),
+        window_width: Optional[float] = Form(None),
+        output=Depends(output_options),
+):
+    """
+    Analyze a multi-slice study: a DICOM series (one file per slice or a
+    multi-frame file), a NIfTI volume (.nii / .nii.gz), a .npy stack or a set
+    of ordinary images. Returns per-slice predictions and tumor areas plus the
+    study summary, with the heatmap and ROI of the max-confidence slice.
+    The window defaults to the one stored in the files.
+    """
+    if (window_center is None) != (window_width is None):
+        return JSONResponse(
+            content={"error": "window_center and window_width must be given together"},
+            status_code=422
+        )
+    window = (window_center, window_width) if window_center is not None else None
+    renderer = ImageRenderer(*output)
+
+    contexts = await ingest_uploads(
+        files,
+        UploadBudget(MAX_REQUEST_BYTES, max_files=STUDY_MAX_FILES),
+        sniff=sniff_volume_type,
+        # A NIfTI or .npy volume arrives as one file, so only the request budget applies
+        max_bytes=MAX_REQUEST_BYTES
+    )
+
+    try:
+        result = await run_study(contexts, organ_type, window, renderer)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=422)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+    return renderer.response(result)
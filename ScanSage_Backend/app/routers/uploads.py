@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from app.utils.ingestion import ingestion_stats
+
+router = APIRouter()
+
+
+@router.get("/uploads")
+async def upload_stats():
+    """
+    Report accepted and rejected uploads, the configured limits and the
+    process's current and peak resident memory.
+    """
+    return ingestion_stats.stats()
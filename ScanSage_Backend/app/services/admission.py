@@ -0,0 +1,283 @@
+"""
+Admission control for the pipeline stages.
+Each stage (LLM, CNN, OpenCV) runs a bounded amount of work at once; callers
+beyond that wait in a bounded queue per priority lane, and interactive
+requests are always served before batch work. When a queue is full, or a
+wait runs past ADMISSION_MAX_WAIT_SECONDS, the request fails fast with 503
+and a Retry-After estimate instead of piling up on the executors. A cap on
+requests in progress per lane turns bursts away with 429 before any upload
+is read.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from app.config import (
+    ADMISSION_LLM_CONCURRENCY,
+    ADMISSION_CNN_CONCURRENCY,
+    ADMISSION_OPENCV_CONCURRENCY,
+    ADMISSION_INTERACTIVE_QUEUE,
+    ADMISSION_BATCH_QUEUE,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_INTERACTIVE_REQUESTS,
+    ADMISSION_BATCH_REQUESTS,
+)
+from app.utils.metrics import record
+
+# Highest priority first
+LANES = ("interactive", "batch")
+# Waits kept per stage for the percentiles in /api/admission
+RECENT_WAITS = 500
+
+# Lane of the work running in this task; set per request by AdmissionMiddleware
+# and to "batch" by the job workers
+current_lane: ContextVar[str] = ContextVar("admission_lane", default="interactive")
+
+# Path prefix -> lane of the requests gated by AdmissionMiddleware
+ROUTE_LANES = (
+    ("/api/chat", "interactive"),
+    ("/api/analyze", "interactive"),
+    ("/api/predict/", "interactive"),
+    ("/process-image", "interactive"),
+    ("/api/batch/", "batch"),
+    ("/api/study/", "batch"),
+)
+
+
+class Overloaded(HTTPException):
+    """Work refused because a stage or lane is at capacity"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Stage:
+    """
+    Priority semaphore for one pipeline stage.
+    A released slot is handed straight to the oldest waiter of the highest
+    priority lane, so batch work only runs when no interactive work is waiting.
+    Runs on the event loop only, so it needs no lock.
+    """
+
+    def __init__(self, name: str, limit: int, queue_limits: Dict[str, int],
+                 max_wait: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.queue_limits = queue_limits
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self.admitted = dict.fromkeys(LANES, 0)
+        self.rejected = dict.fromkeys(LANES, 0)
+        self.timed_out = dict.fromkeys(LANES, 0)
+        self.peak_queued = dict.fromkeys(LANES, 0)
+        self.wait_seconds = dict.fromkeys(LANES, 0.0)
+        self.recent_waits = deque(maxlen=RECENT_WAITS)
+        self.completed = 0
+        self.service_seconds = 0.0
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.waiters.values())
+
+    def retry_after(self) -> int:
+        """Seconds until the work queued now has likely drained"""
+        average = self.service_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(average * (self.queued() + 1) / max(self.limit, 1)))
+
+    @asynccontextmanager
+    async def slot(self, lane: Optional[str] = None):
+        lane = lane or current_lane.get()
+        await self._acquire(lane)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.completed += 1
+            self.service_seconds += time.perf_counter() - start
+            self._release()
+
+    async def _acquire(self, lane: str) -> None:
+        if not self.limit or (self.active < self.limit and not self.queued()):
+            self.active += 1
+            self._record_wait(lane, 0.0)
+            return
+
+        queue = self.waiters[lane]
+        if len(queue) >= self.queue_limits[lane]:
+            self.rejected[lane] += 1
+            raise Overloaded(503, f"The {self.name} stage is at capacity, try again later", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        self.peak_queued[lane] = max(self.peak_queued[lane], len(queue))
+        start = time.perf_counter()
+        try:
+            # Not wait_for: before Python 3.12 it swallows a cancellation that
+            # arrives with the slot, and the cancelled request would run anyway
+            done, _ = await asyncio.wait((future,), timeout=self.max_wait or None)
+            if not done:
+                raise asyncio.TimeoutError
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over as the wait ended: pass it on
+                self._release()
+            elif future in queue:
+                queue.remove(future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out[lane] += 1
+                raise Overloaded(503, f"Timed out waiting for the {self.name} stage", self.retry_after())
+            raise
+        self._record_wait(lane, time.perf_counter() - start)
+
+    def _release(self) -> None:
+        for lane in LANES:
+            queue = self.waiters[lane]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    # Hand the slot over; the active count stays the same
+                    future.set_result(None)
+                    return
+        self.active -= 1
+
+    def _record_wait(self, lane: str, seconds: float) -> None:
+        record(f"{self.name}_queue", seconds)
+        self.admitted[lane] += 1
+        self.wait_seconds[lane] += seconds
+        self.recent_waits.append(seconds)
+
+    def stats(self) -> dict:
+        waits = list(self.recent_waits)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": {lane: len(queue) for lane, queue in self.waiters.items()},
+            "peak_queued": dict(self.peak_queued),
+            "queue_limits": dict(self.queue_limits),
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "timed_out": dict(self.timed_out),
+            "average_wait_seconds": {
+                lane: self.wait_seconds[lane] / self.admitted[lane] if self.admitted[lane] else 0.0
+                for lane in LANES
+            },
+            "p50_wait_seconds": _percentile(waits, 0.5),
+            "p95_wait_seconds": _percentile(waits, 0.95),
+            "average_service_seconds": self.service_seconds / self.completed if self.completed else 0.0,
+            "retry_after_seconds": self.retry_after(),
+        }
+
+
+class AdmissionController:
+    """Stage semaphores plus the per-lane cap on requests in progress"""
+
+    def __init__(self, stages: Dict[str, Stage], request_limits: Dict[str, int]):
+        self.stages = stages
+        self.request_limits = request_limits
+        self.requests = dict.fromkeys(LANES, 0)
+        self.refused = dict.fromkeys(LANES, 0)
+
+    def slot(self, stage: str, lane: Optional[str] = None):
+        """`async with admission.slot("cnn"):` around one unit of a stage's work"""
+        return self.stages[stage].slot(lane)
+
+    def enter(self, lane: str) -> None:
+        limit = self.request_limits[lane]
+        if limit and self.requests[lane] >= limit:
+            self.refused[lane] += 1
+            retry_after = max(stage.retry_after() for stage in self.stages.values())
+            raise Overloaded(429, f"Too many {lane} requests in progress, try again later", retry_after)
+        self.requests[lane] += 1
+
+    def leave(self, lane: str) -> None:
+        self.requests[lane] -= 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": {
+                lane: {"in_progress": self.requests[lane], "limit": self.request_limits[lane],
+                       "refused": self.refused[lane]}
+                for lane in LANES
+            },
+            "stages": {name: stage.stats() for name, stage in self.stages.items()},
+        }
+
+
+def create_controller() -> AdmissionController:
+    queue_limits = {"interactive": ADMISSION_INTERACTIVE_QUEUE, "batch": ADMISSION_BATCH_QUEUE}
+    return AdmissionController(
+        {
+            "llm": Stage("llm", ADMISSION_LLM_CONCURRENCY, queue_limits),
+            "cnn": Stage("cnn", ADMISSION_CNN_CONCURRENCY, queue_limits),
+            "opencv": Stage("opencv", ADMISSION_OPENCV_CONCURRENCY, queue_limits),
+        },
+        {"interactive": ADMISSION_INTERACTIVE_REQUESTS, "batch": ADMISSION_BATCH_REQUESTS},
+    )
+
+
+admission = create_controller()
+
+
+def route_lane(path: str) -> Optional[str]:
+    for prefix, lane in ROUTE_LANES:
+        if path.startswith(prefix):
+            return lane
+    return None
+
+
+class AdmissionMiddleware:
+    """
+    Count requests in progress per lane and refuse new ones over the limit
+    with 429 before their body is read. The lane comes from the path; clients
+    can move an interactive request to the batch lane with "X-Priority: batch".
+    Stage work done for the request runs in its lane.
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        lane = route_lane(scope["path"]) if scope["type"] == "http" else None
+        if lane is None:
+            return await self.app(scope, receive, send)
+        if dict(scope.get("headers") or []).get(b"x-priority") == b"batch":
+            lane = "batch"
+
+        try:
+            self.controller.enter(lane)
+        except Overloaded as e:
+            body = json.dumps({"detail": e.detail}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": e.status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        token = current_lane.set(lane)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_lane.reset(token)
+            self.controller.leave(lane)
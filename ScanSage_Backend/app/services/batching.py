@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+
+class BatchingQueue:
+    """
+    Groups concurrent inference requests for one model into a single batched call.
+    A background worker waits for the first request, then keeps collecting until
+    either max_batch_size samples are queued or max_wait_ms has passed.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = 16, max_wait_ms: float = 5):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue: "Queue[Tuple[np.ndarray, Future]]" = Queue()
+        self.lock = Lock()
+        self.batches = 0
+        self.samples = 0
+        self.largest_batch = 0
+        self.worker = Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self.worker.start()
+
+    def submit(self, inputs: np.ndarray) -> Future:
+        """
+        Queue a (n, height, width, channels) array.
+        The returned future resolves to the n matching rows of the model output.
+        """
+        future = Future()
+        self.queue.put((inputs, future))
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "samples": self.samples,
+                "average_batch_size": self.samples / self.batches if self.batches else 0,
+                "largest_batch": self.largest_batch,
+                "queued": self.queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future]]:
+        items = [self.queue.get()]
+        size = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except Empty:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    def _run(self) -> None:
+        while True:
+            items = self._collect()
+            # Skip requests whose caller has already given up
+            items = [item for item in items if item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+
+            try:
+                batch = items[0][0] if len(items) == 1 else np.concatenate([inputs for inputs, _ in items])
+                outputs = self.run_batch(batch)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for inputs, future in items:
+                future.set_result(outputs[offset:offset + len(inputs)])
+                offset += len(inputs)
+
+            with self.lock:
+                self.batches += 1
+                self.samples += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+
+
+class MicroBatcher:
+    """
+    One BatchingQueue per model key, created on first use.
+    """
+
+    def __init__(self, run_batch: Callable[[str, np.ndarray], np.ndarray],
+                 max_batch_size: int = 16, max_wait_ms: float = 5):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.queues: Dict[str, BatchingQueue] = {}
+        self.lock = Lock()
+
+    def submit(self, key: str, inputs: np.ndarray) -> Future:
+        return self._queue(key).submit(inputs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {key: queue.stats() for key, queue in self.queues.items()}
+
+    def _queue(self, key: str) -> BatchingQueue:
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                queue = BatchingQueue(
+                    key,
+                    lambda batch: self.run_batch(key, batch),
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                )
+                self.queues[key] = queue
+            return queue
@@ -1,85 +1,188 @@
+import asyncio
+import hashlib
+from concurrent.futures import Future
+from threading import Lock
 import numpy as np
-import tensorflow as tf
-from io import BytesIO
-from PIL import Image
+from app.config import BATCHING_ENABLED, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from app.services.batching import MicroBatcher
+from app.services.model_registry import model_registry
+from app.services.model_router import ShadowRunner, model_router
+from app.utils.metrics import timed, with_context
+from app.utils.scan_context import ScanContext
 
 
-def load_model(model_path):
-    return tf.keras.models.load_model(model_path)
+def _run_model(model_key, batch):
+    engine = model_registry.get(model_key)
+    with timed("classifier_forward"):
+        return engine(batch)
 
-def preprocess_image_from_memory(img_data, img_size):
+
+classifier_batcher = MicroBatcher(
+    _run_model,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+)
+
+
+def resolve_organ(organ_type):
+    """Map an organ name onto a classifier; anything unrecognized uses the Breast model"""
+    return organ_type if organ_type in ("Brain", "Lung") else "Breast"
+
+
+def _image(img_data):
+    return img_data.rgb if isinstance(img_data, ScanContext) else img_data
+
+
+def preprocess_image_from_memory(img_data, model):
     """
     Process image data from memory into the format expected by the model.
-    Ensures correct dimensions (height, width, channels).
+    Accepts raw bytes, an already decoded array or a ScanContext and returns
+    the float32 (1, height, width, 3) input tensor of `model`, a ModelVersion
+    or Route.
+    """
+    with timed("classifier_preprocess"):
+        return model.preprocess([_image(img_data)])
+
+
+def run_classifier(model_key, img_array):
+    """
+    Returns a future for the output of one model version ("Brain:v1") on a
+    preprocessed batch. Concurrent calls for the same version are grouped
+    into one forward pass.
+    """
+    if BATCHING_ENABLED:
+        return classifier_batcher.submit(model_key, img_array)
+
+    future = Future()
+    try:
+        future.set_result(_run_model(model_key, img_array))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+shadow_runner = ShadowRunner(run_classifier)
+
+
+def routing_key(img_data):
+    """Content hash of an image, which decides the canary version it meets"""
+    if isinstance(img_data, ScanContext):
+        return img_data.content_hash
+    if isinstance(img_data, np.ndarray):
+        img_data = np.ascontiguousarray(img_data)
+    return hashlib.sha256(img_data).hexdigest()
+
+
+def route_request(organ_type, img_data=None, key=None):
+    """The versions answering an image; `key` overrides its content hash as routing key"""
+    organ_type = resolve_organ(organ_type)
+    if key is None and img_data is not None and model_router.uses_canary(organ_type):
+        key = routing_key(img_data)
+    return model_router.route(organ_type, key)
+
+
+def _mean(futures):
+    """Future for the element-wise mean of several output futures"""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            combined.set_result(np.mean([np.asarray(future.result()) for future in futures], axis=0))
+        except Exception as e:
+            combined.set_exception(e)
+
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
+
+
+def classify(route, img_array):
+    """
+    Future for the served output of a batch preprocessed for `route`: the
+    probabilities of its version, or their mean over an ensemble. Ensemble
+    members get the same tensor, each through its own micro-batch queue, so
+    their forward passes run concurrently.
     """
-    # Open image from binary data using PIL
-    img = Image.open(BytesIO(img_data))
+    futures = [run_classifier(model.key, img_array) for model in route.served]
+    return futures[0] if len(futures) == 1 else _mean(futures)
+
+
+def classify_and_mirror(route, images, img_array):
+    """classify(), with the request mirrored to the route's shadows once its output is ready"""
+    future = classify(route, img_array)
+    shadow_runner.submit(route, images, img_array, future)
+    return future
 
-    # Convert to RGB mode to ensure 3 channels
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
 
-    # Resize the image to expected dimensions
-    img = img.resize(img_size)
+def format_prediction(prediction, class_labels):
+    predicted_class = class_labels[np.argmax(prediction)]
 
-    # Convert to numpy array with correct shape (height, width, channels)
-    img_array = np.array(img)
+    # Check if the highest probability is below a threshold
+    confidence = float(np.max(prediction))  # Convert to Python float
+    confidence_threshold = 0.5  # You can adjust this threshold
 
-    # Ensure we have a 4D tensor (batch_size, height, width, channels)
-    img_array = np.expand_dims(img_array, axis=0)
+    if confidence < confidence_threshold:
+        prediction_status = "Low Confidence"
+    else:
+        prediction_status = "High Confidence"
 
-    # Normalize pixel values to [0, 1]
-    img_array = img_array / 255.0
+    return {
+        "predicted_class": predicted_class,
+        "confidence_scores": prediction.tolist()[0],  # Convert to list and extract from batch
+        "confidence_level": confidence,
+        "prediction_status": prediction_status
+    }
 
-    return img_array
 
+def _prediction_error(e, img_array):
+    # Add more diagnostic information to the error
+    error_message = f"Error during prediction: {str(e)}"
+    if img_array is not None:
+        error_message += f"\nImage array shape: {img_array.shape}"
+    return Exception(error_message)
 
-def predict_tumor_from_memory(img_data, organ_type):
-    # Import here to avoid circular imports
-    from app.config import BRAIN_MODEL_PATH, LUNG_MODEL_PATH, BREAST_MODEL_PATH
 
-    if organ_type == "Brain":
-        model = load_model(BRAIN_MODEL_PATH)
-        img_size = (299, 299)
-        class_labels = ["Glioma", "Meningioma", "Pituitary Tumor", "Normal"]
-    elif organ_type == "Lung":
-        model = load_model(LUNG_MODEL_PATH)
-        img_size = (224, 224)
-        class_labels = ["Benign", "Malignant", "Normal"]
-    else:  # Breast
-        model = load_model(BREAST_MODEL_PATH)
-        img_size = (244, 244)
-        class_labels = ["Benign", "Malignant"]
+def format_route_prediction(prediction, route):
+    return {**format_prediction(prediction, route.labels), "model_version": route.model_version}
 
+
+def predict_tumor_from_memory(img_data, organ_type, key=None):
+    route = route_request(organ_type, img_data, key)
+
+    img_array = None
     try:
         # Process image directly from memory
-        img_array = preprocess_image_from_memory(img_data, img_size)
-
-        # Print shape for debugging
-        print(f"Processed image shape: {img_array.shape}")
+        img_array = preprocess_image_from_memory(img_data, route)
 
         # Make prediction
-        prediction = model.predict(img_array)
-        predicted_class = class_labels[np.argmax(prediction)]
-
-        # Check if the highest probability is below a threshold
-        confidence = float(np.max(prediction))  # Convert to Python float
-        confidence_threshold = 0.5  # You can adjust this threshold
-
-        if confidence < confidence_threshold:
-            prediction_status = "Low Confidence"
-        else:
-            prediction_status = "High Confidence"
-
-        return {
-            "predicted_class": predicted_class,
-            "confidence_scores": prediction.tolist()[0],  # Convert to list and extract from batch
-            "confidence_level": confidence,
-            "prediction_status": prediction_status
-        }
+        with timed("classifier_predict"):
+            prediction = classify_and_mirror(route, [_image(img_data)], img_array).result()
+        return format_route_prediction(prediction, route)
+    except Exception as e:
+        raise _prediction_error(e, img_array)
+
+
+async def predict_tumor_async(img_data, organ_type, executor=None, key=None):
+    """
+    Async variant of predict_tumor_from_memory.
+    Preprocessing runs on the executor; waiting for the batched forward pass
+    does not hold a worker thread.
+    """
+    route = route_request(organ_type, img_data, key)
+    loop = asyncio.get_running_loop()
+
+    img_array = None
+    try:
+        img_array = await loop.run_in_executor(executor, with_context(preprocess_image_from_memory, img_data, route))
+        # Includes the wait for the micro-batch to fill
+        with timed("classifier_predict"):
+            prediction = await asyncio.wrap_future(classify_and_mirror(route, [_image(img_data)], img_array))
+        return format_route_prediction(prediction, route)
     except Exception as e:
-        # Add more diagnostic information to the error
-        error_message = f"Error during prediction: {str(e)}"
-        if 'img_array' in locals():
-            error_message += f"\nImage array shape: {img_array.shape}"
-        raise Exception(error_message)
\ No newline at end of file
+        raise _prediction_error(e, img_array)
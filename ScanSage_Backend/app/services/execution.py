@@ -0,0 +1,202 @@
+import asyncio
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.config import (
+    EXECUTION_BACKEND,
+    EXECUTOR_WORKERS,
+    TF_INTRA_OP_THREADS,
+    TF_INTER_OP_THREADS,
+    MODEL_WARMUP,
+)
+from app.utils.metrics import with_context
+from app.utils.scan_context import ScanContext
+from app.utils.startup import startup
+
+
+def configure_tensorflow_threads(intra_op: int = TF_INTRA_OP_THREADS, inter_op: int = TF_INTER_OP_THREADS) -> None:
+    """
+    Size TensorFlow's thread pools; 0 keeps TensorFlow's default (one per core).
+    Must run before the first model is loaded in the process.
+    """
+    import tensorflow as tf
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError:
+        # The TensorFlow runtime is already initialized in this process
+        pass
+
+
+class SharedArray(NamedTuple):
+    """Picklable reference to a numpy array placed in shared memory"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def share_array(array: np.ndarray) -> Tuple[SharedMemory, SharedArray]:
+    """Copy an array into a new shared memory block"""
+    shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm, SharedArray(shm.name, array.shape, array.dtype.str)
+
+
+def _release(shm: SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+
+def _with_shared_array(handle: SharedArray, func: Callable[[np.ndarray], Any]) -> Any:
+    # Runs in a worker process: map the parent's decoded image without copying it
+    shm = SharedMemory(name=handle.name)
+    try:
+        array = np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=shm.buf)
+        try:
+            return func(array)
+        finally:
+            del array
+    finally:
+        shm.close()
+
+
+def _init_worker(warmup: Iterable[str], intra_op: int, inter_op: int) -> None:
+    configure_tensorflow_threads(intra_op, inter_op)
+    if warmup:
+        from app.services.model_router import model_router
+        model_router.warm_up(warmup)
+
+
+def _worker_pid(_) -> int:
+    return os.getpid()
+
+
+def _roi_worker(handle: SharedArray):
+    from app.utils.RegionOfIntrest import extract_roi
+    return _with_shared_array(handle, extract_roi)
+
+
+def _predict_worker(handle: SharedArray, organ_type: str, routing_key: str):
+    from app.services.classification_service import predict_tumor_from_memory
+    return _with_shared_array(handle, lambda array: predict_tumor_from_memory(array, organ_type, routing_key))
+
+
+class ThreadBackend:
+    """
+    Runs OpenCV and TensorFlow work on a thread pool in the API process.
+    Both libraries release the GIL in their native kernels, and classifier
+    requests from concurrent threads share micro-batched forward passes.
+    """
+
+    name = "thread"
+
+    def __init__(self, workers: int = EXECUTOR_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cpu")
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run a small CPU-bound call (decode, pre-classifier) off the event loop"""
+        loop = asyncio.get_running_loop()
+        # Carry the request's context into the worker, so stages timed there are reported with it
+        return await loop.run_in_executor(self.executor, with_context(func, *args))
+
+    async def roi(self, context: ScanContext):
+        from app.utils.RegionOfIntrest import extract_roi
+        # Decode in colour so a later classifier stage reuses the same decode
+        return await self.run(lambda: extract_roi(context.decode()))
+
+    async def predict(self, context: ScanContext, organ_type: str) -> dict:
+        from app.services.classification_service import predict_tumor_async
+        return await predict_tumor_async(context, organ_type, self.executor)
+
+    def warm_up(self, organ_types: Iterable[str]) -> None:
+        # Importing TensorFlow is most of a cold start, so it is timed on its own
+        with startup.step("tensorflow"):
+            configure_tensorflow_threads()
+        if organ_types:
+            from app.services.model_router import model_router
+            for organ_type in organ_types:
+                with startup.step(f"model_{organ_type}"):
+                    model_router.warm_up([organ_type])
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class ProcessBackend(ThreadBackend):
+    """
+    Runs ROI extraction and classification in a pool of worker processes,
+    sidestepping the GIL for the Python-level parts of those stages.
+    Each worker loads its own models at start-up. An upload is decoded once in
+    the API process, and the decoded array reaches workers through shared
+    memory instead of pickled bytes. Cheap stages still use the thread pool.
+    """
+
+    name = "process"
+
+    def __init__(self, workers: int = EXECUTOR_WORKERS, warmup: Iterable[str] = MODEL_WARMUP,
+                 intra_op: int = TF_INTRA_OP_THREADS, inter_op: int = TF_INTER_OP_THREADS):
+        super().__init__(workers)
+        # TensorFlow is not fork-safe, so workers are spawned fresh
+        self.processes = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(list(warmup), intra_op, inter_op),
+        )
+        # One shared block per upload, released when its ScanContext is garbage collected
+        self.shared: "weakref.WeakKeyDictionary[ScanContext, asyncio.Future]" = weakref.WeakKeyDictionary()
+
+    async def roi(self, context: ScanContext):
+        handle = await self._share(context)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.processes, _roi_worker, handle)
+
+    async def predict(self, context: ScanContext, organ_type: str) -> dict:
+        handle = await self._share(context)
+        loop = asyncio.get_running_loop()
+        # The upload's hash, not the decoded array's, picks the canary version as in the API process
+        return await loop.run_in_executor(self.processes, _predict_worker, handle, organ_type, context.content_hash)
+
+    def warm_up(self, organ_types: Iterable[str]) -> None:
+        # Touch every worker so process start-up and model loading happen before traffic
+        with startup.step("worker_processes"):
+            list(self.processes.map(_worker_pid, range(self.workers)))
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        self.processes.shutdown(wait=False, cancel_futures=True)
+
+    async def _share(self, context: ScanContext) -> SharedArray:
+        future = self.shared.get(context)
+        if future is None:
+            future = asyncio.ensure_future(self.run(self._create_shared, context))
+            self.shared[context] = future
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _create_shared(context: ScanContext) -> SharedArray:
+        shm, handle = share_array(context.rgb)
+        weakref.finalize(context, _release, shm)
+        return handle
+
+
+BACKENDS = {
+    "thread": ThreadBackend,
+    "process": ProcessBackend,
+}
+
+
+def create_backend(name: str = EXECUTION_BACKEND, workers: Optional[int] = None):
+    return BACKENDS[name](workers or EXECUTOR_WORKERS)
+
+
+execution_backend = create_backend()
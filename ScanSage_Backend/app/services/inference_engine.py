@@ -0,0 +1,199 @@
+"""
+Inference engines for the organ classifiers.
+TensorFlow is imported by the functions that need it, on first use, so
+importing this module (and the app) does not pay the seconds TensorFlow
+takes to load.
+"""
+import os
+from threading import Lock
+
+import numpy as np
+
+
+class KerasEngine:
+    """
+    Runs a Keras model through model.predict.
+    Kept as the reference path the faster engines are benchmarked against.
+    """
+
+    backend = "keras"
+    precision = "float32"
+
+    def __init__(self, model, input_size):
+        self.model = model
+        self.input_size = input_size
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.model.predict(batch, verbose=0)
+
+    def warm_up(self) -> None:
+        width, height = self.input_size
+        self(np.zeros((1, height, width, 3), np.float32))
+
+    def size_bytes(self) -> int:
+        return int(sum(weight.nbytes for weight in self.model.get_weights()))
+
+
+class GraphEngine(KerasEngine):
+    """
+    Calls the model directly inside a tf.function traced once for a fixed
+    (None, height, width, 3) float32 signature, skipping the data adapter and
+    callback setup that model.predict performs on every call.
+    """
+
+    backend = "graph"
+
+    def __init__(self, model, input_size):
+        import tensorflow as tf
+        super().__init__(model, input_size)
+        width, height = input_size
+        self.convert = tf.convert_to_tensor
+        self.forward = tf.function(
+            lambda inputs: model(inputs, training=False),
+            input_signature=[tf.TensorSpec([None, height, width, 3], tf.float32)],
+        )
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.forward(self.convert(batch, dtype=np.float32)).numpy()
+
+
+class SavedModelEngine:
+    """
+    Serves a SavedModel produced by export_saved_model.
+    Loading restores the already traced graph instead of rebuilding the Keras model.
+    """
+
+    backend = "saved_model"
+    precision = "float32"
+
+    def __init__(self, export_dir, input_size):
+        import tensorflow as tf
+        self.loaded = tf.saved_model.load(export_dir)
+        self.convert = tf.convert_to_tensor
+        self.forward = self.loaded.signatures["serving_default"]
+        self.input_size = input_size
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        outputs = self.forward(inputs=self.convert(batch, dtype=np.float32))
+        return next(iter(outputs.values())).numpy()
+
+    def warm_up(self) -> None:
+        width, height = self.input_size
+        self(np.zeros((1, height, width, 3), np.float32))
+
+    def size_bytes(self) -> int:
+        return int(sum(variable.numpy().nbytes for variable in self.loaded.variables))
+
+
+class TFLiteEngine:
+    """
+    Runs a TFLite flatbuffer, such as a reduced-precision variant from
+    tools.quantize_models, on the default XNNPACK CPU delegate.
+    The interpreter is not thread-safe, so calls are serialized; its input is
+    resized only when the batch size changes.
+    """
+
+    backend = "tflite"
+
+    def __init__(self, model_path, input_size, precision="float32", num_threads=0):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads or None)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.model_path = model_path
+        self.input_size = input_size
+        self.precision = precision
+        self.batch_size = None
+        self.lock = Lock()
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self.lock:
+            if len(batch) != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape, strict=False)
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(batch)
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+    def warm_up(self) -> None:
+        width, height = self.input_size
+        self(np.zeros((1, height, width, 3), np.float32))
+
+    def size_bytes(self) -> int:
+        # The flatbuffer holds the weights
+        return os.path.getsize(self.model_path)
+
+
+ENGINES = {
+    "keras": KerasEngine,
+    "graph": GraphEngine,
+}
+
+
+def saved_model_path(export_root, model_path):
+    """SavedModel directory for a .h5 model, e.g. models/saved/brain_model"""
+    return os.path.join(export_root, os.path.splitext(os.path.basename(model_path))[0])
+
+
+def load_engine(model_path, input_size, backend="graph", export_root=None):
+    """
+    Load a model for inference and trace it once so the first request does not pay for it.
+    The saved_model backend falls back to the .h5 file when no export exists yet.
+    """
+    if backend == "saved_model":
+        export_dir = saved_model_path(export_root, model_path)
+        if os.path.isdir(export_dir):
+            engine = SavedModelEngine(export_dir, input_size)
+            engine.warm_up()
+            return engine
+        backend = "graph"
+
+    if backend not in ENGINES:
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    import tensorflow as tf
+    engine = ENGINES[backend](tf.keras.models.load_model(model_path), input_size)
+    engine.warm_up()
+    return engine
+
+
+def export_saved_model(model, input_size, export_dir):
+    """Export a Keras model as a SavedModel with a fixed float32 serving signature"""
+    import tensorflow as tf
+    width, height = input_size
+
+    @tf.function(input_signature=[tf.TensorSpec([None, height, width, 3], tf.float32, name="inputs")])
+    def serve(inputs):
+        return {"outputs": model(inputs, training=False)}
+
+    tf.saved_model.save(model, export_dir, signatures={"serving_default": serve})
+    return export_dir
+
+
+def export_tflite(model, output_path, precision="float32", representative_data=None):
+    """
+    Convert a Keras model to a TFLite flatbuffer:
+      - float32: unchanged weights
+      - float16: weights stored as float16, dequantized at load
+      - dynamic_int8: int8 weights, float activations; needs no calibration data
+      - int8: int8 weights and activations, calibrated on `representative_data`
+        (a callable yielding [float32 (1, height, width, 3) array] samples)
+    Inputs and outputs stay float32 in every case.
+    """
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if precision != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif precision == "int8":
+        if representative_data is None:
+            raise ValueError("int8 quantization needs representative data for calibration")
+        converter.representative_dataset = representative_data
+    elif precision not in ("float32", "dynamic_int8"):
+        raise ValueError(f"Unknown precision: {precision}")
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
@@ -0,0 +1,519 @@
+"""
+Asynchronous jobs for long-running scan analysis.
+A submission is stored with its uploads and answered with a job id at once;
+a bounded pool of workers runs the chat / analyze / predict pipeline and
+stores the result for polling, Server-Sent Events and an optional webhook.
+"""
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from collections import deque
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import (
+    JOB_BACKEND,
+    JOB_DB_PATH,
+    JOB_WORKERS,
+    JOB_MAX_QUEUED,
+    JOB_RESULT_TTL_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_WEBHOOK_TIMEOUT,
+    JOB_WEBHOOK_ALLOWED_HOSTS,
+)
+from app.services.admission import Overloaded, current_lane
+from app.services.output_service import ImageRenderer
+from app.services.scan_pipeline import analyze_upload, chat_response, run_prediction
+from app.utils.image_encoding import EncodeOptions
+from app.utils.scan_context import ScanContext
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before checking the store for jobs submitted by other processes
+POLL_SECONDS = 1.0
+
+
+class Job(NamedTuple):
+    id: str
+    kind: str
+    params: dict
+    status: str = "queued"
+    created: float = 0.0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    attempts: int = 0
+    result: Any = None
+    error: Optional[str] = None
+
+    def summary(self) -> dict:
+        """Public status of the job, without its result"""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "attempts": self.attempts,
+            "error": self.error,
+            "status_url": f"/api/jobs/{self.id}",
+            "result_url": f"/api/jobs/{self.id}/result",
+            "events_url": f"/api/jobs/{self.id}/events",
+        }
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MemoryJobStore:
+    """
+    Jobs and their uploads kept in this process. Fast and copy-free, but
+    queued work is lost on restart and other workers cannot see the jobs.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_queued: int = JOB_MAX_QUEUED, result_ttl: float = JOB_RESULT_TTL_SECONDS):
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.lock = Lock()
+        self.jobs: Dict[str, Job] = {}
+        self.inputs: Dict[str, List[ScanContext]] = {}
+        self.queue: deque = deque()
+
+    def submit(self, job: Job, contexts: List[ScanContext]) -> None:
+        with self.lock:
+            if len(self.queue) >= self.max_queued:
+                raise QueueFull()
+            self.jobs[job.id] = job
+            self.inputs[job.id] = contexts
+            self.queue.append(job.id)
+
+    def claim(self) -> Optional[Tuple[Job, List[ScanContext]]]:
+        with self.lock:
+            if not self.queue:
+                return None
+            job_id = self.queue.popleft()
+            job = self.jobs[job_id]._replace(status="running", started=time.time())
+            job = job._replace(attempts=job.attempts + 1)
+            self.jobs[job_id] = job
+            return job, self.inputs[job_id]
+
+    def heartbeat(self, job_id: str) -> None:
+        pass
+
+    def release(self, job_id: str) -> None:
+        """Put a job interrupted by shutdown back at the front of the queue"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status == "running":
+                self.jobs[job_id] = job._replace(status="queued", started=None)
+                self.queue.appendleft(job_id)
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self.lock:
+            self.jobs[job_id] = self.jobs[job_id]._replace(
+                status="failed" if error is not None else "done",
+                finished=time.time(),
+                result=result,
+                error=error,
+            )
+            self.inputs.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Jobs ahead of a queued job"""
+        with self.lock:
+            try:
+                return self.queue.index(job_id)
+            except ValueError:
+                return None
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.result_ttl
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.finished < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+            return len(expired)
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            counts = dict.fromkeys(("queued", "running", "done", "failed"), 0)
+            for job in self.jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+class SQLiteJobStore:
+    """
+    Durable job store shared by every worker process on the host.
+    Uploads are stored with the job, so queued work survives a restart.
+    A running job's worker renews a lease; when it lapses (the process died)
+    another worker picks the job up again, up to max_attempts times.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = JOB_DB_PATH, max_queued: int = JOB_MAX_QUEUED,
+                 result_ttl: float = JOB_RESULT_TTL_SECONDS, lease: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_inputs ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, filename TEXT, mime_type TEXT NOT NULL, "
+            "content_hash TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (job_id, position))"
+        )
+
+    def submit(self, job: Job, contexts: List[ScanContext]) -> None:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self.max_queued:
+                    raise QueueFull()
+                self.conn.execute(
+                    "INSERT INTO jobs (id, kind, params, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                    (job.id, job.kind, json.dumps(job.params), job.created),
+                )
+                self.conn.executemany(
+                    "INSERT INTO job_inputs (job_id, position, filename, mime_type, content_hash, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(job.id, position, context.filename, context.mime_type, context.content_hash,
+                      sqlite3.Binary(context.data)) for position, context in enumerate(contexts)],
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def claim(self) -> Optional[Tuple[Job, List[ScanContext]]]:
+        while True:
+            now = time.time()
+            with self.lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self.conn.execute(
+                        "SELECT id, attempts FROM jobs WHERE status = 'queued' "
+                        "OR (status = 'running' AND heartbeat < ?) ORDER BY created LIMIT 1",
+                        (now - self.lease,),
+                    ).fetchone()
+                    if row is not None:
+                        self.conn.execute(
+                            "UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, attempts = attempts + 1 "
+                            "WHERE id = ?",
+                            (now, now, row[0]),
+                        )
+                    self.conn.execute("COMMIT")
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if row is None:
+                return None
+            job_id, attempts = row
+            if attempts >= self.max_attempts:
+                self.finish(job_id, error=f"Abandoned after {attempts} attempts")
+                continue
+            return self.get(job_id), self._inputs(job_id)
+
+    def heartbeat(self, job_id: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (time.time(), job_id)
+            )
+
+    def release(self, job_id: str) -> None:
+        """Put a job interrupted by shutdown back in the queue without counting the attempt"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, heartbeat = NULL, attempts = attempts - 1 "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def finish(self, job_id: str, result: Any = None, error: Optional[str] = None) -> None:
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                ("failed" if error is not None else "done", time.time(),
+                 None if result is None else json.dumps(result), error, job_id),
+            )
+            self.conn.execute("DELETE FROM job_inputs WHERE job_id = ?", (job_id,))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, kind, params, status, created, started, finished, attempts, result, error "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5], row[6], row[7],
+                   None if row[8] is None else json.loads(row[8]), row[9])
+
+    def position(self, job_id: str) -> Optional[int]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' "
+                "AND created < (SELECT created FROM jobs WHERE id = ? AND status = 'queued')",
+                (job_id,),
+            ).fetchone()
+        job = self.get(job_id)
+        return row[0] if job is not None and job.status == "queued" else None
+
+    def sweep(self) -> int:
+        with self.lock:
+            cursor = self.conn.execute(
+                "DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (time.time() - self.result_ttl,)
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(("queued", "running", "done", "failed"), 0)
+        counts.update(dict(rows))
+        return counts
+
+    def _inputs(self, job_id: str) -> List[ScanContext]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT filename, mime_type, content_hash, data FROM job_inputs WHERE job_id = ? ORDER BY position",
+                (job_id,),
+            ).fetchall()
+        return [ScanContext(bytes(data), filename, mime_type, content_hash=content_hash)
+                for filename, mime_type, content_hash, data in rows]
+
+
+STORES = {
+    "memory": MemoryJobStore,
+    "sqlite": SQLiteJobStore,
+}
+
+
+def _renderer(params: dict) -> ImageRenderer:
+    return ImageRenderer(EncodeOptions(*params["options"]), params["transport"])
+
+
+async def _run_chat(contexts: List[ScanContext], params: dict) -> dict:
+    return await chat_response(contexts, params["message"], _renderer(params))
+
+
+async def _run_analyze(contexts: List[ScanContext], params: dict) -> dict:
+    body, status_code = await analyze_upload(contexts[0])
+    if status_code != 200:
+        raise ValueError(body["error"])
+    return body
+
+
+async def _run_predict(contexts: List[ScanContext], params: dict) -> dict:
+    result, _ = await run_prediction(contexts[0], params["organ_type"])
+    return result
+
+
+# Job kind -> pipeline; each takes the job's uploads and parameters and returns its JSON result
+JOB_KINDS: Dict[str, Callable[[List[ScanContext], dict], Awaitable[dict]]] = {
+    "chat": _run_chat,
+    "analyze": _run_analyze,
+    "predict": _run_predict,
+}
+
+
+def resolve_webhook(url: str, allowed_hosts: List[str] = JOB_WEBHOOK_ALLOWED_HOSTS) -> str:
+    """
+    Address a webhook is delivered to. Raises ValueError unless the URL is
+    http(s) and its host is in `allowed_hosts` or, without an allowlist,
+    resolves only to public addresses. Blocks on DNS.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhook_url must be an http or https URL")
+    host = parts.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        raise ValueError(f"webhook_url host {host} is not allowed")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 0, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"webhook_url host {host} does not resolve")
+    # Every address must pass: a host name may resolve to a public and an internal one
+    if not allowed_hosts and not all(ipaddress.ip_address(address.split("%")[0]).is_global for address in addresses):
+        raise ValueError(f"webhook_url host {host} is not a public address")
+    return sorted(addresses)[0]
+
+
+class JobRunner:
+    """
+    Bounded pool of asyncio workers taking jobs from the store.
+    Status changes wake SSE listeners in this process; listeners also poll, so
+    jobs run by other processes (SQLite store) are reported too.
+    """
+
+    def __init__(self, store, workers: int = JOB_WORKERS, lease: float = JOB_LEASE_SECONDS,
+                 webhook_timeout: float = JOB_WEBHOOK_TIMEOUT):
+        self.store = store
+        self.workers = workers
+        self.lease = lease
+        self.webhook_timeout = webhook_timeout
+        self.tasks: List[asyncio.Task] = []
+        self.wake: Optional[asyncio.Event] = None
+        self.changed: Optional[asyncio.Condition] = None
+        self.webhooks = {"sent": 0, "failed": 0}
+
+    def start(self) -> None:
+        self.wake = asyncio.Event()
+        self.changed = asyncio.Condition()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, kind: str, contexts: List[ScanContext], params: dict) -> Job:
+        """Store a job and wake a worker; raises QueueFull when JOB_MAX_QUEUED jobs are waiting"""
+        job = Job(uuid.uuid4().hex, kind, params, created=time.time())
+        await run_in_threadpool(self.store.submit, job, contexts)
+        if self.wake is not None:
+            self.wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await run_in_threadpool(self.store.get, job_id)
+
+    async def position(self, job_id: str) -> Optional[int]:
+        return await run_in_threadpool(self.store.position, job_id)
+
+    async def wait_for_change(self, timeout: float = POLL_SECONDS) -> None:
+        """Return when a job in this process changes state, or after `timeout`"""
+        if self.changed is None:
+            await asyncio.sleep(timeout)
+            return
+        async with self.changed:
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        return {
+            "backend": self.store.name,
+            "workers": self.workers,
+            "max_queued": self.store.max_queued,
+            "jobs": await run_in_threadpool(self.store.counts),
+            "webhooks": dict(self.webhooks),
+        }
+
+    async def _notify(self) -> None:
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def _worker(self) -> None:
+        # Jobs never hold up interactive requests at the pipeline stages
+        current_lane.set("batch")
+        while True:
+            claimed = await run_in_threadpool(self.store.claim)
+            if claimed is None:
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._notify()
+            await self._run(*claimed)
+
+    async def _run(self, job: Job, contexts: List[ScanContext]) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            result = await JOB_KINDS[job.kind](contexts, job.params)
+            await run_in_threadpool(self.store.finish, job.id, result)
+        except asyncio.CancelledError:
+            # Shutting down: leave the job for the next start
+            await run_in_threadpool(self.store.release, job.id)
+            raise
+        except Overloaded as e:
+            # A stage is shedding load: put the job back and let this worker back off
+            await run_in_threadpool(self.store.release, job.id)
+            heartbeat.cancel()
+            await self._notify()
+            await asyncio.sleep(e.retry_after)
+            return
+        except Exception as e:
+            await run_in_threadpool(self.store.finish, job.id, None, str(e))
+        finally:
+            heartbeat.cancel()
+        await self._notify()
+        if job.params.get("webhook_url"):
+            await self._send_webhook(job.id, job.params["webhook_url"])
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            await run_in_threadpool(self.store.heartbeat, job_id)
+
+    async def _send_webhook(self, job_id: str, url: str) -> None:
+        import httpx
+        job = await self.get(job_id)
+        payload = {key: value for key, value in job.summary().items() if key != "events_url"}
+        try:
+            # Checked again at delivery and sent to the address checked, so a
+            # DNS change since submission cannot point the call elsewhere
+            address = await run_in_threadpool(resolve_webhook, url)
+            parts = urlsplit(url)
+            netloc = f"[{address}]" if ":" in address else address
+            if parts.port:
+                netloc += f":{parts.port}"
+            host = parts.netloc.rpartition("@")[2]
+            async with httpx.AsyncClient(timeout=self.webhook_timeout, follow_redirects=False) as client:
+                response = await client.post(
+                    urlunsplit(parts._replace(netloc=netloc)), json=payload,
+                    headers={"Host": host}, extensions={"sni_hostname": parts.hostname},
+                )
+                response.raise_for_status()
+            self.webhooks["sent"] += 1
+        except Exception as e:
+            self.webhooks["failed"] += 1
+            logger.warning("Webhook for job %s failed: %s", job_id, e)
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(60)
+            await run_in_threadpool(self.store.sweep)
+
+
+job_runner = JobRunner(STORES[JOB_BACKEND]())
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import (
+    GENAI_API_KEY,
+    GEMINI_MODEL_NAME,
+    LLM_BACKEND,
+    LLM_MAX_CONCURRENCY,
+    LLM_FAKE_LATENCY_MS,
+    LLM_CONTEXT_CACHE_TTL,
+)
+from app.utils.metrics import record
+
+logger = logging.getLogger(__name__)
+
+# Calls kept for /api/models/llm
+RECENT_CALLS = 50
+
+
+class LLMRequest(NamedTuple):
+    """One generate call"""
+    contents: Any
+    # Static part of the prompt, sent as the model's system instruction
+    system_instruction: Optional[str] = None
+    # Response schema for structured (JSON) output
+    schema: Any = None
+    # Identifies identical requests, so concurrent ones share one call
+    key: Optional[Hashable] = None
+    # Image payload report (sizes, encode time), recorded with the call
+    image: Optional[dict] = None
+
+
+class LLMResult(NamedTuple):
+    text: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+
+def request_bytes(request: LLMRequest) -> int:
+    """Bytes of prompt text and base64 image data in a request"""
+    parts = request.contents if isinstance(request.contents, list) else [request.contents]
+    size = len(request.system_instruction or "")
+    for part in parts:
+        size += len(part["data"]) if isinstance(part, dict) else len(str(part))
+    return size
+
+
+class GeminiBackend:
+    """
+    Gemini through the google-generativeai SDK.
+    One GenerativeModel per system instruction is created on first use and
+    reused for every call. With LLM_CONTEXT_CACHE_TTL the instruction is put
+    in a context cache once and later calls only send the request's own parts.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME, api_key: Optional[str] = GENAI_API_KEY,
+                 context_cache_ttl: int = LLM_CONTEXT_CACHE_TTL):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.context_cache_ttl = context_cache_ttl
+        self.models: Dict[Optional[str], Any] = {}
+        self.expires: Dict[Optional[str], float] = {}
+        self.lock = Lock()
+
+    def warm_up(self) -> None:
+        """Import and configure the SDK ahead of the first call; it is not imported with the app"""
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+
+    def _ready_model(self, system_instruction: Optional[str] = None):
+        """The model for an instruction when it exists and its context cache is not due for renewal, else None"""
+        with self.lock:
+            if time.monotonic() > self.expires.get(system_instruction, float("inf")):
+                return None
+            return self.models.get(system_instruction)
+
+    def _get_model(self, system_instruction: Optional[str] = None):
+        """The model for an instruction, created (with its context cache) when missing or expiring; blocking"""
+        with self.lock:
+            model = self.models.get(system_instruction)
+            if model is None or time.monotonic() > self.expires.get(system_instruction, float("inf")):
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                model = self._cached_model(genai, system_instruction)
+                if model is None:
+                    model = genai.GenerativeModel(model_name=self.model_name, system_instruction=system_instruction)
+                self.models[system_instruction] = model
+            return model
+
+    def _cached_model(self, genai, system_instruction: Optional[str]):
+        # Context caching needs a minimum prompt size and a model that supports
+        # it; when the API refuses, the instruction is sent with each call instead
+        if not self.context_cache_ttl or not system_instruction:
+            return None
+        try:
+            import datetime
+            from google.generativeai import caching
+            cached = caching.CachedContent.create(
+                model=self.model_name,
+                system_instruction=system_instruction,
+                ttl=datetime.timedelta(seconds=self.context_cache_ttl),
+            )
+        except Exception as e:
+            logger.info("Context cache unavailable, sending the prompt with each call: %s", e)
+            self.context_cache_ttl = 0
+            return None
+        # Recreate shortly before the cache expires
+        self.expires[system_instruction] = time.monotonic() + self.context_cache_ttl * 0.9
+        return genai.GenerativeModel.from_cached_content(cached_content=cached)
+
+    @staticmethod
+    def _generation_config(schema) -> Optional[dict]:
+        # Structured output: Gemini constrains the response to JSON matching the schema
+        if schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": schema}
+
+    @staticmethod
+    def _result(response) -> LLMResult:
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResult(
+            response.text,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+            getattr(usage, "cached_content_token_count", 0) or 0,
+        )
+
+    def generate(self, request: LLMRequest) -> LLMResult:
+        model = self._get_model(request.system_instruction)
+        response = model.generate_content(request.contents, generation_config=self._generation_config(request.schema))
+        return self._result(response)
+
+    async def generate_async(self, request: LLMRequest) -> LLMResult:
+        model = self._ready_model(request.system_instruction)
+        if model is None:
+            # Importing the SDK and creating a context cache block on I/O: keep them off the event loop
+            model = await run_in_threadpool(self._get_model, request.system_instruction)
+        response = await model.generate_content_async(
+            request.contents, generation_config=self._generation_config(request.schema)
+        )
+        return self._result(response)
+
+
+FAKE_SCAN_RESPONSE = """**Scan Type:** MRI
+**Organ:** Brain
+**Tumor Type:** Glioma
+**Tumor Subclass:** Low-grade
+**Detailed Description:** A well-defined hyperintense lesion of about 2 cm in the left frontal lobe.
+**Possible Causes:** Genetic mutations, prior radiation exposure.
+**Clinical Insights:** Findings are consistent with a glioma; further evaluation is recommended.
+
+**Disclaimer:** This is a computational analysis and not a medical diagnosis."""
+
+FAKE_SCAN_JSON = json.dumps({
+    "scan_type": "MRI",
+    "organ": "Brain",
+    "tumor_type": "Glioma",
+    "tumor_subclass": "Low-grade",
+    "detailed_description": "A well-defined hyperintense lesion of about 2 cm in the left frontal lobe.",
+    "possible_causes": "Genetic mutations, prior radiation exposure.",
+    "clinical_insights": "Findings are consistent with a glioma; further evaluation is recommended.",
+    "disclaimer": "This is a computational analysis and not a medical diagnosis.",
+})
+
+FAKE_TEXT_RESPONSE = ("I am a medical imaging assistant. This is a computational answer and not medical advice; "
+                      "please consult a healthcare professional.")
+
+# Rough token accounting for the fake backend: Gemini bills an image as 258
+# tokens and text at about four characters per token
+FAKE_IMAGE_TOKENS = 258
+FAKE_CHARS_PER_TOKEN = 4
+
+
+class FakeLLMBackend:
+    """
+    Deterministic offline backend for tests and benchmarks.
+    Sleeps for a fixed latency and returns a canned Gemini-style response,
+    as JSON when a response schema is requested. Token counts are estimates.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms: float = LLM_FAKE_LATENCY_MS,
+                 scan_response: str = FAKE_SCAN_RESPONSE, text_response: str = FAKE_TEXT_RESPONSE):
+        self.latency = latency_ms / 1000.0
+        self.scan_response = scan_response
+        self.text_response = text_response
+        self.calls = 0
+
+    def _respond(self, request: LLMRequest) -> LLMResult:
+        self.calls += 1
+        parts = request.contents if isinstance(request.contents, list) else [request.contents]
+        images = sum(isinstance(part, dict) for part in parts)
+        if not images:
+            text = self.text_response
+        else:
+            text = FAKE_SCAN_JSON if request.schema is not None else self.scan_response
+        prompt_chars = len(request.system_instruction or "") + sum(len(part) for part in parts if isinstance(part, str))
+        return LLMResult(
+            text,
+            images * FAKE_IMAGE_TOKENS + prompt_chars // FAKE_CHARS_PER_TOKEN,
+            len(text) // FAKE_CHARS_PER_TOKEN,
+        )
+
+    def warm_up(self) -> None:
+        pass
+
+    def generate(self, request: LLMRequest) -> LLMResult:
+        time.sleep(self.latency)
+        return self._respond(request)
+
+    async def generate_async(self, request: LLMRequest) -> LLMResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(request)
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeLLMBackend,
+}
+
+
+class LLMClient:
+    """
+    Async front end for an LLM backend.
+    Caps concurrent calls with a semaphore and coalesces identical in-flight
+    requests, so concurrent uploads of the same scan with the same prompt
+    share one backend call. Records bytes sent, tokens used and latency per call.
+    """
+
+    def __init__(self, backend, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.lock = Lock()
+        self.completed = 0
+        self.totals = {"bytes_sent": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "call_seconds": 0.0}
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+    async def generate(self, request: LLMRequest) -> str:
+        key = request.key
+        if key is not None:
+            pending = self.in_flight.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                return await asyncio.shield(pending)
+
+        task = asyncio.ensure_future(self._call(request))
+        if key is not None:
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shield so one caller disconnecting does not cancel the call shared with others
+        return await asyncio.shield(task)
+
+    def generate_sync(self, request: LLMRequest) -> str:
+        """Blocking call for code running outside the event loop"""
+        self.calls += 1
+        start = time.perf_counter()
+        result = self.backend.generate(request)
+        self._record(request, result, time.perf_counter() - start)
+        return result.text
+
+    def warm_up(self) -> None:
+        self.backend.warm_up()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "backend": self.backend.name,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.in_flight),
+                "max_concurrency": self.max_concurrency,
+                **self.totals,
+                "average_bytes_sent": self.totals["bytes_sent"] / self.completed if self.completed else 0,
+                "average_call_seconds": self.totals["call_seconds"] / self.completed if self.completed else 0.0,
+                "recent_calls": list(self.recent),
+            }
+
+    def _record(self, request: LLMRequest, result: LLMResult, seconds: float) -> None:
+        record("llm", seconds)
+        call = {
+            "bytes_sent": request_bytes(request),
+            "prompt_tokens": result.prompt_tokens,
+            "output_tokens": result.output_tokens,
+            "cached_tokens": result.cached_tokens,
+            "seconds": round(seconds, 4),
+            "image": request.image,
+        }
+        with self.lock:
+            self.completed += 1
+            for name in ("bytes_sent", "prompt_tokens", "output_tokens", "cached_tokens"):
+                self.totals[name] += call[name]
+            self.totals["call_seconds"] += seconds
+            self.recent.append(call)
+
+    async def _call(self, request: LLMRequest) -> str:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            self.calls += 1
+            start = time.perf_counter()
+            result = await self.backend.generate_async(request)
+            self._record(request, result, time.perf_counter() - start)
+            return result.text
+
+
+llm_client = LLMClient(BACKENDS[LLM_BACKEND]())
@@ -0,0 +1,92 @@
+"""
+Image payload sent to the LLM.
+Uploads are downscaled to LLM_IMAGE_MAX_DIMENSION and re-encoded before they
+are base64-encoded; grayscale scans are encoded with one channel, and the
+upload is sent unchanged whenever re-encoding would not make it smaller.
+"""
+import base64
+import time
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from app.config import LLM_IMAGE_FORMAT, LLM_IMAGE_QUALITY, LLM_IMAGE_MAX_DIMENSION
+from app.utils.image_encoding import EncodeOptions, encode_array, fit_dimension
+from app.utils.scan_context import ScanContext
+
+PAYLOAD_OPTIONS = EncodeOptions(
+    format=LLM_IMAGE_FORMAT,
+    quality=LLM_IMAGE_QUALITY,
+    max_dimension=LLM_IMAGE_MAX_DIMENSION,
+    png_compression=None,
+)
+
+
+class ImagePayload(NamedTuple):
+    """Image part of an LLM request"""
+    data: str
+    mime_type: str
+    width: Optional[int]
+    height: Optional[int]
+    original_bytes: int
+    encoded_bytes: int
+    encode_ms: float
+    reencoded: bool
+
+    def part(self) -> dict:
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def report(self) -> dict:
+        return {
+            "mime_type": self.mime_type,
+            "width": self.width,
+            "height": self.height,
+            "original_bytes": self.original_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "encode_ms": round(self.encode_ms, 3),
+            "reencoded": self.reencoded,
+        }
+
+
+def payload_signature(options: EncodeOptions = PAYLOAD_OPTIONS) -> str:
+    """Identifies the payload settings, so cached LLM results are not reused across them"""
+    if options.format == "original":
+        return "original"
+    return f"{options.format}:{options.quality}:{options.max_dimension}"
+
+
+def _original(context: ScanContext, width: Optional[int] = None, height: Optional[int] = None) -> ImagePayload:
+    size = len(context.data)
+    return ImagePayload(context.base64, context.mime_type, width, height, size, size, 0.0, False)
+
+
+def prepare_image(context: ScanContext, options: EncodeOptions = PAYLOAD_OPTIONS) -> ImagePayload:
+    """Downscale and re-encode an upload for the LLM; CPU-bound, run off the event loop"""
+    if options.format == "original":
+        return _original(context)
+
+    start = time.perf_counter()
+    height, width = context.rgb.shape[:2]
+    image = fit_dimension(context.rgb, options.max_dimension)
+    resized = image.shape[:2] != (height, width)
+    if np.array_equal(image[..., 0], image[..., 1]) and np.array_equal(image[..., 1], image[..., 2]):
+        # Grayscale scan stored as RGB: one channel carries everything
+        image = np.ascontiguousarray(image[..., 0])
+    else:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    encoded = encode_array(image, options._replace(max_dimension=0))
+
+    if not resized and len(encoded.data) >= len(context.data):
+        # Already as small as it gets at this resolution
+        return _original(context, width, height)
+    return ImagePayload(
+        base64.b64encode(encoded.data).decode("utf-8"),
+        encoded.media_type,
+        encoded.width,
+        encoded.height,
+        len(context.data),
+        len(encoded.data),
+        (time.perf_counter() - start) * 1000,
+        True,
+    )
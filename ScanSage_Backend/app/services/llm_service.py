@@ -1,20 +1,16 @@
-import google.generativeai as genai
-import base64
-from app.config import GENAI_API_KEY
+import asyncio
+import hashlib
+from typing import Optional, Tuple
+from app.config import LLM_OUTPUT_FORMAT
+from app.services.llm_client import LLMRequest, llm_client
+from app.services.llm_payload import PAYLOAD_OPTIONS, payload_signature, prepare_image
+from app.utils.image_encoding import EncodeOptions
+from app.utils.metrics import timed, with_context
+from app.utils.ResponseParser import ScanAnalysis
+from app.utils.scan_context import ScanContext
 
-genai.configure(api_key=GENAI_API_KEY)
-
-
-def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str = None, message: str = None):
-    """
-    Unified function that analyzes a medical scan and optionally incorporates user message context.
-    This eliminates redundant API calls by combining analysis and chat in one request.
-    """
-    # Choose Gemini model
-    model = genai.GenerativeModel(model_name="gemini-1.5-pro")
-
-    # Base analysis prompt
-    base_prompt = """You are analyzing a medical scan image. Provide structured output with EXACTLY these fields:
+# Base analysis prompt
+BASE_PROMPT = """You are analyzing a medical scan image. Provide structured output with EXACTLY these fields:
     - Scan Type (MRI, CT Scan, X-ray)
     - Organ (Brain, Lung, Heart, Breast)
     - Tumor Type (Specify if detected)
@@ -25,15 +21,20 @@ def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str =
     Format your response using these EXACT field names with a colon after each field name.
     """
 
-    # If a message is provided, add it to the prompt for context
-    if message:
-        full_prompt = f"{base_prompt}\n\nAdditionally, the user has asked: {message}\n\nFirst provide the structured analysis, then answer their question."
-    else:
-        full_prompt = base_prompt
+# Scan analysis prompt for structured output; the response schema is ScanAnalysis
+JSON_PROMPT = """You are analyzing a medical scan image. Respond with a JSON object with these fields:
+    - scan_type (MRI, CT Scan, X-ray)
+    - organ (Brain, Lung, Heart, Breast)
+    - tumor_type (Specify if detected)
+    - tumor_subclass (If applicable)
+    - detailed_description (Size, shape, location)
+    - possible_causes (Genetic, environmental, lifestyle)
+    - clinical_insights (Medical observations)
+    - disclaimer (Note that this is not a medical diagnosis)
+    """
 
-    # Handle text-only queries
-    if image_data is None:
-        system_prompt = """You are a medical imaging assistant specializing in MRI, CT scans, and other medical imaging technologies.
+# Prompt for text-only queries
+SYSTEM_PROMPT = """You are a medical imaging assistant specializing in MRI, CT scans, and other medical imaging technologies.
         Your primary focus is helping users understand medical scans, tumor detection, and related medical concepts.
         Guidelines:
         1. Provide accurate, helpful information about medical imaging, tumors, and scan interpretation.
@@ -42,17 +43,98 @@ def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str =
         4. When discussing scan results, emphasize that these are computational analyses and not medical diagnoses.
         5. Always recommend consulting healthcare professionals for actual medical advice.
         """
-        full_prompt = f"{system_prompt}\n\nUser: {message}"
-        response = model.generate_content(full_prompt)
-        return response.text
-
-    # Generate response with image
-    response = model.generate_content(
-        [{
-            "mime_type": mime_type,
-            "data": base64.b64encode(image_data).decode("utf-8"),
-        },
-        full_prompt]
+
+
+def split_prompt(image_data=None, message: str = None, output_format: str = LLM_OUTPUT_FORMAT) -> Tuple[str, Optional[str]]:
+    """
+    (static instruction, per-request text) for a scan analysis, or for a
+    text-only query when there is no image. The instruction is the same for
+    every request of a kind and is sent as the model's system instruction.
+    """
+    # Handle text-only queries
+    if image_data is None:
+        return SYSTEM_PROMPT, f"User: {message}"
+
+    if output_format == "json":
+        if message:
+            return JSON_PROMPT, f"Additionally, the user has asked: {message}\n\nAnswer their question in the llm_response field."
+        return JSON_PROMPT, None
+
+    # If a message is provided, add it to the prompt for context
+    if message:
+        return BASE_PROMPT, f"Additionally, the user has asked: {message}\n\nFirst provide the structured analysis, then answer their question."
+    return BASE_PROMPT, None
+
+
+def build_prompt(image_data=None, message: str = None, output_format: str = LLM_OUTPUT_FORMAT) -> str:
+    """Full prompt text for a scan analysis, or for a text-only query when there is no image"""
+    instruction, text = split_prompt(image_data, message, output_format)
+    return instruction if text is None else f"{instruction}\n\n{text}"
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def llm_cache_variant(image_data=None, message: str = None) -> str:
+    """Cache variant of an analysis: the prompt and the image payload settings"""
+    return prompt_hash(build_prompt(image_data, message) + payload_signature())
+
+
+def response_schema(image_data=None, output_format: str = LLM_OUTPUT_FORMAT):
+    """Schema the response must follow, or None for free text"""
+    if image_data is not None and output_format == "json":
+        return ScanAnalysis
+    return None
+
+
+def build_request(image_data=None, mime_type: str = None, message: str = None,
+                  payload_options: EncodeOptions = PAYLOAD_OPTIONS) -> LLMRequest:
+    """
+    Build the Gemini request for a scan analysis or text-only query.
+    The image is downscaled and re-encoded by the payload optimizer, which is
+    CPU work; async callers run this off the event loop. The request key
+    identifies identical requests (image hash + prompt hash + payload settings).
+    """
+    instruction, text = split_prompt(image_data, message)
+    full_prompt = build_prompt(image_data, message)
+    if image_data is None:
+        return LLMRequest(text, instruction, key=("text", prompt_hash(full_prompt)))
+
+    context = ScanContext.ensure(image_data)
+    with timed("llm_payload"):
+        payload = prepare_image(context, payload_options)
+    if mime_type and not payload.reencoded:
+        payload = payload._replace(mime_type=mime_type)
+
+    contents = [payload.part()] if text is None else [payload.part(), text]
+    return LLMRequest(
+        contents,
+        instruction,
+        response_schema(image_data),
+        (context.content_hash, prompt_hash(full_prompt), payload_signature(payload_options)),
+        payload.report(),
     )
 
-    return response.text
+
+def analyze_medical_scan_with_context(image_data=None, mime_type: str = None, message: str = None):
+    """
+    Unified function that analyzes a medical scan and optionally incorporates user message context.
+    This eliminates redundant API calls by combining analysis and chat in one request.
+    image_data may be raw bytes or a ScanContext, whose decode is reused.
+    Blocking; async callers should use analyze_medical_scan_async.
+    """
+    return llm_client.generate_sync(build_request(image_data, mime_type, message))
+
+
+async def analyze_medical_scan_async(image_data=None, mime_type: str = None, message: str = None):
+    """
+    Non-blocking variant of analyze_medical_scan_with_context.
+    Identical in-flight requests share a single backend call.
+    """
+    if image_data is None:
+        request = build_request(None, None, message)
+    else:
+        loop = asyncio.get_running_loop()
+        request = await loop.run_in_executor(None, with_context(build_request, image_data, mime_type, message))
+    return await llm_client.generate(request)
@@ -0,0 +1,190 @@
+"""
+Model manifest: the versions of each organ classifier and how requests are
+routed to them. MODEL_MANIFEST points at a JSON file such as
+
+    {
+      "Brain": {
+        "primary": "v1",
+        "canary": {"v2": 0.1},
+        "shadow": ["v3"],
+        "versions": {
+          "v1": {"path": "models/brain_model.h5"},
+          "v2": {"path": "models/brain_v2.h5", "precision": "int8"},
+          "v3": {"path": "models/brain_v3.h5", "input_size": [380, 380],
+                 "preprocessing": {"interpolation": "linear", "scale": "symmetric"}}
+        }
+      },
+      "Lung": {
+        "ensemble": ["a", "b"],
+        "versions": {"a": {"path": "models/lung_a.h5"}, "b": {"path": "models/lung_b.h5"}}
+      }
+    }
+
+A version takes the organ's input size and labels, PREPROCESS_INTERPOLATION,
+[0, 1] scaling and the MODEL_PRECISION of the organ unless it sets its own.
+Routing, per organ:
+- primary: the version answering requests (may be omitted with one version)
+- canary: share of scans answered by another version instead, picked from
+  the content hash so a scan always meets the same version
+- shadow: versions sent a copy of the traffic off the critical path; their
+  agreement with the response is recorded, their output never returned
+- ensemble: versions whose probabilities are averaged into the response, in
+  place of primary and canary; they share input size, preprocessing and
+  labels, so one preprocessed tensor feeds them all
+Organs missing from the manifest, or all of them without MODEL_MANIFEST,
+serve a single version "v1" from BRAIN_MODEL_PATH / LUNG_MODEL_PATH /
+BREAST_MODEL_PATH.
+"""
+import json
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from app.config import (
+    BRAIN_MODEL_PATH,
+    LUNG_MODEL_PATH,
+    BREAST_MODEL_PATH,
+    MODEL_MANIFEST,
+    MODEL_PRECISION,
+    PREPROCESS_INTERPOLATION,
+)
+from app.services.quantization import PRECISIONS
+from app.utils.preprocessing import INTERPOLATIONS, SCALES, preprocess_batch
+
+# Classifier file, input size and class labels of each organ unless a version sets its own
+ORGAN_DEFAULTS = {
+    "Brain": (BRAIN_MODEL_PATH, (299, 299), ["Glioma", "Meningioma", "Pituitary Tumor", "Normal"]),
+    "Lung": (LUNG_MODEL_PATH, (224, 224), ["Benign", "Malignant", "Normal"]),
+    "Breast": (BREAST_MODEL_PATH, (244, 244), ["Benign", "Malignant"]),
+}
+# Name of the single version served for organs the manifest leaves out
+DEFAULT_VERSION = "v1"
+
+
+class ModelVersion(NamedTuple):
+    organ: str
+    version: str
+    path: str
+    input_size: Tuple[int, int]
+    labels: List[str]
+    interpolation: str
+    scale: str
+    precision: str
+
+    @property
+    def key(self) -> str:
+        """Registry and micro-batch queue key, e.g. "Brain:v2" """
+        return f"{self.organ}:{self.version}"
+
+    @property
+    def preprocessing(self) -> tuple:
+        """Versions with equal preprocessing can share one input tensor"""
+        return self.input_size, self.interpolation, self.scale
+
+    def preprocess(self, images, out=None) -> np.ndarray:
+        """Input tensor of this version for a batch of images (see preprocess_batch)"""
+        return preprocess_batch(images, self.input_size, out, self.interpolation, self.scale)
+
+
+class OrganRoute(NamedTuple):
+    primary: str
+    # Version -> share of scans it answers instead of the primary
+    canary: Dict[str, float]
+    shadow: List[str]
+    ensemble: List[str]
+
+    @property
+    def versions(self) -> List[str]:
+        """Every version the route sends requests to"""
+        return list(dict.fromkeys([self.primary, *self.canary, *self.shadow, *self.ensemble]))
+
+
+class ModelManifest(NamedTuple):
+    # By key ("Brain:v1")
+    models: Dict[str, ModelVersion]
+    # By organ
+    routes: Dict[str, OrganRoute]
+
+    def model(self, organ: str, version: str) -> ModelVersion:
+        return self.models[f"{organ}:{version}"]
+
+    def primary(self, organ: str) -> ModelVersion:
+        return self.model(organ, self.routes[organ].primary)
+
+
+def _version(organ: str, name: str, entry: dict) -> ModelVersion:
+    if "path" not in entry:
+        raise ValueError(f"Model {organ}:{name} has no path")
+    _, input_size, labels = ORGAN_DEFAULTS[organ]
+    preprocessing = entry.get("preprocessing", {})
+    model = ModelVersion(
+        organ=organ,
+        version=name,
+        path=entry["path"],
+        input_size=tuple(entry.get("input_size", input_size)),
+        labels=list(entry.get("labels", labels)),
+        interpolation=preprocessing.get("interpolation", PREPROCESS_INTERPOLATION),
+        scale=preprocessing.get("scale", "unit"),
+        precision=entry.get("precision", MODEL_PRECISION.get(organ, "float32")),
+    )
+    if len(model.input_size) != 2 or len(model.labels) < 2:
+        raise ValueError(f"Model {model.key} needs a [width, height] input size and at least two labels")
+    if model.interpolation not in INTERPOLATIONS or model.scale not in SCALES:
+        raise ValueError(f"Unsupported preprocessing for model {model.key}: {preprocessing}")
+    if model.precision not in PRECISIONS:
+        raise ValueError(f"Unsupported model precision: {model.key}={model.precision}")
+    return model
+
+
+def _route(organ: str, entry: dict, versions: Dict[str, ModelVersion]) -> OrganRoute:
+    ensemble = list(entry.get("ensemble", []))
+    primary = entry.get("primary") or (ensemble[0] if ensemble else None)
+    if primary is None and len(versions) == 1:
+        primary = next(iter(versions))
+    if primary is None:
+        raise ValueError(f"{organ} has several versions but no primary")
+    route = OrganRoute(
+        primary=primary,
+        canary={name: float(share) for name, share in entry.get("canary", {}).items()},
+        shadow=list(entry.get("shadow", [])),
+        ensemble=ensemble,
+    )
+
+    unknown = [name for name in route.versions if name not in versions]
+    if unknown:
+        raise ValueError(f"{organ} routes to undeclared versions: {', '.join(unknown)}")
+    if route.ensemble and route.canary:
+        raise ValueError(f"{organ}: an ensemble cannot have a canary")
+    if route.primary in route.canary or any(share < 0 for share in route.canary.values()) \
+            or sum(route.canary.values()) > 1:
+        raise ValueError(f"{organ}: canary shares must be other versions, each >= 0 and together <= 1")
+    serving = set(route.ensemble or [route.primary, *route.canary])
+    if serving & set(route.shadow):
+        raise ValueError(f"{organ}: a version cannot both answer requests and shadow them")
+    if len({(versions[name].preprocessing, tuple(versions[name].labels)) for name in route.ensemble}) > 1:
+        raise ValueError(f"{organ}: ensemble versions must share input size, preprocessing and labels")
+    return route
+
+
+def load_manifest(path: str = MODEL_MANIFEST) -> ModelManifest:
+    """Read and validate a manifest; raises ValueError for an inconsistent one"""
+    spec = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+    unknown = set(spec) - set(ORGAN_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown organs in {path}: {', '.join(sorted(unknown))}")
+
+    models, routes = {}, {}
+    for organ, (default_path, _, _) in ORGAN_DEFAULTS.items():
+        entry = spec.get(organ) or {"versions": {DEFAULT_VERSION: {"path": default_path}}}
+        versions = {name: _version(organ, name, version) for name, version in entry.get("versions", {}).items()}
+        if not versions:
+            raise ValueError(f"{organ} has no versions in {path}")
+        routes[organ] = _route(organ, entry, versions)
+        models.update((model.key, model) for model in versions.values())
+    return ModelManifest(models, routes)
+
+
+model_manifest = load_manifest()
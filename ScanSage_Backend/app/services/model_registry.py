@@ -0,0 +1,269 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.config import (
+    MODEL_MEMORY_LIMIT_MB,
+    MODEL_IDLE_TIMEOUT,
+    INFERENCE_BACKEND,
+    SAVED_MODEL_DIR,
+    QUANTIZED_MODEL_DIR,
+    TFLITE_THREADS,
+)
+from app.services.inference_engine import TFLiteEngine, load_engine
+from app.services.model_manifest import ModelVersion, model_manifest
+from app.services.quantization import check_variant, report_path, variant_path
+from app.utils.metrics import record
+
+logger = logging.getLogger(__name__)
+
+# File, input size and class labels of each organ's primary version
+MODEL_PATHS = {organ: model_manifest.primary(organ).path for organ in model_manifest.routes}
+MODEL_SPECS = {
+    organ: (model_manifest.primary(organ).input_size, model_manifest.primary(organ).labels)
+    for organ in model_manifest.routes
+}
+
+
+def file_version(path: str) -> str:
+    """Name, mtime and size of a file, or only its name when it is missing"""
+    try:
+        stat = os.stat(path)
+        return f"{os.path.basename(path)}-{int(stat.st_mtime)}-{stat.st_size}"
+    except OSError:
+        return os.path.basename(path)
+
+
+def _stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class _ModelEntry:
+    def __init__(self, engine, load_time: float, size_bytes: int):
+        self.engine = engine
+        self.load_time = load_time
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+
+
+class ModelRegistry:
+    """
+    Process-wide store of the classifier versions in the model manifest,
+    keyed like "Brain:v1" (see model_manifest.py).
+    Each model is deserialized once, on first use or during warm-up, and kept
+    resident until it is evicted for exceeding the memory cap or idle timeout.
+    get() returns a callable inference engine (see inference_engine.py).
+    Versions with a reduced precision get their TFLite variant when it passes
+    the accuracy gate (see quantization.py), the float model otherwise.
+    """
+
+    def __init__(self, versions: Dict[str, ModelVersion], max_memory_bytes: int = 0, idle_timeout: float = 0,
+                 backend: str = "graph", export_root: Optional[str] = None,
+                 quantized_root: str = QUANTIZED_MODEL_DIR, tflite_threads: int = 0):
+        self.versions = versions
+        self.backend = backend
+        self.export_root = export_root
+        self.quantized_root = quantized_root
+        self.tflite_threads = tflite_threads
+        # Why each version with a reduced precision serves its variant or the float model
+        self.variant_status: Dict[str, str] = {}
+        # Gate outcome per version for versions not loaded here, with the files it was decided on
+        self.gate_checks: Dict[str, Tuple[tuple, Optional[str]]] = {}
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_timeout = idle_timeout
+        self.models: "OrderedDict[str, _ModelEntry]" = OrderedDict()
+        self.lock = Lock()
+        self.load_locks = {key: Lock() for key in versions}
+        # Counters survive eviction so the stats show reload churn
+        self.load_counts = {key: 0 for key in versions}
+        self.evictions = {key: 0 for key in versions}
+
+    def get(self, key: str):
+        """Return the inference engine for a model version, loading it on first use"""
+        if key not in self.versions:
+            raise KeyError(f"Unknown model: {key}")
+
+        self.evict_idle()
+
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is not None:
+                return self._touch(key, entry)
+
+        # Load outside the registry lock so other models stay available;
+        # the per-model lock stops concurrent requests loading the same file twice
+        with self.load_locks[key]:
+            with self.lock:
+                entry = self.models.get(key)
+                if entry is not None:
+                    return self._touch(key, entry)
+
+            entry = self._load(key)
+
+            with self.lock:
+                self.models[key] = entry
+                self.load_counts[key] += 1
+                self._enforce_memory_limit(keep=key)
+                return self._touch(key, entry)
+
+    def warm_up(self, keys: Optional[Iterable[str]] = None) -> None:
+        """Eagerly load the given model versions (all of them by default)"""
+        for key in keys or self.versions:
+            self.get(key)
+
+    def evict(self, key: str) -> bool:
+        with self.lock:
+            return self._evict(key)
+
+    def evict_idle(self) -> None:
+        """Drop models that have not been used within the idle timeout"""
+        if not self.idle_timeout:
+            return
+        now = time.time()
+        with self.lock:
+            for key, entry in list(self.models.items()):
+                if now - entry.last_used > self.idle_timeout:
+                    self._evict(key)
+
+    def version(self, key: str) -> str:
+        """
+        Identify the engine serving a model version: the model file on disk
+        (name, mtime and size) and, when a reduced-precision variant serves it,
+        that variant file too. Results cached for one engine are then neither
+        served after a file is replaced nor mixed between float and variant.
+        """
+        spec = self.versions[key]
+        version = file_version(spec.path)
+        variant = self._serving_variant(key)
+        # A variant's probabilities differ slightly, so its results are cached apart
+        return version if variant is None else f"{version}-{spec.precision}-{file_version(variant)}"
+
+    def precision(self, key: str) -> str:
+        """Configured precision of a model version"""
+        return self.versions[key].precision
+
+    def resident_bytes(self) -> int:
+        with self.lock:
+            return sum(entry.size_bytes for entry in self.models.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model load time, hit count and resident size"""
+        with self.lock:
+            models = {}
+            for key, spec in self.versions.items():
+                entry = self.models.get(key)
+                models[key] = {
+                    "organ": spec.organ,
+                    "version": spec.version,
+                    "path": spec.path,
+                    "loaded": entry is not None,
+                    "backend": entry.engine.backend if entry else None,
+                    "precision": entry.engine.precision if entry else None,
+                    "configured_precision": spec.precision,
+                    "variant_status": self.variant_status.get(key),
+                    "load_time_seconds": entry.load_time if entry else None,
+                    "hits": entry.hits if entry else 0,
+                    "resident_bytes": entry.size_bytes if entry else 0,
+                    "idle_seconds": time.time() - entry.last_used if entry else None,
+                    "load_count": self.load_counts[key],
+                    "evictions": self.evictions[key],
+                }
+            return {
+                "resident_bytes": sum(entry.size_bytes for entry in self.models.values()),
+                "max_memory_bytes": self.max_memory_bytes,
+                "idle_timeout": self.idle_timeout,
+                "models": models,
+            }
+
+    def _load(self, key: str) -> _ModelEntry:
+        start = time.perf_counter()
+        engine = self._load_variant(key)
+        if engine is None:
+            engine = load_engine(
+                self.versions[key].path,
+                self.versions[key].input_size,
+                backend=self.backend,
+                export_root=self.export_root,
+            )
+        load_time = time.perf_counter() - start
+        record("model_load", load_time)
+        logger.info("Loaded %s model in %.2fs", key, load_time)
+        return _ModelEntry(engine, load_time, engine.size_bytes())
+
+    def _load_variant(self, key: str):
+        """The reduced-precision engine when one is configured and passes the gate, else None"""
+        spec = self.versions[key]
+        if spec.precision == "float32":
+            return None
+        variant, status = check_variant(spec.path, spec.precision, self.quantized_root)
+        self.variant_status[key] = status
+        if variant is None:
+            logger.warning("Serving the float32 %s model instead of %s: %s", key, spec.precision, status)
+            return None
+        engine = TFLiteEngine(variant, spec.input_size, spec.precision, self.tflite_threads)
+        engine.warm_up()
+        return engine
+
+    def _serving_variant(self, key: str) -> Optional[str]:
+        """
+        Variant file serving a version, or None for the float model: the
+        loaded engine's when it is resident, else what the gate would load
+        (re-checked only when one of its files changes)
+        """
+        spec = self.versions[key]
+        if spec.precision == "float32":
+            return None
+        with self.lock:
+            entry = self.models.get(key)
+        if entry is not None:
+            return entry.engine.model_path if entry.engine.backend == "tflite" else None
+
+        variant = variant_path(spec.path, spec.precision, self.quantized_root)
+        files = tuple(_stat(path) for path in (spec.path, variant, report_path(variant)))
+        checked = self.gate_checks.get(key)
+        if checked is None or checked[0] != files:
+            checked = (files, check_variant(spec.path, spec.precision, self.quantized_root)[0])
+            self.gate_checks[key] = checked
+        return checked[1]
+
+    def _touch(self, key: str, entry: _ModelEntry):
+        entry.hits += 1
+        entry.last_used = time.time()
+        self.models.move_to_end(key)
+        return entry.engine
+
+    def _evict(self, key: str) -> bool:
+        if self.models.pop(key, None) is None:
+            return False
+        self.evictions[key] += 1
+        return True
+
+    def _enforce_memory_limit(self, keep: str) -> None:
+        # Least recently used models are evicted first; the model just loaded is always kept
+        if not self.max_memory_bytes:
+            return
+        for key in list(self.models.keys()):
+            if sum(entry.size_bytes for entry in self.models.values()) <= self.max_memory_bytes:
+                break
+            if key != keep:
+                self._evict(key)
+
+
+model_registry = ModelRegistry(
+    model_manifest.models,
+    max_memory_bytes=MODEL_MEMORY_LIMIT_MB * 1024 * 1024,
+    idle_timeout=MODEL_IDLE_TIMEOUT,
+    backend=INFERENCE_BACKEND,
+    export_root=SAVED_MODEL_DIR,
+    quantized_root=QUANTIZED_MODEL_DIR,
+    tflite_threads=TFLITE_THREADS,
+)
@@ -0,0 +1,238 @@
+"""
+Routing of classifier requests across the versions in the model manifest:
+which versions answer an image (the primary, a canary, or an ensemble) and
+which shadows get a copy of it.
+"""
+import logging
+import random
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app.config import SHADOW_SAMPLE_RATE, SHADOW_MAX_PENDING
+from app.services.model_manifest import ModelManifest, ModelVersion, OrganRoute, model_manifest
+from app.services.model_registry import ModelRegistry, model_registry
+from app.utils.metrics import record
+
+logger = logging.getLogger(__name__)
+
+
+class Route(NamedTuple):
+    """The versions answering one request, and the shadows it is mirrored to"""
+    organ: str
+    served: List[ModelVersion]
+    shadow: List[ModelVersion]
+
+    @property
+    def model_version(self) -> str:
+        """Reported with the prediction, e.g. "v2", or "v1+v2" for an ensemble"""
+        return "+".join(model.version for model in self.served)
+
+    @property
+    def labels(self) -> List[str]:
+        return self.served[0].labels
+
+    def preprocess(self, images, out=None) -> np.ndarray:
+        """The input tensor shared by every served version"""
+        return self.served[0].preprocess(images, out)
+
+
+class ModelRouter:
+    """
+    Picks the versions that answer each classifier request. A canary is
+    chosen from a stable point derived from the routing key (the upload's
+    content hash), so the same scan always meets the same version and cached
+    results stay consistent.
+    """
+
+    def __init__(self, manifest: ModelManifest, registry: ModelRegistry):
+        self.manifest = manifest
+        self.registry = registry
+        self.lock = Lock()
+        # Requests answered per version
+        self.requests = {key: 0 for key in manifest.models}
+
+    def uses_canary(self, organ_type: str) -> bool:
+        """Whether route() needs a routing key for this organ"""
+        return bool(self.manifest.routes[organ_type].canary)
+
+    def route(self, organ_type: str, routing_key: Optional[str] = None) -> Route:
+        spec = self.manifest.routes[organ_type]
+        served = spec.ensemble or [self._pick(spec, routing_key)]
+        route = Route(
+            organ_type,
+            [self.manifest.model(organ_type, name) for name in served],
+            [self.manifest.model(organ_type, name) for name in spec.shadow],
+        )
+        with self.lock:
+            for model in route.served:
+                self.requests[model.key] += 1
+        return route
+
+    def version(self, organ_type: str) -> str:
+        """
+        Cache key part for an organ's predictions: the files of every version
+        that may answer, and the canary shares. Shadows never change a
+        response, so they are left out.
+        """
+        spec = self.manifest.routes[organ_type]
+        if spec.ensemble:
+            return "+".join(self._file_version(organ_type, name) for name in spec.ensemble)
+        version = self._file_version(organ_type, spec.primary)
+        for name, share in spec.canary.items():
+            version += f"|{share}:{self._file_version(organ_type, name)}"
+        return version
+
+    def warm_up(self, organ_types: Iterable[str]) -> None:
+        """Load every version the given organs route to, shadows included"""
+        for organ_type in organ_types:
+            for name in self.manifest.routes[organ_type].versions:
+                self.registry.get(self.manifest.model(organ_type, name).key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            requests = dict(self.requests)
+        return {
+            organ_type: {
+                "primary": spec.primary,
+                "canary": spec.canary,
+                "shadow": spec.shadow,
+                "ensemble": spec.ensemble,
+                "requests": {
+                    model.version: requests[key]
+                    for key, model in self.manifest.models.items() if model.organ == organ_type
+                },
+            }
+            for organ_type, spec in self.manifest.routes.items()
+        }
+
+    def _file_version(self, organ_type: str, name: str) -> str:
+        return self.registry.version(self.manifest.model(organ_type, name).key)
+
+    @staticmethod
+    def _pick(spec: OrganRoute, routing_key: Optional[str]) -> str:
+        if spec.canary and routing_key is not None:
+            # Stable point in [0, 1) per scan, walked across the canary shares
+            point = zlib.crc32(routing_key.encode()) / 0x100000000
+            for name, share in spec.canary.items():
+                if point < share:
+                    return name
+                point -= share
+        return spec.primary
+
+
+class ShadowRunner:
+    """
+    Mirrors classifier requests to the shadow versions of their route, off
+    the critical path. submit() only takes a slot and hands the work to one
+    background thread; that thread waits for the served output, runs each
+    shadow through its own micro-batch queue (on the served input tensor when
+    the preprocessing matches, else on a tensor it preprocesses itself) and
+    records how often the shadow's top-1 class agrees with the response.
+    Requests outside the sample rate, or arriving while max_pending mirrored
+    requests are still pending, are skipped rather than queued.
+    """
+
+    def __init__(self, run: Callable[[str, np.ndarray], Future], sample_rate: float = SHADOW_SAMPLE_RATE,
+                 max_pending: int = SHADOW_MAX_PENDING):
+        self.run = run
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self.lock = Lock()
+        self.pending = 0
+        self.skipped = 0
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def submit(self, route: Route, images: Sequence, inputs: np.ndarray, served: Future) -> None:
+        """
+        Mirror a request: `images` are its decoded images or raw bytes,
+        `inputs` the tensor the served versions got and `served` the future
+        of their output. Returns at once.
+        """
+        if not route.shadow or random.random() >= self.sample_rate:
+            return
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.skipped += 1
+                return
+            self.pending += 1
+        if any(model.preprocessing != route.served[0].preprocessing for model in route.shadow):
+            # The caller may release borrowed memory (a shared memory block, a volume) before the shadow runs
+            images = [np.array(image) if isinstance(image, np.ndarray) and not image.flags.owndata else image
+                      for image in images]
+        self.executor.submit(self._mirror, route, images, inputs, served)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "skipped": self.skipped,
+                "versions": {
+                    key: {
+                        "images": result["images"],
+                        "agreement": result["agreed"] / result["images"] if result["images"] else None,
+                        "max_probability_diff": result["max_probability_diff"],
+                        "failed": result["failed"],
+                        "average_ms": result["seconds"] * 1000 / result["runs"] if result["runs"] else None,
+                    }
+                    for key, result in self.results.items()
+                },
+            }
+
+    def _mirror(self, route: Route, images: Sequence, inputs: np.ndarray, served: Future) -> None:
+        try:
+            try:
+                expected = np.asarray(served.result())
+            except Exception:
+                # The request failed; there is no response to compare with
+                return
+            for model in route.shadow:
+                self._compare(route, model, images, inputs, expected)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def _compare(self, route: Route, model: ModelVersion, images: Sequence, inputs: np.ndarray,
+                 expected: np.ndarray) -> None:
+        start = time.perf_counter()
+        try:
+            if model.preprocessing != route.served[0].preprocessing:
+                inputs = model.preprocess(images)
+            actual = np.asarray(self.run(model.key, inputs).result())
+        except Exception as e:
+            logger.warning("Shadow model %s failed: %s", model.key, e)
+            with self.lock:
+                self._result(model.key)["failed"] += 1
+            return
+        seconds = time.perf_counter() - start
+        record("shadow_classifier", seconds)
+
+        # Compared by label name, so a shadow may order or extend its classes differently
+        agreed = sum(
+            route.labels[want] == model.labels[got]
+            for want, got in zip(expected.argmax(axis=1), actual.argmax(axis=1))
+        )
+        diff = float(np.abs(expected - actual).max()) if model.labels == route.labels else None
+        with self.lock:
+            result = self._result(model.key)
+            result["runs"] += 1
+            result["images"] += len(actual)
+            result["agreed"] += agreed
+            result["seconds"] += seconds
+            if diff is not None:
+                result["max_probability_diff"] = max(result["max_probability_diff"] or 0.0, diff)
+
+    def _result(self, key: str) -> Dict[str, float]:
+        return self.results.setdefault(key, {
+            "runs": 0, "images": 0, "agreed": 0, "failed": 0, "seconds": 0.0, "max_probability_diff": None,
+        })
+
+
+model_router = ModelRouter(model_manifest, model_registry)
@@ -0,0 +1,134 @@
+"""
+Encoding and transport of the heatmap / ROI images in responses.
+Images can be sent as base64 in the JSON (the default), as binary parts of a
+multipart/mixed response, or stored and referenced by URL.
+"""
+import base64
+import json
+import uuid
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Query
+from fastapi.responses import JSONResponse, Response
+
+from app.config import (
+    OUTPUT_IMAGE_FORMAT,
+    OUTPUT_IMAGE_QUALITY,
+    OUTPUT_MAX_DIMENSION,
+    OUTPUT_PNG_COMPRESSION,
+    OUTPUT_TRANSPORT,
+)
+from app.utils.cache import artifact_cache
+from app.utils.image_encoding import EncodeOptions, EncodedImage, transcode_png
+from app.utils.metrics import timed
+
+TRANSPORTS = ("base64", "multipart", "url")
+ARTIFACT_PATH = "/api/artifacts"
+
+
+def output_options(
+        image_format: str = Query(OUTPUT_IMAGE_FORMAT, pattern="^(png|webp|jpeg)$"),
+        quality: int = Query(OUTPUT_IMAGE_QUALITY, ge=1, le=100),
+        max_dimension: int = Query(OUTPUT_MAX_DIMENSION, ge=0),
+        png_compression: Optional[int] = Query(OUTPUT_PNG_COMPRESSION, ge=0, le=9),
+        transport: str = Query(OUTPUT_TRANSPORT, pattern="^(base64|multipart|url)$"),
+) -> Tuple[EncodeOptions, str]:
+    """Query parameters shared by the endpoints that return images, defaulting to the OUTPUT_* settings"""
+    return EncodeOptions(image_format, quality, max_dimension, png_compression), transport
+
+
+class ImageRenderer:
+    """
+    Encodes the images of one response and records what each one cost.
+    render() returns the value placed in the JSON body:
+      - base64: the encoded image as a base64 string
+      - url: the path of a stored copy under /api/artifacts
+      - multipart: "cid:<name>", the Content-ID of a binary part sent after the JSON
+    """
+
+    def __init__(self, options: EncodeOptions = EncodeOptions(), transport: str = OUTPUT_TRANSPORT):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unsupported transport: {transport}")
+        self.options = options
+        self.transport = transport
+        # Images of one response may be rendered from several executor threads
+        self.lock = Lock()
+        self.parts: List[Tuple[str, EncodedImage]] = []
+        self.image_bytes = 0
+        self.encode_ms = 0.0
+
+    def render(self, name: str, png: Optional[bytes]) -> Tuple[Optional[Any], Optional[dict]]:
+        """(JSON value, encoding report) for one PNG from the ROI stage; None stays None"""
+        if png is None:
+            return None, None
+
+        encoded = transcode_png(png, self.options)
+        if self.transport == "base64":
+            value = base64.b64encode(encoded.data).decode("utf-8")
+            sent = len(value)
+        elif self.transport == "url":
+            digest = artifact_cache.store(encoded.data, encoded.media_type)
+            value = f"{ARTIFACT_PATH}/{digest}"
+            sent = len(encoded.data)
+        else:
+            with self.lock:
+                name = f"{name}-{len(self.parts)}"
+                self.parts.append((name, encoded))
+            value = f"cid:{name}"
+            sent = len(encoded.data)
+
+        with self.lock:
+            self.image_bytes += sent
+            self.encode_ms += encoded.encode_ms
+        return value, {
+            "format": encoded.extension,
+            "width": encoded.width,
+            "height": encoded.height,
+            "bytes": len(encoded.data),
+            "transferred_bytes": sent,
+            "encode_ms": round(encoded.encode_ms, 3),
+        }
+
+    def render_all(self, images: Dict[str, Optional[bytes]]) -> Tuple[Dict[str, Any], Dict[str, dict]]:
+        """Render several named images; returns (values, reports) keyed by name"""
+        values, reports = {}, {}
+        with timed("heatmap_encode"):
+            for name, png in images.items():
+                values[name], report = self.render(name, png)
+                if report is not None:
+                    reports[name] = report
+        return values, reports
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "X-Image-Bytes": str(self.image_bytes),
+            "X-Image-Encode-Ms": f"{self.encode_ms:.3f}",
+        }
+
+    def response(self, body: dict, status_code: int = 200) -> Response:
+        """JSON response, or multipart/mixed with the JSON first and one part per image"""
+        if self.transport != "multipart":
+            return JSONResponse(content=body, status_code=status_code, headers=self.headers())
+
+        boundary = uuid.uuid4().hex
+        chunks = [
+            f"--{boundary}\r\nContent-Type: application/json\r\nContent-ID: <response>\r\n\r\n".encode(),
+            json.dumps(body).encode(),
+            b"\r\n",
+        ]
+        for name, encoded in self.parts:
+            chunks += [
+                f"--{boundary}\r\nContent-Type: {encoded.media_type}\r\nContent-ID: <{name}>\r\n"
+                f"Content-Disposition: inline; filename=\"{name}.{encoded.extension}\"\r\n"
+                f"Content-Length: {len(encoded.data)}\r\n\r\n".encode(),
+                encoded.data,
+                b"\r\n",
+            ]
+        chunks.append(f"--{boundary}--\r\n".encode())
+        return Response(
+            content=b"".join(chunks),
+            status_code=status_code,
+            media_type=f"multipart/mixed; boundary={boundary}",
+            headers=self.headers(),
+        )
@@ -0,0 +1,133 @@
+"""
+Reduced-precision variants of the organ classifiers and their accuracy gate.
+A variant is a TFLite file under QUANTIZED_MODEL_DIR, written with an
+evaluation report by tools.quantize_models. The registry serves it for an
+organ only when MODEL_PRECISION selects it and the report shows, for the
+float model currently on disk and for this exact variant file, a top-1
+agreement of at least QUANTIZATION_MIN_AGREEMENT over at least
+QUANTIZATION_MIN_IMAGES images. Otherwise the float model is served and the
+reason is reported in /api/models.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import QUANTIZED_MODEL_DIR, QUANTIZATION_MIN_AGREEMENT, QUANTIZATION_MIN_IMAGES
+
+PRECISIONS = ("float32", "float16", "dynamic_int8", "int8")
+# Disagreeing images listed in a report
+REPORTED_DISAGREEMENTS = 20
+
+
+def variant_path(model_path: str, precision: str, root: str = QUANTIZED_MODEL_DIR) -> str:
+    """e.g. models/quantized/brain_model.int8.tflite"""
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(root, f"{name}.{precision}.tflite")
+
+
+def report_path(variant: str) -> str:
+    """e.g. models/quantized/brain_model.int8.eval.json"""
+    return os.path.splitext(variant)[0] + ".eval.json"
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_variant(model_path: str, precision: str, root: str = QUANTIZED_MODEL_DIR,
+                  min_agreement: float = QUANTIZATION_MIN_AGREEMENT,
+                  min_images: int = QUANTIZATION_MIN_IMAGES) -> Tuple[Optional[str], str]:
+    """
+    (variant path, "active") when the variant passes the gate, else
+    (None, why it was refused)
+    """
+    variant = variant_path(model_path, precision, root)
+    if not os.path.exists(variant):
+        return None, f"no {precision} variant at {variant}"
+    try:
+        with open(report_path(variant), encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None, f"no readable evaluation report at {report_path(variant)}"
+
+    if report.get("images", 0) < min_images:
+        return None, f"evaluated on {report.get('images', 0)} images, {min_images} required"
+    if report.get("agreement", 0.0) < min_agreement:
+        return None, f"top-1 agreement {report.get('agreement', 0.0):.4f} is below {min_agreement}"
+    if report.get("variant_sha256") != file_digest(variant):
+        return None, "variant file changed since it was evaluated"
+    if report.get("source_sha256") != file_digest(model_path):
+        return None, "float model changed since the variant was evaluated"
+    return variant, "active"
+
+
+def evaluate(reference, candidate, batches: Iterable[Tuple[List[str], np.ndarray]], labels: List[str]) -> dict:
+    """
+    Top-1 agreement of `candidate` with `reference` (inference engines) over
+    (names, float32 batch) pairs, with probability drift, per-class agreement
+    and time per image of both engines.
+    """
+    images, agreed = 0, 0
+    per_class = {label: [0, 0] for label in labels}
+    max_diff, total_diff = 0.0, 0.0
+    reference_seconds, candidate_seconds = 0.0, 0.0
+    disagreements = []
+
+    for names, batch in batches:
+        start = time.perf_counter()
+        expected = np.asarray(reference(batch))
+        reference_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = np.asarray(candidate(batch))
+        candidate_seconds += time.perf_counter() - start
+
+        expected_top, actual_top = expected.argmax(axis=1), actual.argmax(axis=1)
+        diff = np.abs(expected - actual)
+        max_diff = max(max_diff, float(diff.max()))
+        total_diff += float(diff.max(axis=1).sum())
+        for name, want, got in zip(names, expected_top, actual_top):
+            images += 1
+            per_class[labels[want]][1] += 1
+            if want == got:
+                agreed += 1
+                per_class[labels[want]][0] += 1
+            elif len(disagreements) < REPORTED_DISAGREEMENTS:
+                disagreements.append({"image": name, "reference": labels[want], "variant": labels[got]})
+
+    return {
+        "images": images,
+        "agreement": agreed / images if images else 0.0,
+        "agreement_per_class": {label: hits / count for label, (hits, count) in per_class.items() if count},
+        "mean_max_probability_diff": total_diff / images if images else 0.0,
+        "max_probability_diff": max_diff,
+        "reference_ms_per_image": reference_seconds * 1000 / images if images else 0.0,
+        "variant_ms_per_image": candidate_seconds * 1000 / images if images else 0.0,
+        "disagreements": disagreements,
+    }
+
+
+def write_report(model_path: str, variant: str, precision: str, evaluation: dict,
+                 min_agreement: float = QUANTIZATION_MIN_AGREEMENT,
+                 min_images: int = QUANTIZATION_MIN_IMAGES) -> dict:
+    """Store the evaluation next to the variant, bound to both files by their SHA-256"""
+    report = {
+        **evaluation,
+        "precision": precision,
+        "source": os.path.basename(model_path),
+        "source_sha256": file_digest(model_path),
+        "variant_sha256": file_digest(variant),
+        "evaluated_at": time.time(),
+        "min_agreement": min_agreement,
+        "passed": evaluation["agreement"] >= min_agreement and evaluation["images"] >= min_images,
+    }
+    with open(report_path(variant), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
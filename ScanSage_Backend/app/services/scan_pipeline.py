@@ -0,0 +1,313 @@
+"""
+Cached pipeline stages shared by the routers.
+Each stage has its own cache namespace and returns (result, cached) so callers
+can report which stages were reused.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import SPECULATIVE_CLASSIFIER, ORGAN_DETECTOR_ENABLED
+from app.services.admission import Overloaded, admission
+from app.services.classification_service import resolve_organ
+from app.services.execution import execution_backend
+from app.services.llm_service import analyze_medical_scan_async, llm_cache_variant
+from app.services.model_registry import MODEL_SPECS
+from app.services.model_router import model_router
+from app.services.output_service import ImageRenderer
+from app.utils.cache import roi_cache, prediction_cache, llm_cache
+from app.utils.image_validator import is_medical_scan
+from app.utils.metrics import timed
+from app.utils.organ_detector import organ_detector
+from app.utils.RegionOfIntrest import RoiResult
+from app.utils.ResponseParser import parse_scan_result
+from app.utils.scan_context import ScanContext
+
+# Bumped when the shape of cached ROI results changes, so older entries are not reused
+ROI_CACHE_VARIANT = "regions"
+
+
+async def run_roi(context: ScanContext) -> Tuple[RoiResult, bool]:
+    """ROI and heatmap PNG bytes plus every detected region, keyed by image hash"""
+    cached = roi_cache.get(context, ROI_CACHE_VARIANT)
+    if cached is not None:
+        return cached, True
+
+    async with admission.slot("opencv"):
+        with timed("roi"):
+            result = await execution_backend.roi(context)
+    roi_cache.set(context, result, ROI_CACHE_VARIANT)
+    return result, False
+
+
+async def run_pre_classifier(context: ScanContext) -> Optional[dict]:
+    """
+    Millisecond local medical / organ decision, made before any expensive stage.
+    Returns None when the pre-classifier is disabled.
+    """
+    if not ORGAN_DETECTOR_ENABLED:
+        return None
+    async with admission.slot("opencv"):
+        with timed("pre_classifier"):
+            return await execution_backend.run(lambda: organ_detector.detect(context.decode().rgb, context.filename))
+
+
+async def run_prediction(context: ScanContext, organ_type: str) -> Tuple[dict, bool]:
+    """Classifier prediction, keyed by image hash, organ and the versions that may answer it"""
+    organ_type = resolve_organ(organ_type)
+    variant = f"{organ_type}:{model_router.version(organ_type)}"
+    cached = prediction_cache.get(context, variant)
+    if cached is not None:
+        return cached, True
+
+    async with admission.slot("cnn"):
+        with timed("classifier"):
+            result = await execution_backend.predict(context, organ_type)
+    prediction_cache.set(context, result, variant)
+    return result, False
+
+
+async def run_llm(context: ScanContext, message: Optional[str] = None) -> Tuple[str, bool]:
+    """Raw LLM analysis text, keyed by image hash, prompt hash and image payload settings"""
+    variant = llm_cache_variant(context, message)
+    cached = llm_cache.get(context, variant)
+    if cached is not None:
+        return cached, True
+
+    async with admission.slot("llm"):
+        result = await analyze_medical_scan_async(context, context.mime_type, message)
+    llm_cache.set(context, result, variant)
+    return result, False
+
+
+class SpeculationStats:
+    """Counters for speculative classification, exposed at /api/models/speculation"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def record(self, hit: bool, saved: float) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.saved_seconds += saved
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "mode": SPECULATIVE_CLASSIFIER,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "critical_path_saved_seconds": self.saved_seconds,
+            "average_saved_seconds": self.saved_seconds / total if total else 0.0,
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+async def _speculate(context: ScanContext, organ_type: str):
+    start = time.perf_counter()
+    try:
+        result = await run_prediction(context, organ_type)
+    except Overloaded:
+        # Shed speculative work under load; the classifier runs after the LLM instead
+        return None
+    return result, start, time.perf_counter()
+
+
+def speculative_organs(decision: Optional[dict] = None) -> List[str]:
+    """Organs to classify before the LLM has named one"""
+    if SPECULATIVE_CLASSIFIER == "detector":
+        if decision and decision["organ"]:
+            return [decision["organ"]]
+        return list(MODEL_SPECS)
+    if SPECULATIVE_CLASSIFIER == "all":
+        return list(MODEL_SPECS)
+    return []
+
+
+def start_speculative_predictions(context: ScanContext, decision: Optional[dict] = None) -> Dict[str, asyncio.Task]:
+    """
+    Start the classifier for candidate organs while the LLM call is in flight.
+    Requests for the same organ across images share batched forward passes.
+    """
+    return {
+        organ_type: asyncio.ensure_future(_speculate(context, organ_type))
+        for organ_type in speculative_organs(decision)
+    }
+
+
+async def resolve_prediction(speculative: Dict[str, asyncio.Task], context: ScanContext, organ_type: str,
+                             llm_done: float) -> Tuple[dict, bool, dict]:
+    """
+    Reconcile speculative predictions with the organ the LLM reported.
+    On a hit the speculative result is used and the time the classifier ran
+    alongside the LLM is reported as critical-path time saved; on a miss the
+    classifier runs after the LLM as before. Unused speculative work is cancelled.
+    """
+    task = speculative.pop(organ_type, None)
+    for other in speculative.values():
+        other.cancel()
+    outcome = await task if task is not None else None
+
+    if outcome is None:
+        prediction_result, prediction_cached = await run_prediction(context, organ_type)
+        report = {"speculative": False, "hit": False, "critical_path_saved_seconds": 0.0}
+        if speculative or task is not None:
+            speculation_stats.record(False, 0.0)
+            report["speculative"] = True
+        return prediction_result, prediction_cached, report
+
+    (prediction_result, prediction_cached), started, finished = outcome
+    # Time the classifier would have added after the LLM, minus the time we still waited for it
+    waited = max(0.0, finished - llm_done)
+    saved = max(0.0, (finished - started) - waited)
+    speculation_stats.record(True, saved)
+    return prediction_result, prediction_cached, {
+        "speculative": True,
+        "hit": True,
+        "critical_path_saved_seconds": round(saved, 4),
+    }
+
+
+async def analyze_scan(context: ScanContext, message: Optional[str] = None,
+                       renderer: Optional[ImageRenderer] = None) -> dict:
+    """
+    Full per-image pipeline used by /api/chat and the batch endpoint:
+    a local pre-classifier that rejects non-scans, then ROI, LLM and speculative
+    classification concurrently, then the classifier result for the organ the
+    LLM reports.
+    Heatmap and ROI are encoded by `renderer` (base64 PNG by default).
+    Returns the image's entry for the response, including errors.
+    """
+    renderer = renderer or ImageRenderer()
+    speculative = {}
+    stages = []
+    try:
+        # Reject obvious non-scans before paying for Gemini, ROI and the classifier (ORGAN_DETECTOR_REJECT)
+        decision = await run_pre_classifier(context)
+        if decision is not None and decision["rejected"]:
+            return {
+                "filename": context.filename,
+                "error": "Not a medical scan",
+                "pre_classifier": decision
+            }
+
+        # ROI and LLM run concurrently; each stage is served from its own cache
+        # when possible, so a new question about a known image only re-runs the LLM
+        roi_future = asyncio.ensure_future(run_roi(context))
+        llm_future = asyncio.ensure_future(run_llm(context, message))
+        stages = [roi_future, llm_future]
+        # The classifier is the largest CPU cost, so keep it off the LLM's critical path
+        speculative = start_speculative_predictions(context, decision)
+
+        # Wait for parallel tasks to complete
+        roi_result, roi_cached = await roi_future
+        raw_results, llm_cached = await llm_future
+        llm_done = time.perf_counter()
+
+        # Single-pass parse (or schema validation) takes microseconds; no need for a thread
+        structured_result = parse_scan_result(raw_results)
+
+        if not is_medical_scan(context.data, structured_result):
+            return {
+                "filename": context.filename,
+                "error": "Not a medical scan"
+            }
+
+        organ_type = structured_result.get("organ", "").strip().capitalize()
+        if organ_type not in ["Brain", "Lung", "Breast"]:
+            # Prefer the local pre-classifier's organ over a blind default
+            organ_type = (decision or {}).get("organ") or "Brain"
+
+        prediction_result, prediction_cached, pipeline_report = await resolve_prediction(
+            speculative,
+            context,
+            organ_type,
+            llm_done
+        )
+
+        async with admission.slot("opencv"):
+            images, encoding = await execution_backend.run(
+                renderer.render_all,
+                {"heatmap": roi_result.heatmap, "roi": roi_result.roi}
+            )
+
+        analysis_result = {
+            "llm_analysis": structured_result,
+            "tumor_prediction": prediction_result,
+            "heatmap": images["heatmap"],
+            "roi": images["roi"],
+            "regions": roi_result.regions,
+            "encoding": encoding
+        }
+
+        return {
+            "filename": context.filename,
+            "analysis": analysis_result,
+            "source": "cache" if roi_cached and llm_cached and prediction_cached else "processed",
+            "pipeline": pipeline_report,
+            "pre_classifier": decision
+        }
+
+    except Overloaded:
+        # Shed load: the caller answers 503 with Retry-After
+        raise
+    except Exception as e:
+        return {
+            "filename": context.filename,
+            "error": str(e)
+        }
+    finally:
+        # When one stage fails the others may still be running (and holding
+        # their admission slots): cancel them, and retrieve failures nobody awaited
+        for task in [*stages, *speculative.values()]:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+
+async def chat_response(contexts: List[ScanContext], message: str, renderer: Optional[ImageRenderer] = None) -> dict:
+    """Response of /api/chat: every image analyzed concurrently, then the answer to the message"""
+    renderer = renderer or ImageRenderer()
+    response = {
+        "message": "",
+        "image_analysis": []
+    }
+
+    if contexts:
+        # Hash, decoded arrays and base64 payload are computed once and shared by every stage
+        tasks = [asyncio.ensure_future(analyze_scan(context, message, renderer)) for context in contexts]
+        try:
+            response["image_analysis"] = await asyncio.gather(*tasks)
+        except Overloaded:
+            # One image was refused: stop the others rather than finish work nobody will read
+            for task in tasks:
+                task.cancel()
+            raise
+
+    if message and not response["message"]:
+        async with admission.slot("llm"):
+            response["message"] = await analyze_medical_scan_async(None, None, message)
+
+    return response
+
+
+async def analyze_upload(context: ScanContext) -> Tuple[dict, int]:
+    """Response body and status code of /api/analyze: the parsed LLM analysis of one scan"""
+    # Reject non-scans locally before calling Gemini (ORGAN_DETECTOR_REJECT)
+    decision = await run_pre_classifier(context)
+    if decision is not None and decision["rejected"]:
+        return {"error": "Not a medical scan", "pre_classifier": decision}, 422
+
+    # Process the image directly from memory
+    raw_result, _ = await run_llm(context)
+
+    # Convert the raw markdown (or JSON) result into structured JSON
+    return {"analysis_result": parse_scan_result(raw_result)}, 200
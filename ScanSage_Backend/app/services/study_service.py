@@ -0,0 +1,208 @@
+"""
+Analysis of multi-slice studies (DICOM series, NIfTI, .npy stacks).
+ROI extraction and the classifier run across slices in batches of
+STUDY_SLICE_BATCH, and the per-slice results are aggregated into one
+per-study report.
+"""
+import asyncio
+import hashlib
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.config import STUDY_SLICE_BATCH
+from app.services.admission import admission
+from app.services.classification_service import classify_and_mirror, format_prediction, resolve_organ
+from app.services.execution import execution_backend
+from app.services.model_registry import MODEL_SPECS
+from app.services.model_router import Route, model_router
+from app.services.output_service import ImageRenderer
+from app.utils.cache import study_cache
+from app.utils.metrics import timed
+from app.utils.organ_detector import organ_detector
+from app.utils.RegionOfIntrest import extract_roi, find_regions
+from app.utils.scan_context import ScanContext
+from app.utils.volume import DICOM_MIME, Volume, load_volume
+
+# Class reported for slices without a tumor; Breast has no such class
+NO_TUMOR_LABEL = "Normal"
+
+
+def slice_batches(count: int, size: int = STUDY_SLICE_BATCH) -> List[Tuple[int, int]]:
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def _regions_for_slices(slices: np.ndarray, start: int, stop: int) -> List[list]:
+    return [find_regions(slices[k]) for k in range(start, stop)]
+
+
+async def _find_regions(slices: np.ndarray, start: int, stop: int, fan_out: asyncio.Semaphore) -> List[list]:
+    async with fan_out, admission.slot("opencv"):
+        with timed("roi"):
+            return await execution_backend.run(_regions_for_slices, slices, start, stop)
+
+
+async def _classify_slices(slices: np.ndarray, route: Route, fan_out: asyncio.Semaphore) -> np.ndarray:
+    async with fan_out, admission.slot("cnn"):
+        with timed("classifier_preprocess"):
+            batch = await execution_backend.run(route.preprocess, slices)
+        # Goes through the micro-batcher like single images, so it shares forward passes with them
+        with timed("classifier_predict"):
+            return await asyncio.wrap_future(classify_and_mirror(route, slices, batch))
+
+
+def choose_organ(volume: Volume, organ_type: Optional[str]) -> Tuple[str, str]:
+    """(organ, how it was chosen): from the request, else the pre-classifier on the middle slice"""
+    if organ_type:
+        return resolve_organ(organ_type.strip().capitalize()), "request"
+    decision = organ_detector.detect(volume.slices[len(volume.slices) // 2], "study")
+    if decision["organ"]:
+        return decision["organ"], "pre_classifier"
+    return "Brain", "default"
+
+
+def aggregate_study(volume: Volume, labels: List[str], probabilities: np.ndarray, regions: List[list]) -> dict:
+    """
+    Per-slice results plus the study summary: the slice with the most confident
+    tumor prediction (which also gives the study-level prediction), the number
+    of slices predicted as tumor, and the tumor-area curve across slices.
+    """
+    tumor_classes = [i for i, label in enumerate(labels) if label != NO_TUMOR_LABEL]
+    tumor_probability = probabilities[:, tumor_classes].max(axis=1)
+    predicted = probabilities.argmax(axis=1)
+    areas = [sum(region["area"] for region in slice_regions) for slice_regions in regions]
+
+    slices = [{
+        "index": k,
+        "position": volume.positions[k],
+        "predicted_class": labels[predicted[k]],
+        "confidence_level": float(probabilities[k].max()),
+        "tumor_probability": float(tumor_probability[k]),
+        "tumor_area": areas[k],
+        "regions": len(regions[k]),
+    } for k in range(len(volume.slices))]
+
+    key = int(tumor_probability.argmax())
+    peak_area = int(np.argmax(areas)) if any(areas) else None
+    return {
+        "study_prediction": format_prediction(probabilities[key:key + 1], labels),
+        "max_confidence_slice": {
+            "index": key,
+            "position": volume.positions[key],
+            "predicted_class": labels[tumor_classes[int(probabilities[key, tumor_classes].argmax())]],
+            "tumor_probability": float(tumor_probability[key]),
+        },
+        "tumor_slices": int(sum(labels[p] != NO_TUMOR_LABEL for p in predicted)),
+        "tumor_area_curve": areas,
+        "peak_area_slice": peak_area,
+        "slices": slices,
+    }
+
+
+async def analyze_volume(volume: Volume, organ_type: Optional[str] = None,
+                         routing_key: Optional[str] = None) -> Tuple[dict, object]:
+    """
+    Run ROI and the classifier over every slice, batch by batch, both stages
+    concurrently. Every slice goes to the same model versions, picked once
+    for the study from `routing_key`. Returns (report, ROI result of the
+    max-confidence slice).
+    """
+    timings = {}
+    organ_type, organ_source = choose_organ(volume, organ_type)
+    route = model_router.route(organ_type, routing_key)
+    batches = slice_batches(len(volume.slices))
+
+    # A large study queues no more batches at a stage than the stage runs at once,
+    # so it waits its turn instead of filling the stage's queue by itself
+    roi_fan_out = asyncio.Semaphore(admission.stages["opencv"].limit or len(batches))
+    classifier_fan_out = asyncio.Semaphore(admission.stages["cnn"].limit or len(batches))
+
+    start = time.perf_counter()
+    roi_tasks = [_find_regions(volume.slices, first, last, roi_fan_out) for first, last in batches]
+    classifier_tasks = [
+        _classify_slices(volume.slices[first:last], route, classifier_fan_out) for first, last in batches
+    ]
+    roi_results, outputs = await asyncio.gather(asyncio.gather(*roi_tasks), asyncio.gather(*classifier_tasks))
+    timings["slices_seconds"] = round(time.perf_counter() - start, 3)
+
+    regions = [slice_regions for batch in roi_results for slice_regions in batch]
+    report = aggregate_study(volume, route.labels, np.concatenate([np.asarray(output) for output in outputs]), regions)
+
+    key = report["max_confidence_slice"]["index"]
+    async with admission.slot("opencv"):
+        with timed("roi"):
+            key_roi = await execution_backend.run(extract_roi, volume.slices[key])
+
+    report.update({
+        "organ": organ_type,
+        "organ_source": organ_source,
+        "model_version": route.model_version,
+        "study": {
+            "source": volume.source,
+            "slices": len(volume.slices),
+            "height": int(volume.slices.shape[1]),
+            "width": int(volume.slices.shape[2]),
+            "slice_batch": STUDY_SLICE_BATCH,
+            **volume.metadata,
+        },
+        "timings": timings,
+    })
+    return report, key_roi
+
+
+def study_key(contexts: List[ScanContext]) -> bytes:
+    """
+    Cache key input for a study: the hashes of its files. A DICOM series is
+    ordered by slice position whatever the upload order, so its hashes are
+    sorted; other images are slices in upload order, which the key keeps.
+    """
+    hashes = [context.content_hash for context in contexts]
+    if all(context.mime_type == DICOM_MIME for context in contexts):
+        hashes.sort()
+    return "".join(hashes).encode()
+
+
+async def run_study(contexts: List[ScanContext], organ_type: Optional[str] = None,
+                    window: Optional[Tuple[float, float]] = None,
+                    renderer: Optional[ImageRenderer] = None) -> dict:
+    """
+    Full study pipeline for /api/study/scan, cached per set of files, requested
+    organ, window and model versions. The heatmap and ROI of the
+    max-confidence slice are encoded by `renderer`.
+    Raises ValueError when the uploads are not a readable study.
+    """
+    renderer = renderer or ImageRenderer()
+    key = study_key(contexts)
+    versions = "|".join(model_router.version(organ) for organ in MODEL_SPECS)
+    variant = hashlib.sha256(f"{organ_type or 'auto'}:{window}:{versions}".encode()).hexdigest()
+
+    cached = study_cache.get(key, variant)
+    if cached is not None:
+        report, key_roi = cached
+        source = "cache"
+    else:
+        start = time.perf_counter()
+        async with admission.slot("opencv"):
+            with timed("volume_load"):
+                volume = await execution_backend.run(load_volume, contexts, window)
+        load_seconds = round(time.perf_counter() - start, 3)
+        report, key_roi = await analyze_volume(volume, organ_type, key.decode())
+        report["timings"]["load_seconds"] = load_seconds
+        study_cache.set(key, (report, key_roi), variant)
+        source = "processed"
+
+    async with admission.slot("opencv"):
+        images, encoding = await execution_backend.run(
+            renderer.render_all, {"heatmap": key_roi.heatmap, "roi": key_roi.roi}
+        )
+    return {
+        **report,
+        "key_slice": {
+            "index": report["max_confidence_slice"]["index"],
+            **images,
+            "regions": key_roi.regions,
+            "encoding": encoding,
+        },
+        "source": source,
+    }
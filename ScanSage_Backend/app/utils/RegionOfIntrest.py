@@ -1,76 +1,244 @@
 import cv2
 import numpy as np
 import base64
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.config import ROI_PYRAMID_MIN_SIDE, ROI_PYRAMID_SIZE, ROI_TILE_SIZE
+from app.utils.preprocessing import decode_image, to_grayscale
+from app.utils.scan_context import ScanContext
+
+# Orange and red in OpenCV's HSV space (hue 0-180), the colours JET gives to tumor-bright tissue
+TUMOR_HSV_RANGES = (
+    ((10, 100, 100), (25, 255, 255)),   # orange
+    ((0, 100, 100), (10, 255, 255)),    # red
+    ((170, 100, 100), (180, 255, 255)),  # red (hue wraps around)
+)
+# Minimum contour area threshold to avoid noise
+MIN_REGION_AREA = 50
+MORPH_KERNEL = np.ones((5, 5), np.uint8)
+# Furthest a pixel can move through the close + open passes (four 5x5 operations)
+MORPH_REACH = 4 * (MORPH_KERNEL.shape[0] // 2)
+# Downscale per pyramid level when searching large images for candidates
+POOL_STEP = 4
+
+
+class RoiResult(NamedTuple):
+    """ROI extraction output, as stored in the ROI cache"""
+    roi: Optional[bytes]
+    heatmap: bytes
+    regions: List[Dict[str, int]]
+
+
+def _build_tumor_lut() -> np.ndarray:
+    """
+    256-entry lookup table marking the gray levels that the JET colormap turns
+    orange or red. JET maps each intensity to one fixed colour, so the
+    colormap -> HSV -> inRange chain reduces to a per-intensity table and the
+    mask can be computed from the grayscale image in a single pass.
+    """
+    levels = np.arange(256, dtype=np.uint8).reshape(1, 256)
+    hsv = cv2.cvtColor(cv2.applyColorMap(levels, cv2.COLORMAP_JET), cv2.COLOR_BGR2HSV)
+    lut = np.zeros((1, 256), np.uint8)
+    for lower, upper in TUMOR_HSV_RANGES:
+        lut |= cv2.inRange(hsv, np.array(lower), np.array(upper))
+    return lut
+
+
+TUMOR_LUT = _build_tumor_lut()
+
 
 def process_mri_image(image_data):
     """
     Processes an MRI image to detect tumors and generate a heatmap.
-    Returns the ROI and heatmap as encoded images.
+    Returns the ROI and heatmap as base64 encoded PNG images.
 
     Parameters:
-        image_data (bytes): Raw image data.
+        image_data (bytes, np.ndarray or ScanContext): See process_mri_image_png.
 
     Returns:
         tuple: (roi_base64, heatmap_base64), where:
             - roi_base64 (str or None): Base64 encoded ROI image, None if no tumor detected.
             - heatmap_base64 (str): Base64 encoded heatmap image.
     """
-    # Convert bytes to numpy array
-    nparr = np.frombuffer(image_data, np.uint8)
+    roi_png, heatmap_png = process_mri_image_png(image_data)
+    return encode_base64(roi_png), encode_base64(heatmap_png)
+
+
+def encode_base64(png):
+    """Base64 encode PNG bytes for a JSON response; None stays None"""
+    if png is None:
+        return None
+    return base64.b64encode(png).decode('utf-8')
+
+
+def process_mri_image_png(image_data):
+    """
+    Processes an MRI image to detect tumors and generate a heatmap.
+    Returns the ROI and heatmap as raw PNG bytes.
 
-    # Decode the image
-    mri_image = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    if mri_image is None:
-        raise ValueError("Error: Image not found or unable to load.")
+    Parameters:
+        image_data (bytes, np.ndarray or ScanContext): Raw image data, an image
+            already decoded by app.utils.preprocessing.decode_image, or the
+            upload's ScanContext.
 
-    # Apply the JET colormap
-    jet_colored = cv2.applyColorMap(mri_image, cv2.COLORMAP_JET)
+    Returns:
+        tuple: (roi_png, heatmap_png), where:
+            - roi_png (bytes or None): PNG encoded ROI image, None if no tumor detected.
+            - heatmap_png (bytes): PNG encoded heatmap image.
+    """
+    result = extract_roi(image_data)
+    return result.roi, result.heatmap
 
-    # Convert to HSV to isolate the orange and red colors
-    hsv_image = cv2.cvtColor(jet_colored, cv2.COLOR_BGR2HSV)
 
-    # Define color ranges for tumor detection
-    lower_orange = np.array([10, 100, 100])
-    upper_orange = np.array([25, 255, 255])
-    lower_red1 = np.array([0, 100, 100])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([170, 100, 100])
-    upper_red2 = np.array([180, 255, 255])
+def extract_roi(image_data) -> RoiResult:
+    """
+    ROI extraction used by the pipeline: the largest region's crop, the JET
+    heatmap and every significant region, largest first, as
+    {"x", "y", "width", "height", "area"} in full-resolution pixels.
 
-    # Create masks for the tumor regions
-    mask_orange = cv2.inRange(hsv_image, lower_orange, upper_orange)
-    mask_red1 = cv2.inRange(hsv_image, lower_red1, upper_red1)
-    mask_red2 = cv2.inRange(hsv_image, lower_red2, upper_red2)
-    mask_red = cv2.bitwise_or(mask_red1, mask_red2)
-    combined_mask = cv2.bitwise_or(mask_orange, mask_red)
+    Parameters:
+        image_data (bytes, np.ndarray or ScanContext): See process_mri_image_png.
+    """
+    # Decode the image, or reuse the decode shared with the classifier
+    if isinstance(image_data, ScanContext):
+        mri_image = image_data.gray
+    elif isinstance(image_data, np.ndarray):
+        mri_image = to_grayscale(image_data)
+    else:
+        mri_image = decode_image(image_data, mode="gray")
 
-    # Apply morphological operations for noise reduction
-    kernel = np.ones((5, 5), np.uint8)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
+    regions = find_regions(mri_image)
+
+    roi_png = None
+    if regions:
+        largest = regions[0]
+        roi = mri_image[largest["y"]:largest["y"] + largest["height"], largest["x"]:largest["x"] + largest["width"]]
+
+        # Encode ROI as PNG
+        _, buffer = cv2.imencode('.png', roi)
+        roi_png = buffer.tobytes()
 
-    # Find contours to detect the largest region
-    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    max_area = 0
-    max_contour = None
+    # The heatmap is the one full-resolution colour image still produced
+    _, buffer = cv2.imencode('.png', cv2.applyColorMap(mri_image, cv2.COLORMAP_JET))
+    heatmap_png = buffer.tobytes()
 
+    return RoiResult(roi_png, heatmap_png, regions)
+
+
+def tumor_mask(gray: np.ndarray) -> np.ndarray:
+    """Pixels whose JET colour is orange or red, as a 0/255 mask"""
+    return cv2.LUT(gray, TUMOR_LUT)
+
+
+def find_regions(gray: np.ndarray) -> List[Dict[str, int]]:
+    """
+    Bounding boxes and areas of the tumor-coloured regions above MIN_REGION_AREA,
+    largest first.
+
+    Images smaller than ROI_PYRAMID_MIN_SIDE are cleaned and traced in one pass.
+    Larger ones are scanned in tiles of ROI_TILE_SIZE rows for a max-pooled
+    candidate map on a coarse pyramid level, and morphology and contour tracing
+    only run in full-resolution windows around the candidates. The windows are
+    padded so that the result matches the single-pass path exactly.
+    """
+    height, width = gray.shape
+    if max(height, width) < ROI_PYRAMID_MIN_SIDE:
+        contours = _trace(_clean(tumor_mask(gray)))
+    else:
+        contours = []
+        for window, owned in _candidate_windows(gray):
+            mask = tumor_mask(gray[window])
+            if owned is not None:
+                mask &= owned
+            contours.extend(_trace(_clean(mask), (window[1].start, window[0].start)))
+
+    regions = []
     for contour in contours:
         area = cv2.contourArea(contour)
-        if area > max_area:
-            max_area = area
-            max_contour = contour
+        if area > MIN_REGION_AREA:
+            x, y, w, h = cv2.boundingRect(contour)
+            regions.append({"x": x, "y": y, "width": w, "height": h, "area": int(area)})
+    # Stable sort keeps findContours order among equal areas, as the single largest-contour pick did
+    regions.sort(key=lambda region: region["area"], reverse=True)
+    return regions
 
-    roi_base64 = None
-    if max_contour is not None and max_area > 50:  # Minimum area threshold to avoid noise
-        x, y, w, h = cv2.boundingRect(max_contour)
-        roi = mri_image[y:y + h, x:x + w]
 
-        # Encode ROI as base64
-        _, buffer = cv2.imencode('.png', roi)
-        roi_base64 = base64.b64encode(buffer).decode('utf-8')
+def _clean(mask: np.ndarray) -> np.ndarray:
+    # Apply morphological operations for noise reduction
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MORPH_KERNEL)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL)
+
+
+def _trace(mask: np.ndarray, offset: Tuple[int, int] = (0, 0)) -> list:
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    return list(contours)
+
 
-    # Encode heatmap as base64
-    _, buffer = cv2.imencode('.png', jet_colored)
-    heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
+def pyramid_factor(height: int, width: int, target: int = ROI_PYRAMID_SIZE) -> int:
+    """Power-of-four downscale that brings the longer side to at most `target`"""
+    factor = 1
+    while max(height, width) > target * factor:
+        factor *= POOL_STEP
+    return factor
+
+
+def _max_pool(mask: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Downscale a 0/255 mask by `factor`, setting a cell when any pixel in it is set.
+    Each step is an integer INTER_AREA resize by POOL_STEP: a single set pixel
+    averages to at least 255 / 16, so thresholding the mean above zero is an
+    exact max pool.
+    """
+    while factor > 1:
+        height, width = mask.shape
+        bottom, right = -height % POOL_STEP, -width % POOL_STEP
+        if bottom or right:
+            mask = cv2.copyMakeBorder(mask, 0, bottom, 0, right, cv2.BORDER_CONSTANT, value=0)
+        mask = cv2.resize(mask, (mask.shape[1] // POOL_STEP, mask.shape[0] // POOL_STEP), interpolation=cv2.INTER_AREA)
+        _, mask = cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY)
+        factor //= POOL_STEP
+    return mask
+
+
+def candidate_map(gray: np.ndarray, factor: int, tile_rows: int = ROI_TILE_SIZE) -> np.ndarray:
+    """
+    Max-pooled tumor mask at 1/factor resolution: a cell is set when any pixel
+    in it is tumor-coloured, so no region smaller than a cell is missed.
+    The image is thresholded in tiles of rows, so the full-resolution mask is
+    never held in memory at once.
+    """
+    height, width = gray.shape
+    step = max(tile_rows // factor, 1) * factor
+    tiles = [_max_pool(tumor_mask(gray[top:top + step]), factor) for top in range(0, height, step)]
+    return np.vstack(tiles) if len(tiles) > 1 else tiles[0]
+
+
+def _candidate_windows(gray: np.ndarray):
+    """
+    Yield (window, owned) pairs covering every candidate region: `window` is a
+    pair of slices into the full-resolution image and `owned` masks out pixels
+    belonging to other candidates whose windows overlap it (None when no other
+    candidate reaches into the window).
+
+    Candidates are connected components of the coarse map grown by more than
+    twice MORPH_REACH, so tumor pixels close enough to interact in the
+    morphology passes always share a candidate, and every window extends at
+    least MORPH_REACH past its candidate's pixels.
+    """
+    height, width = gray.shape
+    factor = pyramid_factor(height, width)
+    low = candidate_map(gray, factor)
+    grow = -(-(2 * MORPH_REACH + 1) // factor)
+    grown = cv2.dilate(low, np.ones((2 * grow + 1, 2 * grow + 1), np.uint8))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(grown, connectivity=8)
 
-    return roi_base64, heatmap_base64
\ No newline at end of file
+    for label in range(1, count):
+        x, y, w, h = stats[label, :4]
+        window = (slice(y * factor, min((y + h) * factor, height)), slice(x * factor, min((x + w) * factor, width)))
+        cells = labels[y:y + h, x:x + w]
+        owned = None
+        if np.any((cells != label) & (cells != 0)):
+            # Another candidate's bounding box reaches into this window
+            owned = cv2.resize(np.where(cells == label, 255, 0).astype(np.uint8), (w * factor, h * factor),
+                               interpolation=cv2.INTER_NEAREST)
+            owned = owned[:window[0].stop - window[0].start, :window[1].stop - window[1].start]
+        yield window, owned
@@ -1,62 +1,151 @@
 import re
+from bisect import bisect_left
+
+from pydantic import TypeAdapter, ValidationError
+from typing_extensions import NotRequired, TypedDict
+
+from app.config import LLM_OUTPUT_FORMAT
+from app.utils.metrics import timed
+
+# Define the expected fields
+EXPECTED_FIELDS = [
+    "Scan Type",
+    "Organ",
+    "Tumor Type",
+    "Tumor Subclass",
+    "Detailed Description",
+    "Possible Causes",
+    "Clinical Insights"
+]
+
+# Field name -> snake_case key in the JSON result
+FIELD_KEYS = {field: field.lower().replace(' ', '_') for field in EXPECTED_FIELDS}
+
+# Phrases that introduce the answer to the user's question, after the structured analysis
+USER_RESPONSE_MARKERS = ["To answer your question", "In response to your question", "Regarding your question"]
+
+# Every marker the parser looks for, so one scan over the response finds all of them.
+# A field name followed by a colon is also where the previous field's value ends.
+TOKENS = re.compile(
+    r"(?P<field>" + "|".join(re.escape(field) for field in EXPECTED_FIELDS) + r")(?P<colon>\s*:)?"
+    r"|(?P<disclaimer>Disclaimer)"
+    r"|(?P<question>" + "|".join(re.escape(marker) for marker in USER_RESPONSE_MARKERS) + r")"
+)
+# Colon and bold markers between a field name and its value
+HEADER_END = re.compile(r"\s*:?\*?\*?\s*")
+DISCLAIMER_END = re.compile(r"\s*:?\s*")
+MARKUP = str.maketrans({"*": " ", "\n": " "})
+
+
+class ScanAnalysis(TypedDict):
+    """Schema of a structured-output (JSON) scan analysis"""
+    scan_type: str
+    organ: str
+    tumor_type: str
+    tumor_subclass: str
+    detailed_description: str
+    possible_causes: str
+    clinical_insights: str
+    disclaimer: NotRequired[str]
+    llm_response: NotRequired[str]
+
+
+SCAN_ANALYSIS = TypeAdapter(ScanAnalysis)
+
+
+def clean_value(value: str) -> str:
+    """Remove mark-down emphasis and newlines, collapse whitespace and drop trailing hyphens"""
+    value = " ".join(value.translate(MARKUP).split())
+    if value.endswith("-"):
+        value = value.rstrip("-").rstrip(" ")
+    return value
+
+
+def _value_end(raw_result: str, start: int, header: int) -> int:
+    # The next header's leading whitespace and up to two bold markers are not part of the value
+    end = header
+    while end > start and raw_result[end - 1].isspace():
+        end -= 1
+    for _ in range(2):
+        if end > start and raw_result[end - 1] == "*":
+            end -= 1
+    return end
 
 
 def parse_medical_scan_result(raw_result: str) -> dict:
     """
     Parse the raw markdown-formatted LLM response into a structured JSON.
-    Removes trailing hyphens and other inconsistencies.
+    A single scan finds every field header; each field's value is the text
+    between its first header and the next header, cleaned of mark-down,
+    extra whitespace and trailing hyphens.
     """
-    # Define the expected fields
-    expected_fields = [
-        "Scan Type",
-        "Organ",
-        "Tumor Type",
-        "Tumor Subclass",
-        "Detailed Description",
-        "Possible Causes",
-        "Clinical Insights"
-    ]
+    first = {}
+    headers = []
+    disclaimer = question = None
+    for token in TOKENS.finditer(raw_result):
+        field = token.group("field")
+        if field is not None:
+            first.setdefault(field, token.end("field"))
+            if token.group("colon") is not None:
+                headers.append(token.start())
+        elif token.group("disclaimer") is not None:
+            if disclaimer is None:
+                disclaimer = token.end()
+        elif question is None:
+            question = token.end()
 
     result_dict = {}
-
-    # Try to extract information using regex patterns
-    for field in expected_fields:
-        # Look for field name followed by colon and any text until the next field or end
-        pattern = rf"\*?\*?\s*{re.escape(field)}\s*:?\*?\*?\s*(.*?)(?=\*?\*?\s*(?:{"|".join([re.escape(f) for f in expected_fields])})\s*:|\Z)"
-        match = re.search(pattern, raw_result, re.DOTALL)
-        if match:
-            # Clean up the extracted text
-            value = match.group(1).strip()
-            # Remove mark-down formatting and extra whitespace
-            value = re.sub(r'\*\*|\*|\n+', ' ', value)
-            value = re.sub(r'\s+', ' ', value).strip()
-            # Remove trailing hyphens and any surrounding whitespace
-            value = re.sub(r'\s*-+\s*$', '', value)
-            # Convert field name to snake_case for JSON
-            field_key = field.lower().replace(' ', '_')
-            result_dict[field_key] = value
-        else:
+    for field in EXPECTED_FIELDS:
+        field_end = first.get(field)
+        if field_end is None:
             # If field not found, include it as empty
-            field_key = field.lower().replace(' ', '_')
-            result_dict[field_key] = ""
+            result_dict[FIELD_KEYS[field]] = ""
+            continue
+        start = HEADER_END.match(raw_result, field_end).end()
+        index = bisect_left(headers, start)
+        end = _value_end(raw_result, start, headers[index]) if index < len(headers) else len(raw_result)
+        result_dict[FIELD_KEYS[field]] = clean_value(raw_result[start:end])
 
     # Add a disclaimer field if present in the original text
-    disclaimer_pattern = r"(?:Disclaimer|Important\s+Disclaimer)\s*:?\s*(.*?)(?=\Z)"
-    disclaimer_match = re.search(disclaimer_pattern, raw_result, re.DOTALL)
-    if disclaimer_match:
-        disclaimer_text = disclaimer_match.group(1).strip()
-        disclaimer_text = re.sub(r'\*\*|\*|\n+', ' ', disclaimer_text)
-        disclaimer_text = re.sub(r'\s+', ' ', disclaimer_text).strip()
-        # Remove trailing hyphens here too
-        disclaimer_text = re.sub(r'\s*-+\s*$', '', disclaimer_text)
-        result_dict["disclaimer"] = disclaimer_text
+    if disclaimer is not None:
+        start = DISCLAIMER_END.match(raw_result, disclaimer).end()
+        result_dict["disclaimer"] = clean_value(raw_result[start:])
 
     # Extract any additional response to the user's question (after the structured analysis)
-    user_response_pattern = r"(?:To answer your question|In response to your question|Regarding your question).*?:(.*?)(?=\Z)"
-    user_response_match = re.search(user_response_pattern, raw_result, re.DOTALL)
-    if user_response_match:
-        response_text = user_response_match.group(1).strip()
-        response_text = re.sub(r'\s+', ' ', response_text).strip()
-        result_dict["llm_response"] = response_text
+    if question is not None:
+        colon = raw_result.find(":", question)
+        if colon != -1:
+            result_dict["llm_response"] = " ".join(raw_result[colon + 1:].split())
 
     return result_dict
+
+
+def parse_structured_scan_result(raw_result: str) -> dict:
+    """
+    Validate a JSON response requested with the ScanAnalysis schema and return
+    it in the same shape as parse_medical_scan_result.
+    Falls back to the markdown parser when the response does not match the schema.
+    """
+    text = raw_result.strip()
+    if text.startswith("```"):
+        # Tolerate a fenced code block around the JSON
+        text = text.strip("`").removeprefix("json")
+    try:
+        analysis = SCAN_ANALYSIS.validate_json(text)
+    except ValidationError:
+        return parse_medical_scan_result(raw_result)
+
+    result_dict = {key: clean_value(analysis[key]) for key in FIELD_KEYS.values()}
+    if analysis.get("disclaimer"):
+        result_dict["disclaimer"] = clean_value(analysis["disclaimer"])
+    if analysis.get("llm_response"):
+        result_dict["llm_response"] = " ".join(analysis["llm_response"].split())
+    return result_dict
+
+
+def parse_scan_result(raw_result: str, output_format: str = LLM_OUTPUT_FORMAT) -> dict:
+    """Parse an LLM scan analysis requested in `output_format` ("text" or "json")"""
+    with timed("parse"):
+        if output_format == "json":
+            return parse_structured_scan_result(raw_result)
+        return parse_medical_scan_result(raw_result)
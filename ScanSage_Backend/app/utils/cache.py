@@ -1,61 +1,236 @@
 import hashlib
+import os
+import pickle
+import sqlite3
 import time
+from collections import OrderedDict
 from typing import Dict, Tuple, Any, Optional, List
 from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
+from threading import Lock, Thread
+from app.config import CACHE_MAX_SIZE, CACHE_TTL_SECONDS, CACHE_DB_PATH, CACHE_DISK_MAX_ENTRIES, CACHE_SWEEP_INTERVAL
+from app.utils.metrics import timed
+from app.utils.scan_context import ScanContext
+
+
+class DiskCache:
+    """
+    SQLite-backed cache tier shared by every worker process on the host.
+    Values are pickled, so bytes (e.g. PNG heatmaps) are stored as raw blobs.
+    The database file is local server state and must not be writable by clients.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, expiration_time: float = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.expiration_time = expiration_time
+        self.lock = Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL lets readers in other workers proceed while one worker writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL, value BLOB NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """(created timestamp, value) of a live entry, or None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT created, value FROM entries WHERE key = ? AND created > ?",
+                (key, now - self.expiration_time),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return row[0], pickle.loads(row[1])
+
+    def set(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, created, accessed, value) VALUES (?, ?, ?, ?)",
+                (key, now, now, sqlite3.Binary(blob)),
+            )
+
+    def sweep(self, prefix: str = "") -> int:
+        """
+        Delete expired entries, then the least recently used ones above max_entries.
+        A key prefix limits the sweep to one namespace.
+        """
+        low, high = _prefix_range(prefix)
+        with self.lock:
+            removed = self.conn.execute(
+                "DELETE FROM entries WHERE key >= ? AND key < ? AND created <= ?",
+                (low, high, time.time() - self.expiration_time),
+            ).rowcount
+            removed += self.conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries WHERE key >= ? AND key < ? ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (low, high, self.max_entries),
+            ).rowcount
+        return removed
+
+    def count(self, prefix: str = "") -> int:
+        low, high = _prefix_range(prefix)
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE key >= ? AND key < ?", (low, high)
+            ).fetchone()[0]
+
+
+def _prefix_range(prefix: str) -> Tuple[str, str]:
+    # Keys starting with prefix sort in [prefix, prefix with its last character incremented)
+    if not prefix:
+        return "", "\U0010ffff"
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
 
 class ImageCache:
-    def __init__(self, max_size=100, expiration_time=3600, max_workers=4):
-        self.cache: Dict[str, Tuple[float, Any]] = {}
+    """
+    Two-tier result cache keyed by the SHA-256 of the image.
+    The first tier is a thread-safe in-memory LRU with O(1) get/set; the
+    optional second tier is a DiskCache shared by all workers, so results
+    survive restarts. Expired entries are swept in the background.
+
+    A namespace keeps the results of different pipeline stages apart, and the
+    optional variant passed to get/set distinguishes results for the same
+    image that depend on stage parameters (organ, model version, prompt).
+    """
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, expiration_time=CACHE_TTL_SECONDS, max_workers=4,
+                 disk_path: Optional[str] = CACHE_DB_PATH, disk_max_entries: int = CACHE_DISK_MAX_ENTRIES,
+                 sweep_interval: float = CACHE_SWEEP_INTERVAL, namespace: str = ""):
+        self.namespace = namespace
+        self.cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
         self.max_size = max_size
         self.expiration_time = expiration_time
         self.lock = Lock()
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_workers = max_workers
+        self.executor = None
+        self.disk = DiskCache(disk_path, disk_max_entries, expiration_time) if disk_path else None
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        if sweep_interval:
+            Thread(target=self._sweep_loop, args=(sweep_interval,), name="cache-sweeper", daemon=True).start()
 
-    def _generate_key(self, image_data: bytes) -> str:
+    def _generate_key(self, image_data, variant: str = "") -> str:
         """Generate a unique key for the image data using SHA-256"""
-        return hashlib.sha256(image_data).hexdigest()
+        if isinstance(image_data, ScanContext):
+            # Reuse the hash computed once for the upload
+            key = image_data.content_hash
+        else:
+            key = hashlib.sha256(image_data).hexdigest()
+        if self.namespace:
+            key = f"{self.namespace}:{key}"
+        if variant:
+            key = f"{key}:{variant}"
+        return key
 
-    def get(self, image_data: bytes) -> Optional[Any]:
+    def get(self, image_data, variant: str = "") -> Optional[Any]:
         """Retrieve cached result if it exists and hasn't expired"""
         if image_data is None:
             return None
 
-        key = self._generate_key(image_data)
-        if key in self.cache:
-            timestamp, result = self.cache[key]
-            if time.time() - timestamp < self.expiration_time:
-                return result
-            else:
+        with timed("cache_lookup"):
+            return self._get(self._generate_key(image_data, variant))
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                timestamp, result = entry
+                if time.time() - timestamp < self.expiration_time:
+                    self.cache.move_to_end(key)
+                    self.hits["memory"] += 1
+                    return result
                 # Remove expired entry
                 del self.cache[key]
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                created, result = entry
+                # Promote to memory so repeat reads skip SQLite; it expires with the disk entry
+                self._set_memory(key, result, created)
+                with self.lock:
+                    self.hits["disk"] += 1
+                return result
+
+        with self.lock:
+            self.misses += 1
         return None
 
-    def set(self, image_data: bytes, result: Any) -> None:
+    def set(self, image_data, result: Any, variant: str = "") -> None:
         """Cache the result with current timestamp"""
         if image_data is None:
             return
 
-        key = self._generate_key(image_data)
-        self.cache[key] = (time.time(), result)
+        key = self._generate_key(image_data, variant)
+        self._set_memory(key, result)
+        if self.disk is not None:
+            self.disk.set(key, result)
+
+    def sweep(self) -> int:
+        """Remove expired entries from both tiers"""
+        cutoff = time.time() - self.expiration_time
+        with self.lock:
+            expired = [key for key, (timestamp, _) in self.cache.items() if timestamp <= cutoff]
+            for key in expired:
+                del self.cache[key]
+        removed = len(expired)
+        if self.disk is not None:
+            removed += self.disk.sweep(f"{self.namespace}:" if self.namespace else "")
+        return removed
 
-        # If cache exceeds max size, remove oldest entries
-        if len(self.cache) > self.max_size:
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k][0])
-            del self.cache[oldest_key]
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = sum(self.hits.values()) + self.misses
+            return {
+                "namespace": self.namespace,
+                "memory_entries": len(self.cache),
+                "disk_entries": self.disk.count(f"{self.namespace}:" if self.namespace else "") if self.disk is not None else None,
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_ratio": sum(self.hits.values()) / lookups if lookups else 0.0,
+            }
+
+    def _set_memory(self, key: str, result: Any, created: Optional[float] = None) -> None:
+        with self.lock:
+            self.cache[key] = (time.time() if created is None else created, result)
+            self.cache.move_to_end(key)
+            # If cache exceeds max size, remove the least recently used entry
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def _sweep_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                # Another worker holding the write lock; retry next interval
+                pass
 
     def process_batch(self, images: List[bytes], process_func) -> List[Any]:
         """
         Process multiple images concurrently
         """
-        results = []
-        
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
         def process_single(image: bytes) -> Any:
             # Check cache first
             result = self.get(image)
             if result is not None:
                 return result
-            
+
             # Process and cache if not found
             result = process_func(image)
             self.set(image, result)
@@ -64,9 +239,41 @@ class ImageCache:
         # Process images concurrently
         futures = [self.executor.submit(process_single, img) for img in images]
         results = [future.result() for future in futures]
-        
+
         return results
 
     def __del__(self):
         """Cleanup executor on deletion"""
-        self.executor.shutdown(wait=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class ArtifactCache(ImageCache):
+    """
+    Encoded response images served by reference from /api/artifacts.
+    Entries are content addressed, so a URL always returns the same bytes
+    and can be cached by clients for the cache lifetime.
+    """
+
+    def store(self, data: bytes, media_type: str) -> str:
+        """Keep an encoded image and return its digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        self._set_memory(self._digest_key(digest), (media_type, data))
+        if self.disk is not None:
+            self.disk.set(self._digest_key(digest), (media_type, data))
+        return digest
+
+    def fetch(self, digest: str) -> Optional[Tuple[str, bytes]]:
+        """(media_type, data) for a stored digest, or None once it has expired"""
+        return self._get(self._digest_key(digest))
+
+    def _digest_key(self, digest: str) -> str:
+        return f"{self.namespace}:{digest}" if self.namespace else digest
+
+
+# Per-stage caches, so a follow-up question about the same image re-runs only the LLM
+roi_cache = ImageCache(namespace="roi")
+prediction_cache = ImageCache(namespace="prediction")
+llm_cache = ImageCache(namespace="llm")
+artifact_cache = ArtifactCache(namespace="artifact")
+study_cache = ImageCache(namespace="study")
@@ -0,0 +1,99 @@
+import struct
+import time
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from app.config import OUTPUT_IMAGE_FORMAT, OUTPUT_IMAGE_QUALITY, OUTPUT_MAX_DIMENSION, OUTPUT_PNG_COMPRESSION
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class EncodeOptions(NamedTuple):
+    """How heatmap and ROI images are encoded for a response"""
+    format: str = OUTPUT_IMAGE_FORMAT
+    # JPEG / WebP quality, 1-100 (WebP at 100 is lossless)
+    quality: int = OUTPUT_IMAGE_QUALITY
+    # Longest side in pixels; 0 keeps the full resolution
+    max_dimension: int = OUTPUT_MAX_DIMENSION
+    # zlib level 0-9; None keeps the PNG produced by the ROI stage
+    png_compression: Optional[int] = OUTPUT_PNG_COMPRESSION
+
+    @property
+    def passthrough(self) -> bool:
+        """True when the cached PNG can be sent as is"""
+        return self.format == "png" and not self.max_dimension and self.png_compression is None
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+    encode_ms: float
+
+    @property
+    def extension(self) -> str:
+        return self.media_type.split("/")[1]
+
+
+def png_size(png: bytes):
+    """(width, height) from a PNG's IHDR chunk, without decoding the image"""
+    if png[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG image")
+    return struct.unpack(">II", png[16:24])
+
+
+def fit_dimension(image: np.ndarray, max_dimension: int) -> np.ndarray:
+    """Downscale so the longest side is at most max_dimension; 0 or smaller images are returned as is"""
+    height, width = image.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return image
+    scale = max_dimension / max(height, width)
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_array(image: np.ndarray, options: EncodeOptions) -> EncodedImage:
+    """Resize to options.max_dimension and encode in the requested format"""
+    start = time.perf_counter()
+    image = fit_dimension(image, options.max_dimension)
+    height, width = image.shape[:2]
+
+    if options.format == "png":
+        params = [] if options.png_compression is None else [cv2.IMWRITE_PNG_COMPRESSION, options.png_compression]
+    elif options.format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, options.quality]
+    elif options.format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, options.quality]
+    else:
+        raise ValueError(f"Unsupported output format: {options.format}")
+
+    ok, buffer = cv2.imencode(f".{options.format}", image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {options.format}")
+    return EncodedImage(buffer.tobytes(), MEDIA_TYPES[options.format], width, height,
+                        (time.perf_counter() - start) * 1000)
+
+
+def transcode_png(png: bytes, options: EncodeOptions) -> EncodedImage:
+    """
+    Re-encode a PNG produced by the ROI stage. The cached bytes are returned
+    unchanged when the options ask for full-resolution PNG.
+    """
+    if options.passthrough:
+        width, height = png_size(png)
+        return EncodedImage(png, MEDIA_TYPES["png"], width, height, 0.0)
+
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_UNCHANGED)
+    decode_ms = (time.perf_counter() - start) * 1000
+    encoded = encode_array(image, options)
+    return encoded._replace(encode_ms=encoded.encode_ms + decode_ms)
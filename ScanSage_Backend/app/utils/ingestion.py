@@ -0,0 +1,269 @@
+"""
+Streaming upload ingestion.
+Uploads are read in chunks and hashed as they arrive. Magic bytes are checked
+on the first chunk, so non-images are rejected before the rest is read.
+Per-file and per-request byte limits are enforced while reading. Files above
+UPLOAD_SPOOL_BYTES are spooled to an anonymous temporary file and memory-mapped
+instead of being held on the heap.
+"""
+import hashlib
+import mmap
+import os
+import resource
+import tempfile
+import time
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import (
+    MAX_UPLOAD_BYTES,
+    MAX_REQUEST_BYTES,
+    MAX_UPLOAD_FILES,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_SPOOL_BYTES,
+    UPLOAD_SPOOL_DIR,
+)
+from app.utils.metrics import record
+from app.utils.scan_context import ScanContext
+
+# Leading bytes of the image formats the decoders accept
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """MIME type from an upload's first bytes, or None when it is not a supported image"""
+    for signature, mime_type in SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class UploadRejected(HTTPException):
+    """An upload refused by the ingestion layer; reason is recorded in the upload stats"""
+
+    def __init__(self, status_code: int, detail: str, reason: str):
+        super().__init__(status_code=status_code, detail=detail)
+        self.reason = reason
+
+
+class UploadBudget:
+    """Bytes and files still allowed in one request"""
+
+    def __init__(self, max_bytes: int = MAX_REQUEST_BYTES, max_files: int = MAX_UPLOAD_FILES):
+        self.remaining = max_bytes
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+    def consume(self, size: int) -> None:
+        self.remaining -= size
+        if self.remaining < 0:
+            raise UploadRejected(413, f"Request exceeds {self.max_bytes} bytes of uploads", "request_too_large")
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """Current and peak resident set size of this process in bytes"""
+    current = None
+    try:
+        with open("/proc/self/statm") as statm:
+            current = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return {"rss_bytes": current, "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+class IngestionStats:
+    """Counters for accepted and rejected uploads, exposed at /api/uploads"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.accepted = 0
+        self.spooled = 0
+        self.bytes = 0
+        self.largest = 0
+        self.rejected: Dict[str, int] = {}
+
+    def record(self, size: int, spooled: bool) -> None:
+        with self.lock:
+            self.accepted += 1
+            self.spooled += spooled
+            self.bytes += size
+            self.largest = max(self.largest, size)
+
+    def reject(self, reason: str) -> None:
+        with self.lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "accepted": self.accepted,
+                "spooled": self.spooled,
+                "bytes": self.bytes,
+                "largest_bytes": self.largest,
+                "rejected": dict(self.rejected),
+                "max_upload_bytes": MAX_UPLOAD_BYTES,
+                "max_request_bytes": MAX_REQUEST_BYTES,
+                "max_files": MAX_UPLOAD_FILES,
+                "spool_bytes": UPLOAD_SPOOL_BYTES,
+                **process_memory(),
+            }
+
+
+ingestion_stats = IngestionStats()
+
+
+async def ingest_upload(upload: UploadFile, budget: Optional[UploadBudget] = None,
+                        max_bytes: int = MAX_UPLOAD_BYTES,
+                        sniff: Callable[[bytes], Optional[str]] = sniff_image_type) -> ScanContext:
+    """
+    Read one upload into a ScanContext whose content hash is already computed.
+    `sniff` maps the first chunk to a MIME type, or None to reject the upload.
+    Raises UploadRejected (415 for non-images, 413 over a limit, 400 when empty).
+    """
+    try:
+        return await _ingest(upload, budget, max_bytes, sniff)
+    except UploadRejected as e:
+        ingestion_stats.reject(e.reason)
+        raise
+
+
+async def ingest_uploads(uploads: Optional[Iterable[UploadFile]], budget: Optional[UploadBudget] = None,
+                         sniff: Callable[[bytes], Optional[str]] = sniff_image_type,
+                         max_bytes: int = MAX_UPLOAD_BYTES) -> List[ScanContext]:
+    """Ingest every upload of a request, skipping empty ones, within one budget"""
+    uploads = list(uploads or [])
+    budget = budget or UploadBudget()
+    if len(uploads) > budget.max_files:
+        ingestion_stats.reject("too_many_files")
+        raise UploadRejected(413, f"At most {budget.max_files} images per request", "too_many_files")
+
+    contexts = []
+    for upload in uploads:
+        try:
+            contexts.append(await ingest_upload(upload, budget, max_bytes, sniff))
+        except UploadRejected as e:
+            if e.reason != "empty":
+                raise
+    return contexts
+
+
+async def _ingest(upload: UploadFile, budget: Optional[UploadBudget], max_bytes: int,
+                  sniff: Callable[[bytes], Optional[str]]) -> ScanContext:
+    name = upload.filename or "Upload"
+    # The multipart parser records the size of each file it spooled
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(413, f"{name} exceeds {max_bytes} bytes", "file_too_large")
+
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    spool = None
+    if upload.size is not None and upload.size > UPLOAD_SPOOL_BYTES:
+        spool = tempfile.TemporaryFile(dir=UPLOAD_SPOOL_DIR or None)
+    mime_type = None
+    size = 0
+    start = time.perf_counter()
+    hash_seconds = 0.0
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if mime_type is None:
+                mime_type = sniff(chunk)
+                if mime_type is None:
+                    raise UploadRejected(415, f"{name} is not a supported image", "not_an_image")
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(413, f"{name} exceeds {max_bytes} bytes", "file_too_large")
+            if budget is not None:
+                budget.consume(len(chunk))
+            hashed = time.perf_counter()
+            digest.update(chunk)
+            hash_seconds += time.perf_counter() - hashed
+
+            if spool is None and size > UPLOAD_SPOOL_BYTES:
+                # Size was not known up front: move what we have so far out of the heap
+                spool = tempfile.TemporaryFile(dir=UPLOAD_SPOOL_DIR or None)
+                await run_in_threadpool(spool.write, buffer)
+                await run_in_threadpool(spool.write, chunk)
+                buffer = None
+            elif spool is not None:
+                await run_in_threadpool(spool.write, chunk)
+            else:
+                buffer += chunk
+
+        if size == 0:
+            raise UploadRejected(400, f"{name} is empty", "empty")
+
+        if spool is not None:
+            spool.flush()
+            # The mapping keeps its own reference to the file, which is deleted once both are closed
+            data = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = bytes(buffer)
+    finally:
+        if spool is not None:
+            spool.close()
+
+    record("upload_read", time.perf_counter() - start)
+    record("hash", hash_seconds)
+    ingestion_stats.record(size, spool is not None)
+    return ScanContext(data, upload.filename, mime_type, content_hash=digest.hexdigest())
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Refuse request bodies above max_bytes with 413: up front from Content-Length
+    when the header is present, otherwise as soon as the streamed body passes
+    the limit, before the multipart parser has spooled the rest.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            ingestion_stats.reject("request_too_large")
+            body = b'{"detail":"Request body too large"}'
+            await send({
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes the response
+                    ingestion_stats.reject("request_too_large")
+                    raise UploadRejected(413, "Request body too large", "request_too_large")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,192 @@
+"""
+Per-stage latency instrumentation.
+Every pipeline stage is timed with `timed(stage)`; each measurement goes into
+a process-wide histogram, exposed with the other service metrics in the
+Prometheus text format at /metrics, and into the timing of the request it
+ran for, which can be returned as a Server-Timing header.
+"""
+import contextvars
+import functools
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import SERVER_TIMING
+
+# Upper bounds in seconds; stages range from sub-millisecond cache hits to
+# Gemini calls of tens of seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set; thread-safe"""
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.lock = Lock()
+        self.series: Dict[Labels, List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self.series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def family(name: str, kind: str, description: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Exposition lines of a gauge or counter family from (labels, value) samples"""
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_format_labels(_labels(labels))} {_format_value(value)}")
+    return lines
+
+
+stage_seconds = Histogram("scansage_stage_seconds", "Time spent in each pipeline stage")
+http_request_seconds = Histogram("scansage_http_request_seconds", "Request latency by route, method and status")
+
+
+class RequestTiming:
+    """Total time and count per stage for one request; stages may run in several threads"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, total: Optional[float] = None) -> str:
+        """Server-Timing value; stages that ran concurrently overlap, so they do not add up to the total"""
+        with self.lock:
+            parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, (seconds, _) in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+# Timing of the request being served, when it asked for Server-Timing
+request_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def record(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage=stage)
+    timing = request_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a block (sync, or around an await) as one run of `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def with_context(func: Callable, *args) -> Callable:
+    """
+    Bind func to the current context, for executors that do not copy it
+    (loop.run_in_executor), so stages timed in the worker count toward the request
+    """
+    return functools.partial(contextvars.copy_context().run, func, *args)
+
+
+class ServerTimingMiddleware:
+    """
+    Record the latency of every API request, and add a Server-Timing header
+    listing the time spent in each stage: for every request with SERVER_TIMING,
+    otherwise when the client sends "X-Server-Timing: 1". Streaming responses
+    send their headers first, so they only report the stages run before that.
+    """
+
+    def __init__(self, app, enabled: bool = SERVER_TIMING):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timing = None
+        if self.enabled or dict(scope.get("headers") or []).get(b"x-server-timing") == b"1":
+            timing = RequestTiming()
+        token = request_timing.set(timing)
+        start = time.perf_counter()
+        status = [500]
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if timing is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timing.header(time.perf_counter() - start).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            request_timing.reset(token)
+            # Route template, so /api/predict/{organ_type} is one series
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                route=getattr(route, "path", "unmatched"),
+                method=scope["method"],
+                status=status[0],
+            )
@@ -0,0 +1,155 @@
+import logging
+import time
+from threading import Lock
+from typing import Any, Dict
+
+import cv2
+import numpy as np
+
+from app.config import ORGAN_DETECTOR_MEDICAL_THRESHOLD, ORGAN_DETECTOR_ORGAN_THRESHOLD, ORGAN_DETECTOR_REJECT
+
+logger = logging.getLogger(__name__)
+
+# Side of the square thumbnail every feature is computed on
+THUMBNAIL_SIZE = 128
+DARK_LEVEL = 25
+# Below this standard deviation to mean brightness ratio an image is treated as blank
+MIN_RELATIVE_CONTRAST = 0.1
+
+
+def extract_features(image: np.ndarray) -> Dict[str, float]:
+    """
+    Cheap global features of a decoded RGB (or grayscale) image, computed on a
+    128x128 thumbnail so the cost does not depend on the upload's resolution.
+    """
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    if small.ndim == 2:
+        gray = small
+        chroma = 0.0
+    else:
+        gray = small.mean(axis=2)
+        # Medical scans are (near) grayscale; photos and screenshots are not
+        chroma = float((small.max(axis=2) - small.min(axis=2)).mean() / 255.0)
+
+    mean = float(gray.mean()) + 1e-6
+    half = THUMBNAIL_SIZE // 2
+    left, right = gray[:, :half], gray[:, half:][:, ::-1]
+
+    # Body mask: everything brighter than the background, with holes closed
+    body = (gray > DARK_LEVEL).astype(np.uint8)
+    body = cv2.morphologyEx(body, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    body_pixels = max(int(body.sum()), 1)
+    # Dark regions enclosed by the body (lung fields on chest CT / X-ray)
+    interior_dark = float(((gray < 0.5 * mean) & (body > 0)).sum() / body_pixels)
+
+    border = np.concatenate([gray[:12].ravel(), gray[-12:].ravel(), gray[:, :12].ravel(), gray[:, -12:].ravel()])
+    center = gray[32:96, 32:96]
+
+    return {
+        "chroma": chroma,
+        "contrast": float(gray.std() / 255.0),
+        # Unchanged by dimming, unlike contrast
+        "relative_contrast": float(gray.std() / mean),
+        "dark_fraction": float((gray < DARK_LEVEL).mean()),
+        "symmetry": float(np.clip(1.0 - np.abs(left - right).mean() / mean, 0.0, 1.0)),
+        "imbalance": float(np.clip(abs(left.mean() - right.mean()) / mean, 0.0, 1.0)),
+        "interior_dark": interior_dark,
+        "center_contrast": float(np.clip((center.mean() - border.mean()) / mean, -1.0, 1.0)),
+        "aspect": height / width,
+    }
+
+
+def score_features(features: Dict[str, float]) -> Dict[str, Any]:
+    """Turn features into a medical score and per-organ scores in [0, 1]"""
+    medical = np.clip(1.0 - features["chroma"] / 0.15, 0.0, 1.0)
+    if features["relative_contrast"] < MIN_RELATIVE_CONTRAST:
+        # Blank or nearly uniform images carry no anatomy
+        medical *= 0.3
+
+    squareness = 1.0 - min(abs(features["aspect"] - 1.0), 1.0)
+    organs = {
+        # Axial brain MRI: head centred on a dark background, left/right symmetric
+        "Brain": 0.35 * features["symmetry"] + 0.25 * squareness
+                 + 0.25 * np.clip(features["dark_fraction"] / 0.4, 0.0, 1.0)
+                 + 0.15 * np.clip(features["center_contrast"], 0.0, 1.0),
+        # Chest CT / X-ray: dark lung fields inside a symmetric body
+        "Lung": 0.45 * np.clip(features["interior_dark"] / 0.3, 0.0, 1.0) + 0.35 * features["symmetry"]
+                + 0.2 * (1.0 - np.clip(features["dark_fraction"] / 0.5, 0.0, 1.0)),
+        # Mammogram: tissue on one side of a portrait frame
+        "Breast": 0.55 * np.clip(features["imbalance"] / 0.5, 0.0, 1.0)
+                  + 0.25 * np.clip((features["aspect"] - 1.0) / 0.4, 0.0, 1.0)
+                  + 0.2 * (1.0 - features["symmetry"]),
+    }
+    return {
+        "medical_score": float(medical),
+        "organ_scores": {organ: round(float(score), 4) for organ, score in organs.items()},
+    }
+
+
+class OrganDetector:
+    """
+    Millisecond, CPU-only pre-classifier run before any expensive stage.
+    Decides medical vs non-medical and brain/lung/breast from global image
+    statistics; every decision is logged with its scores and timing so the
+    thresholds can be tuned from production logs. Non-medical images are
+    only marked "rejected" (and refused by the pipeline) when `reject` is set.
+    """
+
+    def __init__(self, medical_threshold: float = ORGAN_DETECTOR_MEDICAL_THRESHOLD,
+                 organ_threshold: float = ORGAN_DETECTOR_ORGAN_THRESHOLD, reject: bool = ORGAN_DETECTOR_REJECT):
+        self.medical_threshold = medical_threshold
+        self.organ_threshold = organ_threshold
+        self.reject = reject
+        self.lock = Lock()
+        self.counts = {
+            "medical": 0, "non_medical": 0, "rejected": 0, "Brain": 0, "Lung": 0, "Breast": 0, "undecided": 0,
+        }
+        self.total_ms = 0.0
+
+    def detect(self, image: np.ndarray, filename: str = None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        features = extract_features(image)
+        scores = score_features(features)
+
+        ranked = sorted(scores["organ_scores"].items(), key=lambda item: item[1], reverse=True)
+        is_medical = scores["medical_score"] >= self.medical_threshold
+        organ = ranked[0][0] if is_medical and ranked[0][1] >= self.organ_threshold else None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        decision = {
+            "is_medical": is_medical,
+            "rejected": self.reject and not is_medical,
+            "organ": organ,
+            "medical_score": round(scores["medical_score"], 4),
+            "organ_scores": scores["organ_scores"],
+            "margin": round(ranked[0][1] - ranked[1][1], 4),
+            "elapsed_ms": round(elapsed_ms, 3),
+        }
+        logger.info(
+            "organ detector file=%s medical=%s organ=%s medical_score=%.3f organ_scores=%s elapsed_ms=%.2f features=%s",
+            filename, is_medical, organ, decision["medical_score"], decision["organ_scores"], elapsed_ms,
+            {name: round(value, 4) for name, value in features.items()},
+        )
+
+        with self.lock:
+            self.counts["medical" if is_medical else "non_medical"] += 1
+            self.counts["rejected"] += decision["rejected"]
+            if is_medical:
+                self.counts[organ or "undecided"] += 1
+            self.total_ms += elapsed_ms
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            total = self.counts["medical"] + self.counts["non_medical"]
+            return {
+                "medical_threshold": self.medical_threshold,
+                "organ_threshold": self.organ_threshold,
+                "reject": self.reject,
+                "decisions": dict(self.counts),
+                "average_ms": self.total_ms / total if total else 0.0,
+            }
+
+
+organ_detector = OrganDetector()
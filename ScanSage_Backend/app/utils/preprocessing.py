@@ -0,0 +1,94 @@
+from io import BytesIO
+from typing import Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.config import PREPROCESS_INTERPOLATION
+
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "area": cv2.INTER_AREA,
+    "cubic": cv2.INTER_CUBIC,
+}
+
+# Pixel scaling of classifier inputs: name -> (multiplier, offset)
+SCALES = {
+    # [0, 1]
+    "unit": (np.float32(1.0 / 255.0), 0.0),
+    # [-1, 1], as Inception / Xception style models expect
+    "symmetric": (np.float32(2.0 / 255.0), -1.0),
+}
+
+ImageInput = Union[bytes, np.ndarray]
+
+
+def decode_image(image_data: bytes, mode: str = "rgb") -> np.ndarray:
+    """
+    Decode raw image bytes into a uint8 array.
+    mode "rgb" returns (height, width, 3), mode "gray" returns (height, width).
+    OpenCV is tried first; formats it cannot read fall back to PIL.
+    """
+    nparr = np.frombuffer(image_data, np.uint8)
+    if mode == "gray":
+        image = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    else:
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if image is not None:
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+    if image is None:
+        try:
+            img = Image.open(BytesIO(image_data))
+            image = np.asarray(img.convert("L" if mode == "gray" else "RGB"))
+        except Exception:
+            raise ValueError("Error: Image not found or unable to load.")
+    return image
+
+
+def to_grayscale(image: np.ndarray) -> np.ndarray:
+    """Grayscale view of a decoded image without decoding the bytes again"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def allocate_batch(batch_size: int, img_size: Tuple[int, int]) -> np.ndarray:
+    """Float32 (batch, height, width, 3) buffer for preprocess_batch to write into"""
+    width, height = img_size
+    return np.empty((batch_size, height, width, 3), dtype=np.float32)
+
+
+def preprocess_batch(images: Sequence[ImageInput], img_size: Tuple[int, int],
+                     out: Optional[np.ndarray] = None,
+                     interpolation: str = PREPROCESS_INTERPOLATION, scale: str = "unit") -> np.ndarray:
+    """
+    Resize and normalize a batch of images into a float32 (n, height, width, 3) tensor.
+    Each image may be raw bytes or an already decoded uint8 array (RGB or grayscale).
+    Pixels are scaled (see SCALES) straight into the output buffer, so the only
+    intermediate per image is the resized uint8 frame.
+    """
+    if out is None:
+        out = allocate_batch(len(images), img_size)
+    flag = INTERPOLATIONS[interpolation]
+    multiplier, offset = SCALES[scale]
+
+    for i, image in enumerate(images):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image = decode_image(bytes(image))
+        resized = cv2.resize(image, img_size, interpolation=flag)
+        if resized.ndim == 2:
+            # Grayscale input: broadcast the single channel into all three
+            resized = resized[..., np.newaxis]
+        np.multiply(resized, multiplier, out=out[i], casting="unsafe")
+        if offset:
+            out[i] += offset
+    return out
+
+
+def preprocess_image(image: ImageInput, img_size: Tuple[int, int],
+                     interpolation: str = PREPROCESS_INTERPOLATION, scale: str = "unit") -> np.ndarray:
+    """Single image variant of preprocess_batch, returning a (1, height, width, 3) tensor"""
+    return preprocess_batch([image], img_size, interpolation=interpolation, scale=scale)
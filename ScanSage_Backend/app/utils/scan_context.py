@@ -0,0 +1,74 @@
+import base64
+import hashlib
+import mimetypes
+from threading import Lock
+from typing import Optional
+
+import numpy as np
+
+from app.utils.metrics import timed
+from app.utils.preprocessing import decode_image, to_grayscale
+
+
+class ScanContext:
+    """
+    Per-upload state shared by every stage of the pipeline.
+    Holds the raw bytes and computes the content hash, decoded arrays and
+    base64 payload at most once, on first use.
+    """
+
+    def __init__(self, data: bytes, filename: Optional[str] = None, mime_type: Optional[str] = None,
+                 content_hash: Optional[str] = None):
+        # Raw bytes, or a read-only mmap for large uploads spooled to disk
+        self.data = data
+        self.filename = filename
+        self.mime_type = mime_type or (filename and mimetypes.guess_type(filename)[0]) or "image/jpeg"
+        self._lock = Lock()
+        # Uploads are hashed while they stream in, so the hash may be known already
+        self._hash = content_hash
+        self._rgb = None
+        self._gray = None
+        self._base64 = None
+
+    @classmethod
+    def ensure(cls, image) -> "ScanContext":
+        """Wrap raw bytes in a context; contexts are returned unchanged"""
+        return image if isinstance(image, ScanContext) else cls(image)
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the raw bytes, used as the cache key"""
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.data).hexdigest()
+        return self._hash
+
+    @property
+    def rgb(self) -> np.ndarray:
+        with self._lock:
+            if self._rgb is None:
+                with timed("decode"):
+                    self._rgb = decode_image(self.data)
+            return self._rgb
+
+    @property
+    def gray(self) -> np.ndarray:
+        # Derived from the colour decode when one exists, otherwise decoded directly
+        with self._lock:
+            if self._gray is None:
+                if self._rgb is not None:
+                    self._gray = to_grayscale(self._rgb)
+                else:
+                    with timed("decode"):
+                        self._gray = decode_image(self.data, mode="gray")
+            return self._gray
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("utf-8")
+        return self._base64
+
+    def decode(self) -> "ScanContext":
+        """Decode the colour image up front so later grayscale access reuses it"""
+        self.rgb
+        return self
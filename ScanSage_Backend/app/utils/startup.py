@@ -0,0 +1,89 @@
+"""
+Start-up progress of this worker, reported by the health endpoints.
+Importing the app loads only what serving needs; TensorFlow, the MODEL_WARMUP
+classifiers and the Gemini SDK are loaded by a warm-up task once the server
+is listening (or by the first request that needs them). The worker is live
+as soon as it answers and ready once the warm-up has finished.
+Imported first by app.main, so its creation time marks the start of the app import.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Optional
+
+# Modules that take long to import, reported as loaded or not
+HEAVY_MODULES = ("tensorflow", "cv2", "google.generativeai", "pydicom", "nibabel", "httpx")
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started, from /proc (None elsewhere)"""
+    try:
+        with open("/proc/self/stat") as stat:
+            # Field 22, counted after the parenthesized command name
+            start_ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime:
+            return float(uptime.read().split()[0]) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTracker:
+    """Import time, timed warm-up steps and state: starting -> warming_up -> ready (or failed)"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.created = time.perf_counter()
+        self.import_seconds: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.ready_seconds: Optional[float] = None
+        self.ready_process_age: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def imported(self) -> None:
+        self.import_seconds = time.perf_counter() - self.created
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.steps[name] = time.perf_counter() - start
+
+    def warming_up(self) -> None:
+        self.state = "warming_up"
+
+    def ready(self) -> None:
+        self.ready_seconds = time.perf_counter() - self.created
+        self.ready_process_age = process_age()
+        self.state = "ready"
+
+    def failed(self, error: Exception) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+        self.state = "failed"
+
+    def stats(self) -> dict:
+        with self.lock:
+            steps = dict(self.steps)
+        return {
+            "state": self.state,
+            "error": self.error,
+            "process_age_seconds": process_age(),
+            "import_seconds": self.import_seconds,
+            "warmup_steps_seconds": steps,
+            # From the start of the app import, and from process start (interpreter and server imports included)
+            "seconds_to_ready": self.ready_seconds,
+            "process_age_at_ready_seconds": self.ready_process_age,
+            "modules_loaded": {name: name in sys.modules for name in HEAVY_MODULES},
+        }
+
+
+startup = StartupTracker()
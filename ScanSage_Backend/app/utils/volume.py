@@ -0,0 +1,401 @@
+"""
+Multi-slice study ingestion: DICOM series or multi-frame files, NIfTI volumes,
+NumPy .npy stacks, or a set of ordinary 2-D images.
+Every source is windowed straight into a single uint8 (slices, height, width)
+array; the only other buffer is one float32 slice reused as scratch.
+"""
+import io
+import math
+import struct
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.config import STUDY_MAX_DECOMPRESSED_BYTES
+from app.utils.ingestion import sniff_image_type
+from app.utils.preprocessing import decode_image
+from app.utils.scan_context import ScanContext
+
+DICOM_MIME = "application/dicom"
+NIFTI_MIME = "application/x-nifti"
+GZIP_MIME = "application/gzip"
+NUMPY_MIME = "application/x-npy"
+
+# DICOM keeps its magic after a 128-byte preamble and NIfTI-1 at byte 344,
+# so volume uploads are sniffed on a longer prefix than images
+SNIFF_BYTES = 352
+# Compressed bytes fed to the inflater, and most bytes it returns, per step
+GUNZIP_CHUNK = 1024 * 1024
+
+
+class Volume(NamedTuple):
+    """A study windowed to 8-bit, slices in acquisition order"""
+    slices: np.ndarray
+    source: str
+    # Position of each slice along the slice axis (mm when known, otherwise the index)
+    positions: List[float]
+    metadata: Dict[str, Any]
+
+
+def sniff_volume_type(head: bytes) -> Optional[str]:
+    """MIME type of a study upload from its first SNIFF_BYTES bytes"""
+    if head[128:132] == b"DICM":
+        return DICOM_MIME
+    if head[344:348] in (b"n+1\x00", b"ni1\x00"):
+        return NIFTI_MIME
+    if head[:2] == b"\x1f\x8b":
+        # Only gzipped NIfTI is accepted; checked again once decompressed
+        return GZIP_MIME
+    if head[:6] == b"\x93NUMPY":
+        return NUMPY_MIME
+    return sniff_image_type(head)
+
+
+def window_to_uint8(pixels: np.ndarray, low: float, high: float, out: np.ndarray,
+                    slope: float = 1.0, intercept: float = 0.0, scratch: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Map stored values to 0-255 through a [low, high] window, writing into `out`.
+    The rescale (slope * x + intercept) and the window are folded into one
+    multiply-add on a float32 scratch slice, so no full-size temporaries are made.
+    """
+    width = max(high - low, 1e-6)
+    scale = slope * 255.0 / width
+    offset = (intercept - low) * 255.0 / width
+    if scratch is None or scratch.shape != pixels.shape:
+        scratch = np.empty(pixels.shape, np.float32)
+    np.multiply(pixels, scale, out=scratch, casting="unsafe")
+    scratch += offset
+    np.clip(scratch, 0, 255, out=scratch)
+    np.copyto(out, scratch, casting="unsafe")
+    return out
+
+
+def load_volume(contexts: Sequence[ScanContext], window: Optional[Tuple[float, float]] = None) -> Volume:
+    """
+    Build a Volume from the ingested uploads of one study request.
+    A study is either one DICOM series (any number of files, single or
+    multi-frame), a single NIfTI or .npy file, or a set of 2-D images taken
+    as slices in upload order. `window` is (center, width) and overrides the
+    DICOM window or the data range.
+    Raises ValueError for mixed, malformed or unsupported uploads.
+    """
+    if not contexts:
+        raise ValueError("No slices uploaded")
+    kinds = {context.mime_type for context in contexts}
+    if DICOM_MIME in kinds:
+        if kinds != {DICOM_MIME}:
+            raise ValueError("A DICOM study cannot be mixed with other files")
+        return load_dicom_series([context.data for context in contexts], window)
+    if kinds & {NIFTI_MIME, GZIP_MIME, NUMPY_MIME}:
+        if len(contexts) != 1:
+            raise ValueError("Upload a NIfTI or .npy volume as a single file")
+        context = contexts[0]
+        if context.mime_type == NUMPY_MIME:
+            return load_numpy(context.data, window)
+        return load_nifti(context.data, window)
+    return load_images(contexts, window)
+
+
+def _window_bounds(window: Optional[Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+    if window is None:
+        return None
+    center, width = window
+    return center - width / 2.0, center + width / 2.0
+
+
+def load_dicom_series(datas: Sequence[Any], window: Optional[Tuple[float, float]] = None) -> Volume:
+    """
+    Parse a DICOM series, order it along the slice normal (or by InstanceNumber)
+    and window each slice into the volume as it is decoded. The window comes
+    from the request, else the first slice's WindowCenter/WindowWidth, else the
+    series' value range.
+    """
+    try:
+        import pydicom
+    except ImportError:
+        raise ValueError("DICOM studies need the pydicom package")
+
+    datasets = []
+    for data in datas:
+        try:
+            # mmap-backed uploads are file-like already, so they are not copied
+            source = data if hasattr(data, "seek") else io.BytesIO(data)
+            source.seek(0)
+            datasets.append(pydicom.dcmread(source))
+        except Exception as e:
+            raise ValueError(f"Unreadable DICOM file: {e}")
+    datasets.sort(key=_dicom_sort_key)
+
+    first = datasets[0]
+    rows, columns = int(first.Rows), int(first.Columns)
+    frames = [int(getattr(ds, "NumberOfFrames", 1) or 1) for ds in datasets]
+    for ds in datasets:
+        if (int(ds.Rows), int(ds.Columns)) != (rows, columns):
+            raise ValueError("All slices of a study must have the same dimensions")
+
+    bounds = _window_bounds(window)
+    if bounds is None and "WindowCenter" in first and "WindowWidth" in first:
+        bounds = _window_bounds((_first_value(first.WindowCenter), _first_value(first.WindowWidth)))
+
+    pending = None
+    if bounds is None:
+        # No window anywhere: decode everything once to find the series range
+        pending = [_rescaled_range(ds) for ds in datasets]
+        bounds = (min(low for low, _, _ in pending), max(high for _, high, _ in pending))
+
+    volume = np.empty((sum(frames), rows, columns), np.uint8)
+    scratch = np.empty((rows, columns), np.float32)
+    index = 0
+    for i, ds in enumerate(datasets):
+        pixels = pending[i][2] if pending is not None else ds.pixel_array
+        if pending is not None:
+            # Drop the decoded copy as soon as it has been windowed
+            pending[i] = None
+        pixels = _to_grayscale(pixels, ds)
+        if pixels.ndim == 2:
+            pixels = pixels[np.newaxis]
+        slope = float(getattr(ds, "RescaleSlope", 1) or 1)
+        intercept = float(getattr(ds, "RescaleIntercept", 0) or 0)
+        for frame in pixels:
+            window_to_uint8(frame, bounds[0], bounds[1], volume[index], slope, intercept, scratch)
+            if getattr(ds, "PhotometricInterpretation", "") == "MONOCHROME1":
+                np.subtract(255, volume[index], out=volume[index])
+            index += 1
+
+    positions = [_dicom_position(ds) for ds in datasets]
+    if any(count > 1 for count in frames) or any(position is None for position in positions):
+        positions = [float(i) for i in range(len(volume))]
+    return Volume(volume, "dicom", positions, {
+        "modality": str(getattr(first, "Modality", "")) or None,
+        "series_description": str(getattr(first, "SeriesDescription", "")) or None,
+        "files": len(datasets),
+        "window": [round(bounds[0], 3), round(bounds[1], 3)],
+    })
+
+
+def _first_value(value) -> float:
+    # Window tags may hold several presets; the first is the default
+    try:
+        return float(value)
+    except TypeError:
+        return float(value[0])
+
+
+def _slice_normal(ds) -> Optional[np.ndarray]:
+    orientation = getattr(ds, "ImageOrientationPatient", None)
+    if orientation is None or len(orientation) != 6:
+        return None
+    row, column = np.array(orientation[:3], float), np.array(orientation[3:], float)
+    return np.cross(row, column)
+
+
+def _dicom_position(ds) -> Optional[float]:
+    position = getattr(ds, "ImagePositionPatient", None)
+    normal = _slice_normal(ds)
+    if position is None or normal is None:
+        return None
+    return float(np.dot(np.array(position, float), normal))
+
+
+def _dicom_sort_key(ds):
+    position = _dicom_position(ds)
+    if position is not None:
+        return 0, position
+    return 1, int(getattr(ds, "InstanceNumber", 0) or 0)
+
+
+def _rescaled_range(ds) -> Tuple[float, float, np.ndarray]:
+    pixels = ds.pixel_array
+    slope = float(getattr(ds, "RescaleSlope", 1) or 1)
+    intercept = float(getattr(ds, "RescaleIntercept", 0) or 0)
+    low, high = float(pixels.min()) * slope + intercept, float(pixels.max()) * slope + intercept
+    return min(low, high), max(low, high), pixels
+
+
+def _to_grayscale(pixels: np.ndarray, ds) -> np.ndarray:
+    if int(getattr(ds, "SamplesPerPixel", 1) or 1) == 1:
+        return pixels
+    # Colour DICOM (rare for MR): collapse RGB frames to luminance
+    if pixels.ndim == 3:
+        return cv2.cvtColor(pixels.astype(np.uint8), cv2.COLOR_RGB2GRAY)
+    return np.stack([cv2.cvtColor(frame.astype(np.uint8), cv2.COLOR_RGB2GRAY) for frame in pixels])
+
+
+def _nifti_size(header: bytes) -> int:
+    """File size a NIfTI-1 header declares: the voxel offset plus the voxel data"""
+    for order in "<>":
+        if struct.unpack(order + "i", header[:4])[0] == 348:
+            break
+    else:
+        raise ValueError("Compressed upload is not a NIfTI volume")
+    dims = struct.unpack(order + "8h", header[40:56])
+    bitpix = struct.unpack(order + "h", header[72:74])[0]
+    vox_offset = struct.unpack(order + "f", header[108:112])[0]
+    voxels = 1
+    for dim in dims[1:1 + min(max(dims[0], 0), 7)]:
+        voxels *= max(dim, 1)
+    offset = int(vox_offset) if math.isfinite(vox_offset) and vox_offset > SNIFF_BYTES else SNIFF_BYTES
+    return offset + voxels * max(bitpix, 8) // 8
+
+
+def _gunzip_nifti(data, max_bytes: int = STUDY_MAX_DECOMPRESSED_BYTES) -> bytes:
+    """
+    Decompress a gzipped NIfTI-1 file in bounded steps, stopping at the size
+    its header declares. Raises ValueError when that size is above
+    `max_bytes`, so a small upload cannot expand into an unbounded buffer.
+    """
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    view = memoryview(data)
+    chunks, size, offset, pending = [], 0, 0, b""
+    # Unknown until the header is out
+    limit = None
+    try:
+        while not inflater.eof and (limit is None or size < limit):
+            if not pending:
+                if offset >= len(view):
+                    break
+                pending, offset = view[offset:offset + GUNZIP_CHUNK], offset + GUNZIP_CHUNK
+            chunk = inflater.decompress(pending, GUNZIP_CHUNK)
+            pending = inflater.unconsumed_tail
+            chunks.append(chunk)
+            size += len(chunk)
+            if limit is None and size >= SNIFF_BYTES:
+                limit = _nifti_size(b"".join(chunks)[:SNIFF_BYTES])
+                if limit > max_bytes:
+                    raise ValueError(f"NIfTI volume expands to {limit} bytes, above the {max_bytes} byte limit")
+    except zlib.error as e:
+        raise ValueError(f"Corrupt gzip stream: {e}")
+    raw = b"".join(chunks)
+    return raw[:limit] if limit is not None and size > limit else raw
+
+
+def load_nifti(data, window: Optional[Tuple[float, float]] = None) -> Volume:
+    """
+    Parse a NIfTI-1 volume (optionally gzipped). Axial slices are taken along
+    the third axis and shown in the usual radiological orientation; scaling
+    from the header is folded into the window instead of applied to the data.
+    """
+    try:
+        import nibabel
+    except ImportError:
+        raise ValueError("NIfTI studies need the nibabel package")
+
+    raw = _gunzip_nifti(data) if bytes(data[:2]) == b"\x1f\x8b" else data
+    if sniff_volume_type(bytes(raw[:SNIFF_BYTES])) != NIFTI_MIME:
+        raise ValueError("Compressed upload is not a NIfTI volume")
+    try:
+        # Read through a stream over the buffer rather than a copy of it
+        stream = io.BytesIO(raw)
+        image = nibabel.Nifti1Image.from_file_map(
+            nibabel.Nifti1Image.make_file_map({"image": stream, "header": stream}))
+    except Exception as e:
+        raise ValueError(f"Unreadable NIfTI file: {e}")
+
+    stored = np.asanyarray(image.dataobj.get_unscaled())
+    if stored.ndim == 4:
+        stored = stored[..., 0]
+    if stored.ndim == 2:
+        stored = stored[..., np.newaxis]
+    if stored.ndim != 3:
+        raise ValueError(f"Expected a 3-D NIfTI volume, got shape {stored.shape}")
+
+    slope = float(image.dataobj.slope) if np.isfinite(image.dataobj.slope) and image.dataobj.slope else 1.0
+    intercept = float(image.dataobj.inter) if np.isfinite(image.dataobj.inter) else 0.0
+    bounds = _window_bounds(window)
+    if bounds is None:
+        header = image.header
+        cal_min, cal_max = float(header["cal_min"]), float(header["cal_max"])
+        if cal_max > cal_min:
+            bounds = (cal_min, cal_max)
+        else:
+            ends = sorted((float(stored.min()) * slope + intercept, float(stored.max()) * slope + intercept))
+            bounds = (ends[0], ends[1])
+
+    depth = stored.shape[2]
+    # (x, y) slices displayed with rows running anterior to posterior
+    height, width = stored.shape[1], stored.shape[0]
+    volume = np.empty((depth, height, width), np.uint8)
+    scratch = np.empty((height, width), np.float32)
+    for k in range(depth):
+        window_to_uint8(np.flipud(stored[:, :, k].T), bounds[0], bounds[1], volume[k], slope, intercept, scratch)
+
+    spacing = float(image.header.get_zooms()[2]) if len(image.header.get_zooms()) > 2 else 1.0
+    return Volume(volume, "nifti", [k * spacing for k in range(depth)], {
+        "modality": None,
+        "series_description": image.header["descrip"].tobytes().rstrip(b"\x00").decode("latin-1") or None,
+        "files": 1,
+        "window": [round(bounds[0], 3), round(bounds[1], 3)],
+    })
+
+
+def load_numpy(data, window: Optional[Tuple[float, float]] = None) -> Volume:
+    """
+    Map a .npy stack of shape (slices, height, width) or (height, width)
+    without copying it: the header is parsed and the array is a view over the
+    upload (or its memory-mapped spool file). uint8 stacks without a window
+    are used as they are.
+    """
+    stream = io.BytesIO(data) if not hasattr(data, "seek") else data
+    stream.seek(0)
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    except Exception as e:
+        raise ValueError(f"Unreadable .npy file: {e}")
+    if dtype.hasobject:
+        raise ValueError(".npy stacks of Python objects are not accepted")
+
+    count = int(np.prod(shape))
+    stored = np.frombuffer(data, dtype=dtype, count=count, offset=stream.tell())
+    stored = stored.reshape(shape, order="F" if fortran_order else "C")
+    if stored.ndim == 2:
+        stored = stored[np.newaxis]
+    if stored.ndim != 3:
+        raise ValueError(f"Expected a (slices, height, width) stack, got shape {shape}")
+
+    bounds = _window_bounds(window)
+    if stored.dtype == np.uint8 and bounds is None:
+        volume = stored
+        bounds = (0.0, 255.0)
+    else:
+        if bounds is None:
+            bounds = (float(stored.min()), float(stored.max()))
+        volume = np.empty(stored.shape, np.uint8)
+        scratch = np.empty(stored.shape[1:], np.float32)
+        for k in range(len(stored)):
+            window_to_uint8(stored[k], bounds[0], bounds[1], volume[k], scratch=scratch)
+
+    return Volume(volume, "numpy", [float(k) for k in range(len(volume))], {
+        "modality": None,
+        "series_description": None,
+        "files": 1,
+        "window": [round(bounds[0], 3), round(bounds[1], 3)],
+    })
+
+
+def load_images(contexts: Sequence[ScanContext], window: Optional[Tuple[float, float]] = None) -> Volume:
+    """Ordinary 2-D images as slices, in upload order; all must share one size"""
+    # Decoded here rather than through the contexts so each slice is dropped once copied
+    first = decode_image(contexts[0].data, mode="gray")
+    volume = np.empty((len(contexts),) + first.shape, np.uint8)
+    bounds = _window_bounds(window)
+    scratch = np.empty(first.shape, np.float32) if bounds else None
+    for k, context in enumerate(contexts):
+        gray = decode_image(context.data, mode="gray") if k else first
+        if gray.shape != first.shape:
+            raise ValueError("All slices of a study must have the same dimensions")
+        if bounds:
+            window_to_uint8(gray, bounds[0], bounds[1], volume[k], scratch=scratch)
+        else:
+            volume[k] = gray
+    return Volume(volume, "images", [float(k) for k in range(len(volume))], {
+        "modality": None,
+        "series_description": None,
+        "files": len(contexts),
+        "window": [round(bounds[0], 3), round(bounds[1], 3)] if bounds else [0.0, 255.0],
+    })
@@ -0,0 +1,66 @@
+"""
+Response size and encode time of the heatmap for each output setting.
+
+    python -m benchmarks.bench_encoding --size 1024 --max-dimensions 0 512
+
+For every format / quality / max dimension combination, reports the encoded
+bytes, the bytes on the wire with base64 transport, and encode time,
+to help choose the OUTPUT_* defaults for a given bandwidth.
+"""
+import argparse
+import json
+import time
+
+from app.utils.RegionOfIntrest import extract_roi
+from app.utils.image_encoding import EncodeOptions, transcode_png
+from benchmarks.fixtures import synthetic_scan
+
+
+def settings(max_dimensions, qualities):
+    for max_dimension in max_dimensions:
+        for compression in (None, 1, 6, 9):
+            yield EncodeOptions("png", 100, max_dimension, compression)
+        for image_format in ("webp", "jpeg"):
+            for quality in qualities:
+                yield EncodeOptions(image_format, quality, max_dimension, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--max-dimensions", type=int, nargs="+", default=[0, 1024, 512])
+    parser.add_argument("--qualities", type=int, nargs="+", default=[60, 80, 90, 100])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    heatmap_png = extract_roi(synthetic_scan(args.size, seed=1, lesions=2)).heatmap
+    # First WebP / JPEG encodes pay one-off initialization
+    transcode_png(heatmap_png, EncodeOptions("webp", 80, 0, None))
+    transcode_png(heatmap_png, EncodeOptions("jpeg", 80, 0, None))
+
+    results = []
+    for options in settings(args.max_dimensions, args.qualities):
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            encoded = transcode_png(heatmap_png, options)
+        encode_ms = (time.perf_counter() - start) * 1000 / args.repeats
+        base64_bytes = 4 * -(-len(encoded.data) // 3)
+        results.append({
+            "format": options.format,
+            "quality": options.quality if options.format != "png" else None,
+            "png_compression": options.png_compression,
+            "max_dimension": options.max_dimension,
+            "width": encoded.width,
+            "bytes": len(encoded.data),
+            "base64_bytes": base64_bytes,
+            "encode_ms": round(encode_ms, 2),
+        })
+        label = f"q={options.quality}" if options.format != "png" else f"z={options.png_compression}"
+        print(f"{options.format:<5} {label:<7} max={options.max_dimension:<5} {len(encoded.data):>9} B "
+              f"(base64 {base64_bytes:>9} B) {encode_ms:8.2f} ms")
+
+    print(json.dumps({"size": args.size, "source_png_bytes": len(heatmap_png), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Scaling of the execution backends from 1 to N workers.
+
+    python -m benchmarks.bench_execution --backend thread --max-workers 8
+    python -m benchmarks.bench_execution --backend process --stages roi predict
+
+Runs every synthetic image through the selected stages concurrently for each
+pool size (1, 2, 4, ... up to --max-workers) and reports throughput and
+speedup over one worker. The predict stage needs the .h5 models.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from app.services.execution import create_backend
+from app.utils.scan_context import ScanContext
+from benchmarks.fixtures import synthetic_scan_png
+
+
+def worker_counts(max_workers):
+    count = 1
+    while count < max_workers:
+        yield count
+        count *= 2
+    yield max_workers
+
+
+async def run_images(backend, images, stages, organ_type):
+    async def one(data):
+        context = ScanContext(data, "scan.png")
+        if "roi" in stages:
+            await backend.roi(context)
+        if "predict" in stages:
+            await backend.predict(context, organ_type)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(data) for data in images))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["thread", "process"], default="thread")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--stages", nargs="+", choices=["roi", "predict"], default=["roi"])
+    parser.add_argument("--organ", default="Brain")
+    args = parser.parse_args()
+
+    images = [synthetic_scan_png(args.size, seed) for seed in range(args.images)]
+    results = []
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        backend = create_backend(args.backend, workers)
+        backend.warm_up([args.organ] if "predict" in args.stages else [])
+        # One untimed pass so lazy imports and model loads are not measured
+        asyncio.run(run_images(backend, images[:workers], args.stages, args.organ))
+        seconds = asyncio.run(run_images(backend, images, args.stages, args.organ))
+        backend.shutdown()
+
+        throughput = args.images / seconds
+        baseline = baseline or throughput
+        results.append({
+            "workers": workers,
+            "seconds": round(seconds, 3),
+            "images_per_second": round(throughput, 2),
+            "speedup": round(throughput / baseline, 2),
+        })
+        print(f"{args.backend:<8} workers={workers:<3} {throughput:8.2f} img/s  speedup x{throughput / baseline:.2f}")
+
+    print(json.dumps({"backend": args.backend, "stages": args.stages, "size": args.size, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare classifier inference paths for each organ.
+
+    python -m benchmarks.bench_inference --iterations 50 --batch-size 1
+
+Times model.predict (the original path), the traced graph engine and, when
+an export exists under SAVED_MODEL_DIR, the SavedModel engine. Load time is
+reported separately from per-call latency.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from app.config import SAVED_MODEL_DIR
+from app.services.inference_engine import load_engine, saved_model_path
+from app.services.model_registry import MODEL_PATHS, MODEL_SPECS
+
+
+def _percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def bench_engine(engine, batch, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        engine(batch)
+        timings.append(time.perf_counter() - start)
+    return {
+        "p50_ms": _percentile(timings, 50),
+        "p99_ms": _percentile(timings, 99),
+        "mean_ms": float(np.mean(timings)) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--organs", nargs="+", default=list(MODEL_PATHS))
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for organ_type in args.organs:
+        model_path = MODEL_PATHS[organ_type]
+        input_size = MODEL_SPECS[organ_type][0]
+        width, height = input_size
+        batch = np.random.default_rng(0).random((args.batch_size, height, width, 3), dtype=np.float32)
+
+        backends = ["keras", "graph"]
+        if os.path.isdir(saved_model_path(SAVED_MODEL_DIR, model_path)):
+            backends.append("saved_model")
+
+        results[organ_type] = {}
+        for backend in backends:
+            start = time.perf_counter()
+            engine = load_engine(model_path, input_size, backend=backend, export_root=SAVED_MODEL_DIR)
+            load_time = time.perf_counter() - start
+            stats = bench_engine(engine, batch, args.iterations)
+            stats["load_seconds"] = load_time
+            results[organ_type][backend] = stats
+            print(f"{organ_type:<7} {backend:<12} load {load_time:6.2f}s  "
+                  f"p50 {stats['p50_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Peak resident memory of the server under concurrent large uploads, comparing
+a plain `await file.read()` with the streaming ingestion layer.
+
+    python -m benchmarks.bench_ingestion --uploads 16 --size-mb 40
+
+A minimal app with one endpoint per mode runs under uvicorn in a fresh child
+process for each mode. The client streams the uploads from a file on disk
+while a thread samples the child's RSS, so client buffers are not counted.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+from app.utils.ingestion import ingest_upload
+
+HOLD_SECONDS = float(os.getenv("BENCH_HOLD_SECONDS", "0.5"))
+
+app = FastAPI()
+
+
+@app.post("/naive")
+async def naive(file: UploadFile = File(...)):
+    contents = await file.read()
+    # Keep the upload alive as a request handler would while it is analyzed
+    await asyncio.sleep(HOLD_SECONDS)
+    return {"bytes": len(contents)}
+
+
+@app.post("/streaming")
+async def streaming(file: UploadFile = File(...)):
+    context = await ingest_upload(file, max_bytes=1 << 40)
+    await asyncio.sleep(HOLD_SECONDS)
+    return {"bytes": len(context.data)}
+
+
+def rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, rss_bytes(self.pid))
+            time.sleep(self.interval)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def post_all(url: str, path: str, uploads: int):
+    async with httpx.AsyncClient(timeout=600) as client:
+        async def post(index):
+            with open(path, "rb") as payload:
+                return await client.post(url, files={"file": (f"scan{index}.png", payload, "image/png")})
+        return await asyncio.gather(*(post(index) for index in range(uploads)))
+
+
+def run_mode(mode: str, path: str, uploads: int, hold_seconds: float) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_ingestion:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "BENCH_HOLD_SECONDS": str(hold_seconds)},
+    )
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/docs")
+                break
+            except httpx.TransportError:
+                time.sleep(0.05)
+        baseline = rss_bytes(server.pid)
+        sampler = RssSampler(server.pid)
+        sampler.start()
+        start = time.perf_counter()
+        responses = asyncio.run(post_all(f"http://127.0.0.1:{port}/{mode}", path, uploads))
+        seconds = time.perf_counter() - start
+        sampler.running = False
+        sampler.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    assert all(response.status_code == 200 for response in responses), [r.text for r in responses]
+    return {
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "baseline_rss_mb": round(baseline / 2 ** 20, 1),
+        "peak_rss_mb": round(sampler.peak / 2 ** 20, 1),
+        "peak_rss_above_baseline_mb": round((sampler.peak - baseline) / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=16)
+    parser.add_argument("--size-mb", type=float, default=40)
+    parser.add_argument("--hold-seconds", type=float, default=HOLD_SECONDS)
+    parser.add_argument("--modes", nargs="+", choices=["naive", "streaming"], default=["naive", "streaming"])
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.NamedTemporaryFile(suffix=".png") as payload:
+        # A PNG signature followed by incompressible bytes: passes sniffing, never decoded
+        payload.write(b"\x89PNG\r\n\x1a\n" + os.urandom(int(args.size_mb * 2 ** 20)))
+        payload.flush()
+        for mode in args.modes:
+            result = run_mode(mode, payload.name, args.uploads, args.hold_seconds)
+            results.append(result)
+            print(f"{mode:<10} {result['seconds']:7.2f} s  peak RSS +{result['peak_rss_above_baseline_mb']:.1f} MB")
+
+    print(json.dumps({"uploads": args.uploads, "size_mb": args.size_mb, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measure the async LLM client against the fake backend (no network).
+
+    python -m benchmarks.bench_llm_client --requests 64 --unique 8 --latency-ms 200
+
+Fires --requests concurrent scan analyses spread over --unique distinct
+images and reports wall time, backend calls and coalesced requests, next to
+the same workload issued one blocking call at a time.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.services.llm_client import FakeLLMBackend, LLMClient
+from app.services.llm_service import build_request
+from benchmarks.fixtures import synthetic_scan_png
+
+
+async def run_concurrent(client, requests):
+    start = time.perf_counter()
+    await asyncio.gather(*(client.generate(request) for request in requests))
+    return time.perf_counter() - start
+
+
+def run_sequential(client, requests):
+    start = time.perf_counter()
+    for request in requests:
+        client.generate_sync(request)
+    return time.perf_counter() - start
+
+
+def summary(client) -> dict:
+    stats = client.stats()
+    stats.pop("recent_calls")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--unique", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sequential", action="store_true", help="also time blocking one-at-a-time calls")
+    args = parser.parse_args()
+
+    images = [synthetic_scan_png(256, seed=i) for i in range(args.unique)]
+    requests = [build_request(images[i % args.unique], "image/png", "Is there a tumor?") for i in range(args.requests)]
+
+    client = LLMClient(FakeLLMBackend(latency_ms=args.latency_ms), max_concurrency=args.concurrency)
+    results = {"concurrent": {"seconds": asyncio.run(run_concurrent(client, requests)), **summary(client)}}
+
+    if args.sequential:
+        client = LLMClient(FakeLLMBackend(latency_ms=args.latency_ms), max_concurrency=args.concurrency)
+        results["sequential"] = {"seconds": run_sequential(client, requests), **summary(client)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
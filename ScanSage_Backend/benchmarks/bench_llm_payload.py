@@ -0,0 +1,124 @@
+"""
+Size / quality trade-off of the image payload sent to the LLM.
+
+    python -m benchmarks.bench_llm_payload --sizes 512 2048 4096
+    python -m benchmarks.bench_llm_payload --images scans/*.png --live
+
+For every fixture (synthetic scans, or --images) and payload setting, reports
+the bytes sent, encode time and PSNR of the payload against the upload
+(upscaled back to the upload's size). With --live each request also goes to
+Gemini (GENAI_API_KEY must be set), recording latency, prompt / output tokens
+and whether scan type, organ and tumor type match the answer for the
+original upload.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+
+import cv2
+import numpy as np
+
+from app.services.llm_client import GeminiBackend, LLMClient
+from app.services.llm_payload import prepare_image
+from app.services.llm_service import build_request
+from app.utils.image_encoding import EncodeOptions
+from app.utils.ResponseParser import parse_scan_result
+from app.utils.scan_context import ScanContext
+from benchmarks.fixtures import synthetic_scan
+
+COMPARED_FIELDS = ("scan_type", "organ", "tumor_type")
+
+
+def fixtures(args):
+    if args.images:
+        for path in args.images:
+            with open(path, "rb") as f:
+                yield path, f.read()
+        return
+    for size in args.sizes:
+        # Scans usually arrive as 3-channel PNG or JPEG exports
+        image = cv2.cvtColor(synthetic_scan(size, seed=size), cv2.COLOR_GRAY2BGR)
+        yield f"{size}px.png", cv2.imencode(".png", image)[1].tobytes()
+        yield f"{size}px.jpg", cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+def settings(args):
+    yield "original", EncodeOptions("original", 0, 0, None)
+    for image_format in args.formats:
+        for max_dimension in args.max_dimensions:
+            qualities = [0] if image_format == "png" else args.qualities
+            for quality in qualities:
+                name = f"{image_format}-q{quality}-{max_dimension or 'full'}"
+                yield name, EncodeOptions(image_format, quality, max_dimension, None)
+
+
+def psnr(reference: np.ndarray, payload: bytes) -> float:
+    decoded = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_GRAYSCALE)
+    height, width = reference.shape[:2]
+    if decoded.shape[:2] != (height, width):
+        decoded = cv2.resize(decoded, (width, height), interpolation=cv2.INTER_CUBIC)
+    return float(cv2.PSNR(reference, decoded))
+
+
+async def ask(client: LLMClient, context: ScanContext, options: EncodeOptions) -> dict:
+    request = build_request(context, payload_options=options)
+    start = time.perf_counter()
+    text = await client.generate(request)
+    call = client.stats()["recent_calls"][-1]
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "prompt_tokens": call["prompt_tokens"],
+        "output_tokens": call["output_tokens"],
+        "answer": {field: parse_scan_result(text).get(field, "") for field in COMPARED_FIELDS},
+    }
+
+
+async def run(args) -> list:
+    client = LLMClient(GeminiBackend()) if args.live else None
+    rows = []
+    for name, data in fixtures(args):
+        context = ScanContext(data, name)
+        reference = context.gray
+        baseline = None
+        for setting, options in settings(args):
+            payload = prepare_image(context, options)
+            sent = payload.encoded_bytes
+            row = {
+                "fixture": name,
+                "setting": setting,
+                "upload_bytes": len(data),
+                "sent_bytes": sent,
+                "base64_bytes": len(payload.data),
+                "reduction": round(1 - sent / len(data), 3),
+                "encode_ms": round(payload.encode_ms, 2),
+                "psnr_db": round(psnr(reference, base64.b64decode(payload.data)), 2),
+                "reencoded": payload.reencoded,
+            }
+            if client is not None:
+                live = await ask(client, context, options)
+                baseline = baseline or live["answer"]
+                row.update(live)
+                row["matches_original"] = live["answer"] == baseline
+            rows.append(row)
+            print(f"{name:<14} {setting:<22} sent={sent:>9} B  reduction={row['reduction']:6.1%}  "
+                  f"psnr={row['psnr_db']:6.2f} dB  encode={row['encode_ms']:7.2f} ms")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048, 4096])
+    parser.add_argument("--images", nargs="+", help="scan files to use instead of synthetic fixtures")
+    parser.add_argument("--formats", nargs="+", default=["jpeg", "webp", "png"])
+    parser.add_argument("--qualities", type=int, nargs="+", default=[95, 85, 70])
+    parser.add_argument("--max-dimensions", type=int, nargs="+", default=[0, 1024, 768])
+    parser.add_argument("--live", action="store_true", help="send every payload to Gemini")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
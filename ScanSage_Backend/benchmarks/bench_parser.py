@@ -0,0 +1,123 @@
+"""
+Equivalence check and timing of the LLM response parser against the
+original per-field regex implementation.
+
+    python -m benchmarks.bench_parser --responses 500 --repeat 20
+    python -m benchmarks.bench_parser --corpus recorded.jsonl
+
+The corpus is --responses synthetic Gemini-style responses, or recorded
+responses from a JSONL file (one JSON string, or an object with a
+"response" field, per line). Every response must parse to exactly the
+reference output; exits non-zero on any mismatch. The JSON structured-output
+path is timed on the same analyses serialized as JSON.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+
+from app.utils.ResponseParser import parse_medical_scan_result, parse_structured_scan_result
+from benchmarks.fixtures import synthetic_llm_response
+
+
+def reference_parse(raw_result: str) -> dict:
+    """The original parser, kept here as the oracle"""
+    expected_fields = [
+        "Scan Type",
+        "Organ",
+        "Tumor Type",
+        "Tumor Subclass",
+        "Detailed Description",
+        "Possible Causes",
+        "Clinical Insights"
+    ]
+    result_dict = {}
+    for field in expected_fields:
+        alternation = "|".join([re.escape(f) for f in expected_fields])
+        pattern = rf"\*?\*?\s*{re.escape(field)}\s*:?\*?\*?\s*(.*?)(?=\*?\*?\s*(?:{alternation})\s*:|\Z)"
+        match = re.search(pattern, raw_result, re.DOTALL)
+        field_key = field.lower().replace(' ', '_')
+        if match:
+            value = match.group(1).strip()
+            value = re.sub(r'\*\*|\*|\n+', ' ', value)
+            value = re.sub(r'\s+', ' ', value).strip()
+            value = re.sub(r'\s*-+\s*$', '', value)
+            result_dict[field_key] = value
+        else:
+            result_dict[field_key] = ""
+
+    disclaimer_pattern = r"(?:Disclaimer|Important\s+Disclaimer)\s*:?\s*(.*?)(?=\Z)"
+    disclaimer_match = re.search(disclaimer_pattern, raw_result, re.DOTALL)
+    if disclaimer_match:
+        disclaimer_text = disclaimer_match.group(1).strip()
+        disclaimer_text = re.sub(r'\*\*|\*|\n+', ' ', disclaimer_text)
+        disclaimer_text = re.sub(r'\s+', ' ', disclaimer_text).strip()
+        disclaimer_text = re.sub(r'\s*-+\s*$', '', disclaimer_text)
+        result_dict["disclaimer"] = disclaimer_text
+
+    user_response_pattern = r"(?:To answer your question|In response to your question|Regarding your question).*?:(.*?)(?=\Z)"
+    user_response_match = re.search(user_response_pattern, raw_result, re.DOTALL)
+    if user_response_match:
+        response_text = user_response_match.group(1).strip()
+        response_text = re.sub(r'\s+', ' ', response_text).strip()
+        result_dict["llm_response"] = response_text
+
+    return result_dict
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["response"] if isinstance(entry, dict) else entry
+
+
+def time_parser(parse, corpus, repeat: int) -> float:
+    """Seconds per response, best of `repeat` passes over the corpus"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for response in corpus:
+            parse(response)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=500, help="synthetic responses when no corpus is given")
+    parser.add_argument("--corpus", help="JSONL file of recorded responses")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = list(load_corpus(args.corpus)) if args.corpus else [
+        synthetic_llm_response(seed) for seed in range(args.responses)
+    ]
+
+    mismatches = []
+    for index, response in enumerate(corpus):
+        expected, actual = reference_parse(response), parse_medical_scan_result(response)
+        if expected != actual:
+            mismatches.append({"index": index, "expected": expected, "actual": actual})
+
+    json_corpus = [json.dumps(reference_parse(response)) for response in corpus]
+    reference_seconds = time_parser(reference_parse, corpus, args.repeat)
+    single_pass_seconds = time_parser(parse_medical_scan_result, corpus, args.repeat)
+    structured_seconds = time_parser(parse_structured_scan_result, json_corpus, args.repeat)
+
+    print(json.dumps({
+        "responses": len(corpus),
+        "mismatches": len(mismatches),
+        "reference_us": round(reference_seconds * 1e6, 2),
+        "single_pass_us": round(single_pass_seconds * 1e6, 2),
+        "structured_json_us": round(structured_seconds * 1e6, 2),
+        "speedup": round(reference_seconds / single_pass_seconds, 2),
+        "first_mismatches": mismatches[:3],
+    }, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
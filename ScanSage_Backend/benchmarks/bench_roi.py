@@ -0,0 +1,118 @@
+"""
+Equivalence check and timing of ROI extraction against the original
+colormap -> HSV -> inRange implementation.
+
+    python -m benchmarks.bench_roi --sizes 512 2048 8192 --seeds 5
+
+For every synthetic scan, the largest region, its ROI crop and the heatmap
+must match the reference. The set of regions above the area threshold is
+compared as well; a largest-box IoU below --tolerance counts as a mismatch
+(only equal-area ties can legitimately differ). Exits non-zero on any mismatch.
+"""
+import argparse
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from app.utils.RegionOfIntrest import MIN_REGION_AREA, extract_roi, find_regions
+from benchmarks.fixtures import synthetic_scan
+
+
+def reference_regions(mri_image):
+    """The original full-resolution mask pipeline, kept here as the oracle"""
+    jet_colored = cv2.applyColorMap(mri_image, cv2.COLORMAP_JET)
+    hsv_image = cv2.cvtColor(jet_colored, cv2.COLOR_BGR2HSV)
+    mask_orange = cv2.inRange(hsv_image, np.array([10, 100, 100]), np.array([25, 255, 255]))
+    mask_red1 = cv2.inRange(hsv_image, np.array([0, 100, 100]), np.array([10, 255, 255]))
+    mask_red2 = cv2.inRange(hsv_image, np.array([170, 100, 100]), np.array([180, 255, 255]))
+    combined_mask = cv2.bitwise_or(mask_orange, cv2.bitwise_or(mask_red1, mask_red2))
+    kernel = np.ones((5, 5), np.uint8)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    max_area, max_contour = 0, None
+    boxes = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > MIN_REGION_AREA:
+            boxes.append(cv2.boundingRect(contour) + (int(area),))
+        if area > max_area:
+            max_area, max_contour = area, contour
+    largest = cv2.boundingRect(max_contour) if max_contour is not None and max_area > MIN_REGION_AREA else None
+    return largest, sorted(boxes), jet_colored
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def fixture_set(sizes, seeds):
+    for size in sizes:
+        for seed in range(seeds):
+            image = synthetic_scan(size, seed, lesions=1 + seed % 4)
+            if seed % 2:
+                # Bright speckle: many tiny candidates, some touching the border
+                rng = np.random.default_rng(seed)
+                ys, xs = rng.integers(0, size, (2, 200))
+                image[ys, xs] = 255
+                image[:3, : size // 3] = 250
+            yield f"{size}px-seed{seed}", image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048, 4096])
+    parser.add_argument("--seeds", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, default=0.99)
+    args = parser.parse_args()
+
+    results, mismatches = [], 0
+    for name, image in fixture_set(args.sizes, args.seeds):
+        start = time.perf_counter()
+        largest, boxes, jet_colored = reference_regions(image)
+        reference_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        regions = find_regions(image)
+        mask_seconds = time.perf_counter() - start
+
+        found = sorted((r["x"], r["y"], r["width"], r["height"], r["area"]) for r in regions)
+        top = tuple(regions[0][key] for key in ("x", "y", "width", "height")) if regions else None
+        ok = found == boxes and (top == largest or (top and largest and iou(top, largest) >= args.tolerance))
+
+        result = extract_roi(image)
+        ok = ok and np.array_equal(cv2.imdecode(np.frombuffer(result.heatmap, np.uint8), cv2.IMREAD_COLOR), jet_colored)
+        if largest is not None:
+            x, y, w, h = largest
+            crop = cv2.imdecode(np.frombuffer(result.roi, np.uint8), cv2.IMREAD_GRAYSCALE)
+            ok = ok and np.array_equal(crop, image[y:y + h, x:x + w])
+        else:
+            ok = ok and result.roi is None
+
+        mismatches += not ok
+        results.append({
+            "fixture": name,
+            "regions": len(regions),
+            "match": bool(ok),
+            "reference_ms": round(reference_seconds * 1000, 2),
+            "mask_ms": round(mask_seconds * 1000, 2),
+            "speedup": round(reference_seconds / mask_seconds, 2),
+        })
+        print(f"{name:<18} regions={len(regions):<4} match={ok!s:<5} "
+              f"reference={reference_seconds * 1000:8.2f} ms  new={mask_seconds * 1000:8.2f} ms")
+
+    print(json.dumps({"mismatches": mismatches, "results": results}, indent=2))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
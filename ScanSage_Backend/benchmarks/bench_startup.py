@@ -0,0 +1,139 @@
+"""
+Cold-start cost of a worker: import-time breakdown of the app, and time
+until a uvicorn worker is live and ready.
+
+    python -m benchmarks.bench_startup --repeat 5 --top 15
+    python -m benchmarks.bench_startup --server
+
+Imports app.main in fresh interpreters under `python -X importtime` and
+reports the wall time of the import plus where it goes, grouped by
+top-level package (self time, so nothing is counted twice). The heavy
+optional modules (TensorFlow, the Gemini SDK) are imported alone as well,
+which is what importing them with the app would add.
+
+--server starts `uvicorn app.main:app` and polls /health/live and
+/health/ready, reporting the seconds until each answers 200 and the
+warm-up steps from the ready response.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Imported alone to show what importing them eagerly would cost
+HEAVY_IMPORTS = ("tensorflow", "google.generativeai", "cv2")
+
+
+def import_profile(statement: str) -> dict:
+    """Wall seconds of `statement` in a fresh interpreter, with its -X importtime lines"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, env=os.environ)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+
+    self_by_package = defaultdict(int)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            # Header line
+            continue
+        modules.add(name)
+        self_by_package[name.split(".")[0]] += int(self_us)
+    return {"seconds": seconds, "self_us_by_package": dict(self_by_package), "modules": modules}
+
+
+def breakdown(repeat: int, top: int) -> dict:
+    runs = [import_profile("import app.main") for _ in range(repeat)]
+    failed = [run for run in runs if "error" in run]
+    if failed:
+        return {"error": failed[0]["error"]}
+    packages = defaultdict(list)
+    for run in runs:
+        for package, micros in run["self_us_by_package"].items():
+            packages[package].append(micros)
+    ranked = sorted(((statistics.median(values) / 1e6, package) for package, values in packages.items()), reverse=True)
+    return {
+        "import_app_seconds": round(statistics.median(run["seconds"] for run in runs), 3),
+        "top_packages_seconds": {package: round(seconds, 4) for seconds, package in ranked[:top]},
+        "heavy_modules_imported": [name for name in HEAVY_IMPORTS if name in runs[0]["modules"]],
+    }
+
+
+def heavy_import_seconds() -> dict:
+    results = {}
+    for name in HEAVY_IMPORTS:
+        profile = import_profile(f"import {name}")
+        results[name] = round(profile["seconds"], 3) if "seconds" in profile else profile["error"]
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_start(timeout: float) -> dict:
+    import httpx
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+    )
+    live = ready = body = None
+    try:
+        while time.perf_counter() - start < timeout and ready is None:
+            if server.poll() is not None:
+                return {"error": f"server exited with status {server.returncode}"}
+            path = "/health/ready" if live is not None else "/health/live"
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}{path}")
+            except httpx.TransportError:
+                response = None
+            if response is not None and response.status_code == 200:
+                if live is None:
+                    live = time.perf_counter() - start
+                else:
+                    ready = time.perf_counter() - start
+                    body = response.json()
+                continue
+            time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "seconds_to_live": round(live, 3) if live is not None else None,
+        "seconds_to_ready": round(ready, 3) if ready is not None else None,
+        "import_seconds": round(body["import_seconds"], 3) if body else None,
+        "warmup_steps_seconds": {step: round(seconds, 3) for step, seconds in body["warmup_steps_seconds"].items()}
+        if body else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="packages listed in the breakdown")
+    parser.add_argument("--server", action="store_true", help="also time a uvicorn worker to live and ready")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    report = {"app": breakdown(args.repeat, args.top), "heavy_imports_seconds": heavy_import_seconds()}
+    if args.server:
+        report["server"] = server_start(args.timeout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Synthetic MRI-like fixtures and Gemini-style responses for benchmarks.
+Fixtures are generated from a seed, so every run measures the same inputs.
+"""
+import random
+
+import cv2
+import numpy as np
+
+
+def synthetic_scan(size: int = 512, seed: int = 0, lesions: int = 1) -> np.ndarray:
+    """
+    Grayscale axial-slice look-alike: a bright elliptical head on a dark
+    background, smooth tissue texture and `lesions` bright blobs that the
+    ROI stage picks up.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.zeros((size, size), np.float32)
+    center = (size // 2, size // 2)
+    cv2.ellipse(image, center, (int(size * 0.38), int(size * 0.45)), 0, 0, 360, 90, -1)
+    texture = cv2.GaussianBlur(rng.normal(0, 25, (size, size)).astype(np.float32), (0, 0), size / 64)
+    image += texture * (image > 0)
+    for _ in range(lesions):
+        x, y = (rng.uniform(0.35, 0.65, 2) * size).astype(int)
+        radius = int(rng.uniform(0.03, 0.08) * size)
+        cv2.circle(image, (int(x), int(y)), radius, 230, -1)
+    image = cv2.GaussianBlur(image, (0, 0), max(size / 256, 1))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_scan_png(size: int = 512, seed: int = 0, lesions: int = 1) -> bytes:
+    return cv2.imencode(".png", synthetic_scan(size, seed, lesions))[1].tobytes()
+
+
+def synthetic_photo_png(size: int = 512, seed: int = 0) -> bytes:
+    """Colourful non-medical image, scored non-medical by the pre-classifier"""
+    rng = np.random.default_rng(seed)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (size, size, 3), dtype=np.uint8), (0, 0), 4)
+    image[..., 2] = 220
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+RESPONSE_FIELDS = [
+    ("Scan Type", ["MRI", "CT Scan", "X-ray", "MRI (T1-weighted, contrast enhanced)"]),
+    ("Organ", ["Brain", "Lung", "Breast", "Heart"]),
+    ("Tumor Type", ["Glioma", "Meningioma", "Adenocarcinoma", "None detected", "Pituitary adenoma -"]),
+    ("Tumor Subclass", ["Low-grade", "Grade IV glioblastoma", "N/A", "Not applicable --"]),
+    ("Detailed Description", [
+        "A well-defined hyperintense lesion of about 2 cm in the left frontal lobe.",
+        "Irregular mass in the right upper lobe.\n  * Size: 3.1 x 2.4 cm\n  * Margins: spiculated",
+        "No focal lesion. The Organ appears normal in size and shape,\nwith no mass effect.",
+    ]),
+    ("Possible Causes", [
+        "Genetic mutations, prior radiation exposure.",
+        "Smoking history;\n- environmental exposure\n- family history",
+        "Unknown - further work-up needed -",
+    ]),
+    ("Clinical Insights", [
+        "Findings are consistent with a glioma; further evaluation is recommended.",
+        "Recommend biopsy and **contrast-enhanced** follow-up in 3 months.",
+        "Correlate with clinical symptoms.\n\n---",
+    ]),
+]
+
+# Header layouts seen in Gemini responses
+RESPONSE_HEADERS = ["**{}:** ", "**{}**: ", "{}: ", "- **{}:** ", "* **{}:**\n", "## {}:\n", "{} : ", "**{}:**\n\n"]
+
+
+def synthetic_llm_response(seed: int = 0) -> str:
+    """
+    Markdown scan analysis in one of the layouts Gemini produces: bold,
+    plain, bulleted or heading field names, multi-line values, missing or
+    reordered fields, and optional disclaimer and answer to a question.
+    """
+    rng = random.Random(seed)
+    layout = rng.choice(RESPONSE_HEADERS)
+    parts = []
+    if rng.random() < 0.3:
+        parts.append("Here is the structured analysis of the provided scan:\n")
+    fields = list(RESPONSE_FIELDS)
+    if rng.random() < 0.2:
+        rng.shuffle(fields)
+    for field, values in fields:
+        if rng.random() < 0.1:
+            continue
+        header = layout if rng.random() < 0.9 else rng.choice(RESPONSE_HEADERS)
+        parts.append(header.format(field) + rng.choice(values))
+    if rng.random() < 0.6:
+        parts.append(rng.choice(["**Disclaimer:** ", "Important Disclaimer: ", "*Disclaimer*\n"])
+                     + "This is a computational analysis and not a medical diagnosis.")
+    if rng.random() < 0.4:
+        parts.append(rng.choice(["To answer your question: ", "Regarding your question about the size:\n",
+                                 "In response to your question, here is more detail: "])
+                     + "The lesion measures roughly 2 cm.\n\nPlease consult a radiologist.")
+    return rng.choice(["\n", "\n\n"]).join(parts)
@@ -0,0 +1,307 @@
+"""
+In-process load generator for every router of the API.
+
+    python -m benchmarks.load --scenarios analyze chat --concurrency 8 --requests 200
+    python -m benchmarks.load --duration 30 --llm-latency-ms 800 --output load.json
+
+Runs the FastAPI app (lifespan included) in this process and drives it over
+an ASGI transport, so no server or network is involved. Gemini is replaced
+by the deterministic fake backend with --llm-latency-ms of latency per call,
+and the classifiers by tiny seeded stand-ins (see benchmarks.models) unless
+--models points at a directory of real ones. Results and artifacts go to a
+temporary cache, so runs do not share state.
+
+Every scenario runs --concurrency clients for --requests requests (or
+--duration seconds) and reports throughput, p50/p95/p99 latency, responses
+by status and the peak RSS of the process. Uploads are synthetic MRI-like
+scans at --sizes; with the default --cache cold each upload is byte-unique,
+so every request misses the result caches, and --cache warm cycles a pool
+of --pool images instead. --routing serves a second set of stand-ins as a
+canary, shadow or ensemble member of the first (see benchmarks.models), to
+measure what each routing costs the responses.
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from benchmarks.fixtures import synthetic_scan, synthetic_scan_png
+from benchmarks.models import ROUTINGS
+from benchmarks.report import RssSampler, latency_summary, megabytes, peak_rss_bytes, write_report
+
+ORGANS = ("Brain", "Lung", "Breast")
+# Slices in each synthetic .npy study
+STUDY_SLICES = 16
+# Seconds between polls of a job's result
+JOB_POLL_INTERVAL = 0.01
+STATS_ENDPOINTS = (
+    "/", "/api/cache", "/api/models", "/api/models/batching", "/api/models/llm", "/api/models/speculation",
+    "/api/models/organ-detector", "/api/models/routing", "/api/uploads", "/api/admission", "/api/jobs", "/metrics",
+    "/health/live", "/health/ready",
+)
+
+
+class Fixtures:
+    """
+    Seeded uploads for the scenarios. A cold upload gets its request index
+    appended after the PNG end marker: decoders ignore it, but it changes the
+    content hash, so the result caches never hit.
+    """
+
+    def __init__(self, sizes: List[int], pool: int = 16, cold: bool = True):
+        self.cold = cold
+        self.scans = [synthetic_scan_png(sizes[seed % len(sizes)], seed, lesions=1 + seed % 3) for seed in range(pool)]
+        self.studies = [self._study(seed) for seed in range(max(pool // 4, 1))]
+
+    @staticmethod
+    def _study(seed: int) -> bytes:
+        volume = np.stack([synthetic_scan(256, seed * STUDY_SLICES + k) for k in range(STUDY_SLICES)])
+        buffer = io.BytesIO()
+        np.save(buffer, volume)
+        return buffer.getvalue()
+
+    def _unique(self, data: bytes, index: int) -> bytes:
+        return data + index.to_bytes(8, "big") if self.cold else data
+
+    def scan(self, index: int) -> tuple:
+        return f"scan-{index}.png", self._unique(self.scans[index % len(self.scans)], index), "image/png"
+
+    def study(self, index: int) -> tuple:
+        # np.load reads exactly the array, so trailing bytes make .npy uploads unique too
+        return f"study-{index}.npy", self._unique(self.studies[index % len(self.studies)], index), "application/x-npy"
+
+
+Send = Callable[["httpx.AsyncClient", Fixtures, int], Awaitable["httpx.Response"]]
+
+
+class Scenario(NamedTuple):
+    name: str
+    description: str
+    send: Send
+
+
+async def _analyze(client, fixtures, index):
+    return await client.post("/api/analyze", files={"file": fixtures.scan(index)})
+
+
+async def _predict(client, fixtures, index):
+    return await client.post(f"/api/predict/{ORGANS[index % len(ORGANS)]}", files={"file": fixtures.scan(index)})
+
+
+async def _chat(client, fixtures, index):
+    return await client.post("/api/chat", data={"message": "Is there a tumor?"},
+                             files=[("images", fixtures.scan(index))])
+
+
+async def _chat_text(client, fixtures, index):
+    return await client.post("/api/chat", data={"message": f"What does a T2 hyperintense lesion mean? ({index})"})
+
+
+async def _process_image(client, fixtures, index):
+    return await client.post("/process-image", files={"file": fixtures.scan(index)})
+
+
+async def _batch(client, fixtures, index):
+    images = [("images", fixtures.scan(index * 4 + k)) for k in range(4)]
+    # The whole NDJSON stream is read, so latency covers every image
+    return await client.post("/api/batch/scan", files=images)
+
+
+async def _study(client, fixtures, index):
+    return await client.post("/api/study/scan", files=[("files", fixtures.study(index))])
+
+
+async def _job(client, fixtures, index):
+    """Submit an analysis job and poll until its result is ready"""
+    response = await client.post("/api/jobs/analyze", files={"file": fixtures.scan(index)})
+    if response.status_code != 202:
+        return response
+    result_url = response.json()["result_url"]
+    while True:
+        response = await client.get(result_url)
+        if response.status_code != 202:
+            return response
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+async def _artifact(client, fixtures, index):
+    """Heatmaps returned by reference, then fetched from /api/artifacts"""
+    response = await client.post("/process-image", params={"transport": "url"}, files={"file": fixtures.scan(index)})
+    if response.status_code != 200:
+        return response
+    return await client.get(response.json()["heatmap"])
+
+
+async def _stats(client, fixtures, index):
+    return await client.get(STATS_ENDPOINTS[index % len(STATS_ENDPOINTS)])
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("analyze", "POST /api/analyze", _analyze),
+    Scenario("predict", "POST /api/predict/{organ}, organs in turn", _predict),
+    Scenario("chat", "POST /api/chat with one scan", _chat),
+    Scenario("chat_text", "POST /api/chat without images", _chat_text),
+    Scenario("process_image", "POST /process-image", _process_image),
+    Scenario("batch", "POST /api/batch/scan with four scans, stream read to the end", _batch),
+    Scenario("study", f"POST /api/study/scan with a {STUDY_SLICES}-slice .npy volume", _study),
+    Scenario("jobs", "POST /api/jobs/analyze, then poll the result", _job),
+    Scenario("artifacts", "POST /process-image?transport=url, then GET the heatmap artifact", _artifact),
+    Scenario("stats", "GET the stats endpoints and /metrics in turn", _stats),
+)}
+
+
+def offline_environment(workdir: str, models_dir: str, llm_latency_ms: float) -> None:
+    """
+    Settings for an offline run; must be applied before app.config is imported.
+    Other settings still come from the environment and .env.
+    """
+    from benchmarks.models import use_models
+    use_models(models_dir)
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(llm_latency_ms)
+    os.environ["CACHE_DB_PATH"] = os.path.join(workdir, "cache.sqlite3")
+    os.environ["JOB_BACKEND"] = "memory"
+
+
+async def run_scenario(client, scenario: Scenario, fixtures: Fixtures, concurrency: int,
+                       requests: Optional[int] = None, duration: Optional[float] = None) -> dict:
+    """Closed loop: each of `concurrency` clients sends its next request as soon as the last one returns"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(requests if requests is not None else 1 << 62))
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        for index in counter:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                response = await scenario.send(client, fixtures, index)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    return {
+        **latency_summary(latencies, wall),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": dict(statuses),
+        "seconds": round(wall, 3),
+        "peak_rss_mb": megabytes(sampler.peak),
+    }
+
+
+async def wait_until_ready(client) -> None:
+    """Wait for the background warm-up, so scenarios measure a warm worker"""
+    while True:
+        response = await client.get("/health/ready")
+        if response.status_code == 200:
+            return
+        if response.json()["state"] == "failed":
+            raise RuntimeError(f"Warm-up failed: {response.json()['error']}")
+        await asyncio.sleep(0.05)
+
+
+async def run_load(scenarios: List[str], concurrency: int = 8, requests: Optional[int] = 100,
+                   duration: Optional[float] = None, sizes: List[int] = (512,), pool: int = 16,
+                   cold: bool = True, warmup: int = 4) -> Dict[str, dict]:
+    """Start the app once and run the scenarios one after another"""
+    import httpx
+    from app.main import app
+
+    fixtures = Fixtures(list(sizes), pool, cold)
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await wait_until_ready(client)
+            for name in scenarios:
+                scenario = SCENARIOS[name]
+                # Untimed requests first, so lazy model loads and graph tracing are not measured;
+                # they use indices past the measured ones, so their results are not cached for them
+                for index in range(warmup):
+                    await scenario.send(client, fixtures, (1 << 40) + index)
+                results[name] = await run_scenario(client, scenario, fixtures, concurrency, requests, duration)
+    return results
+
+
+def add_load_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--duration", type=float, help="seconds per scenario, instead of --requests")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512], help="scan resolutions, used in turn")
+    parser.add_argument("--pool", type=int, default=16, help="distinct synthetic scans")
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--models", help="directory with brain_model.h5, lung_tumor.h5 and breast_tumor.h5; "
+                                         "tiny stand-ins are built in a temporary directory by default")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the stand-in models")
+    parser.add_argument("--routing", choices=list(ROUTINGS), default="single",
+                        help="serve a second set of stand-ins as canary, shadow or ensemble member")
+
+
+def prepare(args, workdir: str) -> None:
+    """Point the app at the models and offline settings; call before importing app modules"""
+    from benchmarks.models import MODEL_FILES, build_models, write_manifest
+    models_dir = args.models or os.path.join(workdir, "models")
+    offline_environment(workdir, models_dir, args.llm_latency_ms)
+    if args.routing != "single":
+        # Set before build_models imports app.config; the v2 stand-ins get their own seeds
+        second = os.path.join(workdir, "models-v2")
+        os.environ["MODEL_MANIFEST"] = write_manifest(
+            os.path.join(workdir, "manifest.json"), models_dir, second, args.routing
+        )
+        build_models(second, args.seed + len(MODEL_FILES))
+    if not args.models:
+        build_models(models_dir, args.seed)
+
+
+def load_parameters(args) -> dict:
+    return {
+        "concurrency": args.concurrency,
+        "requests": None if args.duration else args.requests,
+        "duration": args.duration,
+        "sizes": args.sizes,
+        "pool": args.pool,
+        "cache": args.cache,
+        "llm_latency_ms": args.llm_latency_ms,
+        "models": "stand-in" if not args.models else args.models,
+        "routing": args.routing,
+    }
+
+
+def run_from_args(args) -> dict:
+    results = asyncio.run(run_load(
+        args.scenarios, args.concurrency, None if args.duration else args.requests, args.duration,
+        args.sizes, args.pool, args.cache == "cold",
+    ))
+    return {"parameters": load_parameters(args), "scenarios": results, "peak_rss_mb": megabytes(peak_rss_bytes())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_load_arguments(parser)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="scansage-bench-") as workdir:
+        prepare(args, workdir)
+        write_report(run_from_args(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
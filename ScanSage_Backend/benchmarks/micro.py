@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks of the CPU stages that run on every request.
+
+    python -m benchmarks.micro --sizes 512 1024 2048 --repeat 50
+
+  - parser: text (markdown) and JSON scan analyses from the LLM
+  - roi: region search and full ROI extraction per scan resolution
+  - preprocessing: classifier input tensors per organ and scan resolution
+  - cache: in-memory hits, disk hits and misses of the result cache
+
+Each case reports calls per second and p50/p95/p99 per call as JSON.
+Fixtures are seeded, so reruns measure the same inputs.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List
+
+from benchmarks.fixtures import synthetic_llm_response, synthetic_scan, synthetic_scan_png
+from benchmarks.report import latency_summary, write_report
+
+CASES = ("parser", "roi", "preprocessing", "cache")
+
+
+def measure(func: Callable, repeat: int, inputs: List = None) -> dict:
+    """Time `repeat` calls of func, cycling through `inputs` (one argument each) if given"""
+    inputs = inputs or [None]
+    # One untimed call so lazy imports and first-use allocations are not measured
+    func(*([] if inputs[0] is None else [inputs[0]]))
+    samples = []
+    for index in range(repeat):
+        argument = inputs[index % len(inputs)]
+        start = time.perf_counter()
+        func(*([] if argument is None else [argument]))
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def bench_parser(repeat: int) -> dict:
+    from app.utils.ResponseParser import parse_medical_scan_result, parse_structured_scan_result
+    responses = [synthetic_llm_response(seed) for seed in range(200)]
+    structured = [json.dumps(parse_medical_scan_result(response)) for response in responses]
+    return {
+        "text": measure(parse_medical_scan_result, repeat * 10, responses),
+        "json": measure(parse_structured_scan_result, repeat * 10, structured),
+    }
+
+
+def bench_roi(sizes: Iterable[int], repeat: int) -> dict:
+    from app.utils.RegionOfIntrest import extract_roi, find_regions
+    results = {}
+    for size in sizes:
+        scans = [synthetic_scan(size, seed, lesions=1 + seed % 3) for seed in range(4)]
+        results[str(size)] = {
+            "find_regions": measure(find_regions, repeat, scans),
+            "extract_roi": measure(extract_roi, repeat, scans),
+        }
+    return results
+
+
+def bench_preprocessing(sizes: Iterable[int], repeat: int) -> dict:
+    from app.services.model_registry import MODEL_SPECS
+    from app.utils.preprocessing import decode_image, preprocess_batch
+    results = {}
+    for size in sizes:
+        uploads = [synthetic_scan_png(size, seed) for seed in range(4)]
+        decoded = [decode_image(upload) for upload in uploads]
+        results[str(size)] = {"decode": measure(decode_image, repeat, uploads)}
+        for organ, (img_size, _) in MODEL_SPECS.items():
+            results[str(size)][organ] = measure(lambda image: preprocess_batch([image], img_size), repeat, decoded)
+    return results
+
+
+def bench_cache(repeat: int) -> dict:
+    from app.utils.cache import ImageCache
+    keys = [synthetic_scan_png(64, seed) for seed in range(256)]
+    value = {"prediction": "Glioma", "confidence_level": 0.9, "heatmap": b"\0" * 4096}
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        memory = ImageCache(max_size=len(keys), disk_path=None, sweep_interval=0, namespace="bench")
+        disk = ImageCache(max_size=len(keys), disk_path=os.path.join(directory, "cache.sqlite3"),
+                          sweep_interval=0, namespace="bench")
+        for key in keys:
+            memory.set(key, value)
+            disk.set(key, value)
+        results["memory_hit"] = measure(memory.get, repeat * 10, keys)
+        results["miss"] = measure(lambda key: memory.get(key, "absent"), repeat * 10, keys)
+        results["set"] = measure(lambda key: memory.set(key, value, "other"), repeat * 10, keys)
+
+        # Empty the memory tier so every lookup goes to SQLite
+        cold = ImageCache(max_size=1, disk_path=os.path.join(directory, "cache.sqlite3"),
+                          sweep_interval=0, namespace="bench")
+        results["disk_hit"] = measure(cold.get, repeat * 10, keys)
+        for cache in (disk, cold):
+            cache.disk.conn.close()
+    return results
+
+
+def run_micro(cases: Iterable[str] = CASES, sizes: Iterable[int] = (512, 1024, 2048), repeat: int = 50) -> Dict[str, dict]:
+    sizes = list(sizes)
+    runners = {
+        "parser": lambda: bench_parser(repeat),
+        "roi": lambda: bench_roi(sizes, repeat),
+        "preprocessing": lambda: bench_preprocessing(sizes, repeat),
+        "cache": lambda: bench_cache(repeat),
+    }
+    return {case: runners[case]() for case in cases}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    write_report(run_micro(args.cases, args.sizes, args.repeat), args.output)
+
+
+if __name__ == "__main__":
+    main()
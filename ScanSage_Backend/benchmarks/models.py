@@ -0,0 +1,105 @@
+"""
+Tiny randomly initialized stand-ins for the organ classifiers.
+
+    python -m benchmarks.models --output bench-models
+
+Each stand-in takes the real model's input size and returns its number of
+classes, so the whole serving path (preprocessing, batching, graph tracing,
+result formatting) runs as in production, at a fraction of the compute.
+Weights come from --seed, so every build gives the same predictions.
+Point BRAIN_MODEL_PATH / LUNG_MODEL_PATH / BREAST_MODEL_PATH at the files,
+or serve two sets as versions of each organ with a manifest (write_manifest).
+"""
+import argparse
+import json
+import os
+from typing import Dict
+
+# Same file names as the real models in models/
+MODEL_FILES = {
+    "Brain": "brain_model.h5",
+    "Lung": "lung_tumor.h5",
+    "Breast": "breast_tumor.h5",
+}
+# Environment variable read by app.config for each organ
+MODEL_ENV = {
+    "Brain": "BRAIN_MODEL_PATH",
+    "Lung": "LUNG_MODEL_PATH",
+    "Breast": "BREAST_MODEL_PATH",
+}
+# Manifest routes serving a second set of models as version v2: canary for
+# half the scans, shadow of every request, or averaged with v1
+ROUTINGS = {
+    "single": None,
+    "canary": {"primary": "v1", "canary": {"v2": 0.5}},
+    "shadow": {"primary": "v1", "shadow": ["v2"]},
+    "ensemble": {"ensemble": ["v1", "v2"]},
+}
+
+
+def model_paths(directory: str) -> Dict[str, str]:
+    return {organ: os.path.join(directory, name) for organ, name in MODEL_FILES.items()}
+
+
+def build_model(input_size, classes: int, seed: int = 0):
+    """Strided convolution, global pooling and a softmax head: a few thousand weights"""
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(seed)
+    width, height = input_size
+    inputs = tf.keras.Input(shape=(height, width, 3))
+    x = tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu")(inputs)
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(classes, activation="softmax")(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def build_models(directory: str, seed: int = 0, force: bool = False) -> Dict[str, str]:
+    """Write a stand-in for every organ missing from `directory`; returns organ -> path"""
+    # Imported here so callers can point app.config at the stand-ins first
+    from app.services.model_registry import MODEL_SPECS
+
+    os.makedirs(directory, exist_ok=True)
+    paths = model_paths(directory)
+    for index, (organ, path) in enumerate(paths.items()):
+        if os.path.exists(path) and not force:
+            continue
+        input_size, labels = MODEL_SPECS[organ]
+        build_model(input_size, len(labels), seed + index).save(path)
+    return paths
+
+
+def use_models(directory: str) -> Dict[str, str]:
+    """Point the app (and worker processes it spawns) at the models in `directory`"""
+    paths = model_paths(directory)
+    for organ, path in paths.items():
+        os.environ[MODEL_ENV[organ]] = path
+    os.environ["MODEL_MANIFEST"] = ""
+    return paths
+
+
+def write_manifest(path: str, first: str, second: str, routing: str) -> str:
+    """Manifest serving the models in `first` as v1 and those in `second` as v2, routed per ROUTINGS"""
+    manifest = {
+        organ: {
+            **ROUTINGS[routing],
+            "versions": {"v1": {"path": os.path.join(first, name)}, "v2": {"path": os.path.join(second, name)}},
+        }
+        for organ, name in MODEL_FILES.items()
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench-models")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="rebuild models that already exist")
+    args = parser.parse_args()
+    print(json.dumps(build_models(args.output, args.seed, args.force), indent=2))
+
+
+if __name__ == "__main__":
+    main()
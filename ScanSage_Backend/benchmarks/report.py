@@ -0,0 +1,124 @@
+"""
+Latency summaries, memory sampling and baseline comparison shared by the
+micro-benchmarks and the load generator.
+"""
+import json
+import os
+import resource
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# Digits kept in reports, so reruns on the same machine differ only in real changes
+DIGITS = 3
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def latency_summary(seconds: Iterable[float], wall_seconds: Optional[float] = None) -> dict:
+    """Call count, throughput and p50/p95/p99/max latency in milliseconds"""
+    ordered = sorted(seconds)
+    wall = wall_seconds if wall_seconds is not None else sum(ordered)
+    return {
+        "count": len(ordered),
+        "per_second": round(len(ordered) / wall, DIGITS) if wall else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, DIGITS),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, DIGITS),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, DIGITS),
+        "max_ms": round(ordered[-1] * 1000, DIGITS) if ordered else 0.0,
+    }
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(threading.Thread):
+    """
+    Peak resident set size of this process while a block runs:
+    `with RssSampler() as sampler: ...` then sampler.peak
+    """
+
+    def __init__(self, interval: float = 0.02):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def megabytes(size: int) -> float:
+    return round(size / 2 ** 20, 1)
+
+
+def write_report(report: dict, path: Optional[str]) -> None:
+    """Sorted, indented JSON, so two reports diff line by line"""
+    text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text, end="")
+
+
+def _flatten(report: dict, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def _higher_is_worse(metric: str) -> Optional[bool]:
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.endswith(("_ms", "_mb")) or leaf == "errors":
+        return True
+    if leaf.endswith("per_second"):
+        return False
+    # Counts and parameters are context, not results
+    return None
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> List[dict]:
+    """
+    Metrics that got worse by more than `threshold` (relative) against the
+    baseline report: higher latencies, memory or errors, lower throughput.
+    """
+    before, after = _flatten(baseline), _flatten(current)
+    regressions = []
+    for metric in sorted(before.keys() & after.keys()):
+        direction = _higher_is_worse(metric)
+        if direction is None:
+            continue
+        old, new = before[metric], after[metric]
+        change = (new - old) / old if old else (1.0 if new else 0.0)
+        if (change if direction else -change) > threshold:
+            regressions.append({"metric": metric, "baseline": old, "current": new, "change": round(change, DIGITS)})
+    return regressions
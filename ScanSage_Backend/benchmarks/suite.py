@@ -0,0 +1,75 @@
+"""
+Reproducible offline benchmark suite: micro-benchmarks plus end-to-end load
+scenarios for every router, in one JSON report.
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output new.json --baseline bench.json
+    python -m benchmarks.suite --quick
+
+Needs no network, API key or real models: Gemini is the fake backend and
+the classifiers are tiny seeded stand-ins (see benchmarks.load). Keys are
+sorted and values rounded, so reports from two commits diff cleanly; with
+--baseline, metrics that got worse by more than --threshold are listed
+and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+from benchmarks.load import add_load_arguments, prepare, run_from_args
+from benchmarks.micro import CASES, run_micro
+from benchmarks.report import compare, write_report
+
+
+def environment() -> dict:
+    import cv2
+    import numpy as np
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_load_arguments(parser)
+    parser.add_argument("--micro-cases", nargs="*", choices=CASES, default=list(CASES),
+                        help="micro-benchmarks to run; none skips them")
+    parser.add_argument("--micro-sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--micro-repeat", type=int, default=50)
+    parser.add_argument("--quick", action="store_true", help="small run for a smoke check")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+    if args.quick:
+        args.requests, args.duration, args.concurrency = 20, None, 4
+        args.micro_sizes, args.micro_repeat = [512], 10
+
+    with tempfile.TemporaryDirectory(prefix="scansage-bench-") as workdir:
+        # Before any app module is imported, so app.config sees the offline settings
+        prepare(args, workdir)
+        report = {
+            "environment": environment(),
+            "micro": run_micro(args.micro_cases, args.micro_sizes, args.micro_repeat),
+            "load": run_from_args(args),
+        }
+    write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression['metric']} {regression['baseline']} -> {regression['current']} "
+                  f"({regression['change']:+.1%})", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
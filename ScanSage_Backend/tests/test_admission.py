@@ -0,0 +1,176 @@
+"""
+Admission control: priority hand-off between lanes, queue-full and
+wait-timeout 503s, slots handed to a waiter that is cancelled, and the 429
+request cap of the middleware.
+"""
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionMiddleware, Overloaded, Stage
+
+QUEUES = {"interactive": 4, "batch": 4}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def waiter(stage, lane, order, hold=0.0):
+    async with stage.slot(lane):
+        order.append(lane)
+        await asyncio.sleep(hold)
+
+
+def test_interactive_waiters_are_served_before_batch():
+    async def scenario():
+        stage = Stage("cnn", 1, QUEUES, max_wait=5)
+        order = []
+        await stage._acquire("batch")
+        # Batch work queued first still runs after interactive work queued later
+        tasks = [asyncio.create_task(waiter(stage, lane, order)) for lane in ("batch", "batch", "interactive")]
+        await asyncio.sleep(0.01)
+        assert stage.stats()["queued"] == {"interactive": 1, "batch": 2}
+        stage._release()
+        await asyncio.gather(*tasks)
+        return order, stage.active
+
+    order, active = run(scenario())
+    assert order == ["interactive", "batch", "batch"]
+    assert active == 0
+
+
+def test_full_lane_queue_is_refused_with_retry_after():
+    async def scenario():
+        stage = Stage("llm", 1, {"interactive": 1, "batch": 1}, max_wait=5)
+        await stage._acquire("interactive")
+        queued = asyncio.create_task(waiter(stage, "interactive", []))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as refused:
+            await stage._acquire("interactive")
+        # The other lane has its own queue
+        other = asyncio.create_task(waiter(stage, "batch", []))
+        await asyncio.sleep(0.01)
+        stage._release()
+        await asyncio.gather(queued, other)
+        return refused.value, stage
+
+    error, stage = run(scenario())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    assert stage.rejected == {"interactive": 1, "batch": 0}
+    assert stage.active == 0
+
+
+def test_wait_timeout_is_refused_without_leaking_the_slot():
+    async def scenario():
+        stage = Stage("opencv", 1, QUEUES, max_wait=0.05)
+        await stage._acquire("interactive")
+        with pytest.raises(Overloaded) as refused:
+            await stage._acquire("interactive")
+        assert stage.queued() == 0
+        stage._release()
+        # The stage is free again for the next caller
+        await waiter(stage, "interactive", [])
+        return refused.value, stage
+
+    error, stage = run(scenario())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert stage.timed_out["interactive"] == 1
+    assert stage.active == 0
+
+
+def test_cancelled_waiter_passes_a_handed_slot_on():
+    async def scenario():
+        stage = Stage("cnn", 1, QUEUES, max_wait=5)
+        order = []
+        await stage._acquire("interactive")
+        first = asyncio.create_task(waiter(stage, "interactive", order))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(waiter(stage, "batch", order))
+        await asyncio.sleep(0.01)
+        # Hand the slot to the first waiter, then cancel it before it runs
+        stage._release()
+        first.cancel()
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        return order, results, stage
+
+    order, results, stage = run(scenario())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert order == ["batch"]
+    assert stage.active == 0
+    assert stage.queued() == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        stage = Stage("cnn", 1, QUEUES, max_wait=5)
+        await stage._acquire("interactive")
+        task = asyncio.create_task(waiter(stage, "interactive", []))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        queued = stage.queued()
+        stage._release()
+        return queued, stage.active
+
+    assert run(scenario()) == (0, 0)
+
+
+def asgi_call(middleware, path="/api/predict/brain"):
+    """Send one request through the middleware; returns (messages sent, body reads, app called)"""
+    sent, reads, called = [], [], []
+
+    async def receive():
+        reads.append(path)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    async def app(scope, receive, send):
+        called.append(scope["path"])
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    middleware.app = app
+    scope = {"type": "http", "path": path, "headers": []}
+    run(middleware(scope, receive, send))
+    return sent, reads, called
+
+
+def controller(interactive=1, batch=1):
+    stages = {name: Stage(name, 1, QUEUES) for name in ("llm", "cnn", "opencv")}
+    return AdmissionController(stages, {"interactive": interactive, "batch": batch})
+
+
+def test_middleware_refuses_over_the_cap_before_reading_the_body():
+    admission = controller(interactive=1)
+    admission.enter("interactive")
+    sent, reads, called = asgi_call(AdmissionMiddleware(None, admission))
+
+    start = sent[0]
+    assert start["status"] == 429
+    assert dict(start["headers"])[b"retry-after"] >= b"1"
+    assert reads == [] and called == []
+    assert admission.refused["interactive"] == 1
+
+
+def test_middleware_admits_under_the_cap_and_counts_the_request_out():
+    admission = controller(interactive=1)
+    sent, reads, called = asgi_call(AdmissionMiddleware(None, admission))
+
+    assert sent[0]["status"] == 200
+    assert called == ["/api/predict/brain"]
+    assert admission.requests["interactive"] == 0
+
+
+def test_middleware_lets_ungated_paths_through():
+    admission = controller(interactive=1)
+    admission.enter("interactive")
+    sent, _, called = asgi_call(AdmissionMiddleware(None, admission), path="/health/live")
+
+    assert sent[0]["status"] == 200
+    assert called == ["/health/live"]
@@ -0,0 +1,78 @@
+"""
+Pre-classifier decisions on fixture scans: grayscale, pseudo-colour,
+low-contrast and photo inputs.
+
+    python -m pytest tests
+"""
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.organ_detector import OrganDetector
+from benchmarks.fixtures import synthetic_photo_png, synthetic_scan
+
+
+def grayscale():
+    return cv2.cvtColor(synthetic_scan(), cv2.COLOR_GRAY2RGB)
+
+
+def pseudo_colour():
+    """JET render of the scan, as exported by many viewers"""
+    return cv2.cvtColor(cv2.applyColorMap(synthetic_scan(), cv2.COLORMAP_JET), cv2.COLOR_BGR2RGB)
+
+
+def low_contrast():
+    """The scan dimmed to 15% intensity"""
+    return (grayscale() * 0.15).astype(np.uint8)
+
+
+def photo():
+    image = cv2.imdecode(np.frombuffer(synthetic_photo_png(), np.uint8), cv2.IMREAD_COLOR)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def blank():
+    return np.full((512, 512, 3), 40, np.uint8)
+
+
+@pytest.mark.parametrize("image", [grayscale, pseudo_colour, low_contrast, photo, blank])
+def test_nothing_is_rejected_by_default(image):
+    decision = OrganDetector(reject=False).detect(image())
+    assert not decision["rejected"]
+
+
+@pytest.mark.parametrize("image", [grayscale, low_contrast])
+def test_grayscale_scans_pass(image):
+    decision = OrganDetector(reject=True).detect(image())
+    assert decision["is_medical"]
+    assert not decision["rejected"]
+
+
+def test_low_contrast_scores_like_the_original():
+    detector = OrganDetector()
+    assert detector.detect(low_contrast())["medical_score"] == detector.detect(grayscale())["medical_score"]
+
+
+@pytest.mark.parametrize("image", [photo, blank])
+def test_non_scans_are_rejected_when_enabled(image):
+    decision = OrganDetector(reject=True).detect(image())
+    assert not decision["is_medical"]
+    assert decision["rejected"]
+
+
+def test_pseudo_colour_is_only_logged_by_default():
+    # The colour heuristic cannot tell a pseudo-colour render from a photo
+    decision = OrganDetector(reject=False).detect(pseudo_colour())
+    assert not decision["is_medical"]
+    assert not decision["rejected"]
+
+
+def test_stats_count_rejections():
+    detector = OrganDetector(reject=True)
+    detector.detect(grayscale())
+    detector.detect(photo())
+    stats = detector.stats()
+    assert stats["reject"]
+    assert stats["decisions"]["medical"] == 1
+    assert stats["decisions"]["non_medical"] == 1
+    assert stats["decisions"]["rejected"] == 1
@@ -0,0 +1,133 @@
+"""
+Webhook URL checks and delivery: internal addresses are refused, the
+allowlist lets listed hosts through, and delivery goes to the address that
+was checked without following redirects. DNS and HTTP are stubbed.
+"""
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+from app.services import job_queue
+from app.services.job_queue import Job, JobRunner, resolve_webhook
+
+PUBLIC = "93.184.216.34"
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    """Host name -> addresses it resolves to; unknown names do not resolve"""
+    records = {}
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in records:
+            raise socket.gaierror(f"unknown host {host}")
+        return [(socket.AF_INET6 if ":" in address else socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))
+                for address in records[host]]
+
+    monkeypatch.setattr(job_queue.socket, "getaddrinfo", getaddrinfo)
+    return records
+
+
+@pytest.mark.parametrize("addresses", [
+    ["127.0.0.1"],
+    ["::1"],
+    ["169.254.169.254"],
+    ["10.0.0.5"],
+    ["192.168.1.20"],
+    ["172.16.0.1"],
+    [PUBLIC, "10.0.0.5"],
+])
+def test_internal_addresses_are_refused(dns, addresses):
+    dns["hooks.example.org"] = addresses
+    with pytest.raises(ValueError):
+        resolve_webhook("https://hooks.example.org/notify", [])
+
+
+def test_public_address_is_accepted(dns):
+    dns["hooks.example.org"] = [PUBLIC]
+    assert resolve_webhook("https://hooks.example.org/notify", []) == PUBLIC
+
+
+@pytest.mark.parametrize("url", ["ftp://hooks.example.org/x", "https:///x", "file:///etc/passwd"])
+def test_non_http_urls_are_refused(dns, url):
+    with pytest.raises(ValueError):
+        resolve_webhook(url, [])
+
+
+def test_unresolvable_host_is_refused(dns):
+    with pytest.raises(ValueError):
+        resolve_webhook("https://missing.example.org/x", [])
+
+
+def test_allowlist_lets_listed_hosts_through(dns):
+    dns["hooks.internal"] = ["10.0.0.5"]
+    dns["hooks.example.org"] = [PUBLIC]
+    assert resolve_webhook("http://hooks.internal:8080/x", ["hooks.internal"]) == "10.0.0.5"
+    with pytest.raises(ValueError):
+        resolve_webhook("https://hooks.example.org/x", ["hooks.internal"])
+
+
+@pytest.fixture
+def http(monkeypatch):
+    """Requests the webhook client sends, answered by `responses` in order (200 once they run out)"""
+    sent, responses = [], []
+
+    def handler(request):
+        sent.append(request)
+        return responses.pop(0) if responses else httpx.Response(200)
+
+    class Client(httpx.AsyncClient):
+        def __init__(self, **kwargs):
+            self.options = kwargs
+            super().__init__(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", Client)
+    return sent, responses
+
+
+def deliver(url):
+    runner = JobRunner(store=None)
+
+    async def get(job_id):
+        return Job(job_id, "predict", {}, status="done")
+
+    runner.get = get
+    asyncio.run(runner._send_webhook("job-1", url))
+    return runner
+
+
+def test_delivery_connects_to_the_checked_address(dns, http):
+    sent, _ = http
+    dns["hooks.example.org"] = [PUBLIC]
+    runner = deliver("https://hooks.example.org:8443/notify?job=1")
+
+    assert runner.webhooks == {"sent": 1, "failed": 0}
+    request, = sent
+    assert request.url.host == PUBLIC
+    assert request.url.port == 8443
+    assert request.url.raw_path == b"/notify?job=1"
+    assert request.headers["Host"] == "hooks.example.org:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.org"
+    assert b'"job_id":"job-1"' in request.content
+
+
+def test_delivery_checks_the_host_again(dns, http):
+    # Public when the job was submitted, internal by the time it finished
+    sent, _ = http
+    dns["hooks.example.org"] = ["169.254.169.254"]
+    runner = deliver("https://hooks.example.org/notify")
+
+    assert sent == []
+    assert runner.webhooks == {"sent": 0, "failed": 1}
+
+
+def test_redirects_are_not_followed(dns, http):
+    sent, responses = http
+    dns["hooks.example.org"] = [PUBLIC]
+    responses.append(httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data"}))
+    runner = deliver("https://hooks.example.org/notify")
+
+    assert len(sent) == 1
+    assert runner.webhooks == {"sent": 0, "failed": 1}
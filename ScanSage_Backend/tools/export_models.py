@@ -0,0 +1,39 @@
+"""
+Export the organ classifiers to faster-loading artifacts.
+
+    python -m tools.export_models --format saved_model
+    python -m tools.export_models --format tflite --organs Brain Lung
+
+Every version of the selected organs in the model manifest is exported.
+SavedModels are written under SAVED_MODEL_DIR and picked up with
+INFERENCE_BACKEND=saved_model. TFLite files are written next to the .h5 models.
+"""
+import argparse
+import os
+
+import tensorflow as tf
+
+from app.config import SAVED_MODEL_DIR
+from app.services.inference_engine import export_saved_model, export_tflite, saved_model_path
+from app.services.model_manifest import model_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=["saved_model", "tflite"], default="saved_model")
+    parser.add_argument("--organs", nargs="+", default=list(model_manifest.routes))
+    args = parser.parse_args()
+
+    for spec in model_manifest.models.values():
+        if spec.organ not in args.organs:
+            continue
+        model = tf.keras.models.load_model(spec.path)
+        if args.format == "saved_model":
+            output = export_saved_model(model, spec.input_size, saved_model_path(SAVED_MODEL_DIR, spec.path))
+        else:
+            output = export_tflite(model, os.path.splitext(spec.path)[0] + ".tflite")
+        print(f"{spec.key}: {output}")
+
+
+if __name__ == "__main__":
+    main()
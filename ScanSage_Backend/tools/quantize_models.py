@@ -0,0 +1,115 @@
+"""
+Build reduced-precision TFLite variants of the organ classifiers and gate
+them on top-1 agreement with the float models.
+
+    python -m tools.quantize_models --images eval_scans --precisions int8 float16
+    python -m tools.quantize_models --images eval_scans --organs Brain --evaluate-only
+
+Every version of the selected organs in the model manifest is converted.
+Images come from --images/<Organ> when that directory exists, else from
+--images itself; any format the API accepts. int8 is calibrated on
+--calibration (default: the evaluation images; a separate set gives an
+honest agreement figure). Each variant is written under QUANTIZED_MODEL_DIR
+with an evaluation report next to it; the API serves a variant selected in
+MODEL_PRECISION or the model manifest only if that report passes
+QUANTIZATION_MIN_AGREEMENT and QUANTIZATION_MIN_IMAGES. Exits non-zero when
+any variant fails the gate.
+"""
+import argparse
+import json
+import os
+import sys
+
+from app.config import QUANTIZED_MODEL_DIR, QUANTIZATION_MIN_AGREEMENT, QUANTIZATION_MIN_IMAGES, TFLITE_THREADS
+from app.services.inference_engine import TFLiteEngine, export_tflite, load_engine
+from app.services.model_manifest import model_manifest
+from app.services.quantization import PRECISIONS, evaluate, variant_path, write_report
+from app.utils.preprocessing import decode_image
+
+# Images per forward pass during evaluation
+EVAL_BATCH = 16
+# Samples used to calibrate int8 activations
+CALIBRATION_SAMPLES = 200
+
+
+def image_files(root: str, organ_type: str):
+    directory = os.path.join(root, organ_type) if os.path.isdir(os.path.join(root, organ_type)) else root
+    for dirpath, _, filenames in sorted(os.walk(directory)):
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def readable_images(paths):
+    """(path, decoded image) for every file the API could read, one at a time"""
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                yield path, decode_image(f.read())
+        except (OSError, ValueError):
+            continue
+
+
+def batches(paths, model):
+    """(names, float32 batch) of EVAL_BATCH images, preprocessed as the API does for `model`"""
+    chunk = []
+    for item in readable_images(paths):
+        chunk.append(item)
+        if len(chunk) == EVAL_BATCH:
+            yield [name for name, _ in chunk], model.preprocess([image for _, image in chunk])
+            chunk = []
+    if chunk:
+        yield [name for name, _ in chunk], model.preprocess([image for _, image in chunk])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="evaluation images (optionally one subdirectory per organ)")
+    parser.add_argument("--calibration", help="int8 calibration images; defaults to --images")
+    parser.add_argument("--organs", nargs="+", default=list(model_manifest.routes))
+    parser.add_argument("--precisions", nargs="+", choices=[p for p in PRECISIONS if p != "float32"],
+                        default=["float16", "dynamic_int8", "int8"])
+    parser.add_argument("--output", default=QUANTIZED_MODEL_DIR)
+    parser.add_argument("--min-agreement", type=float, default=QUANTIZATION_MIN_AGREEMENT)
+    parser.add_argument("--min-images", type=int, default=QUANTIZATION_MIN_IMAGES)
+    parser.add_argument("--evaluate-only", action="store_true", help="re-evaluate existing variants")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    os.makedirs(args.output, exist_ok=True)
+    failed = []
+    for spec in model_manifest.models.values():
+        if spec.organ not in args.organs:
+            continue
+        images = list(image_files(args.images, spec.organ))
+        calibration = list(image_files(args.calibration or args.images, spec.organ))
+
+        def representative_data():
+            for _, image in zip(range(CALIBRATION_SAMPLES), readable_images(calibration)):
+                yield [spec.preprocess([image[1]])]
+
+        # The float engine the API serves without a variant
+        reference = load_engine(spec.path, spec.input_size, backend="graph")
+        model = None if args.evaluate_only else tf.keras.models.load_model(spec.path)
+        for precision in args.precisions:
+            variant = variant_path(spec.path, precision, args.output)
+            if model is not None:
+                export_tflite(model, variant, precision, representative_data)
+            candidate = TFLiteEngine(variant, spec.input_size, precision, TFLITE_THREADS)
+            evaluation = evaluate(reference, candidate, batches(images, spec), spec.labels)
+            if not evaluation["images"]:
+                sys.exit(f"No readable images for {spec.organ} under {args.images}")
+            report = write_report(spec.path, variant, precision, evaluation, args.min_agreement, args.min_images)
+            summary = {key: report[key] for key in ("images", "agreement", "max_probability_diff",
+                                                    "reference_ms_per_image", "variant_ms_per_image", "passed")}
+            print(f"{spec.key} {precision}: {json.dumps(summary)}")
+            if not report["passed"]:
+                failed.append(f"{spec.key}={precision}")
+
+    if failed:
+        print(f"Below the gate, not served: {', '.join(failed)}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()